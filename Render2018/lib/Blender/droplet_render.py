@@ -2,6 +2,8 @@
 import bpy
 import os
 import sys
+import json
+import shutil
 
 # Determine current Blender directory and main render directory (one level up)
 directory_blender = os.path.dirname(bpy.data.filepath) 
@@ -10,12 +12,16 @@ directory_blender = os.path.dirname(bpy.data.filepath)
 sys.path.append("/" + directory_blender.strip("Blender") + "/")
 
 # Import external scripts
-from dircheck import get_output_filepath
+from dircheck import get_output_filepath, get_view_dirs
 from Blender.fog_cube import * 
-from Blender.split_half import cut_mesh
-from Blender.geometry_importer import import_droplet
+from Blender.geometry_importer import import_droplet, import_droplet_archive, replace_geometry, purge_orphans
+from mesh_archive import mesh_archive
 import load_config
-from Blender.scene_config import configure_scene
+from Blender.scene_config import configure_scene, configure_camera
+from render_space import parse_views
+from pipeline_render import FRAME_DONE_MARKER
+from create_jobscripts import get_shard_frames
+from stage_timer import stage, get_rss
 
 # Get input arguments
 argv = os.sys.argv
@@ -40,28 +46,88 @@ configure_scene(render_scale=render_scale, view_fraction=blender_config["view_fr
                 resolution_percentage=float(blender_config["resolution_percentage"]), fog_enabled=fog_enabled,
                 bg_color1=bg_color_1, bg_color2=bg_color_2) # View fraction: amount of domain to be visible - 1 is entirely within the render frame, 2 is zoomed out x2, etc.
 
-# Import droplet geometry and render each timestep
-for frame_n in range(num_frames):
+# Camera views to render each frame from, each into its own image directory: the views of a multi-view render (see
+# render_space.parse_views), or the single view configured above. The geometry and fog of a frame are loaded once for
+# all views.
+views = parse_views(blender_config.get("views", "")) or [(blender_config["camera_azimuth_angle"],
+                                                          blender_config["camera_elevation_angle"],
+                                                          blender_config["view_fraction"])]
+view_dirs = get_view_dirs(blender_config["image_output_dir_spec"], len(views))
+
+# Determine frames to render. In pipeline mode, frames are read from stdin as soon as they have been converted. In a
+# multi-job render, the shard of frames to render is given by the arguments after the config file.
+pipeline_enabled = blender_config.get("pipeline_enabled", False)
+if pipeline_enabled:
+    frames = (int(line) for line in sys.stdin)
+elif len(argv) >= 4:
+    frames = get_shard_frames(tres=num_frames, shard=int(argv[1]), num_shards=int(argv[2]), shard_mode=argv[3])
+else:
+    frames = range(num_frames)
+
+# Geometry is read from a mesh archive if the converters wrote one, otherwise from one .ply file per frame
+archive = None
+if blender_config.get("mesh_archive_path", ""):
+    archive = mesh_archive(blender_config["mesh_archive_path"])
+
+# Frames that reuse the geometry of an earlier frame (see convert_data.get_static_frames). Without fog, which changes on
+# every frame, their images are copies of the earlier frame's image.
+static_frames = {}
+if blender_config.get("static_frames_path", "") and not fog_enabled:
+    with open(blender_config["static_frames_path"], "r") as static_frames_file:
+        static_frames = {int(tstep): source_tstep for tstep, source_tstep in json.load(static_frames_file)["frames"].items()}
+
+# Import droplet geometry and render each timestep. The geometry of each frame is swapped into one droplet object, and
+# datablocks left over from earlier frames are freed, so that memory stays constant over long sequences.
+ob = None
+for frame_n in frames:
+
+    # Copy the images of the earlier frame if they have already been rendered (in a multi-job render, they may be
+    # rendered by another job, in which case this frame is rendered normally)
+    source_frame_n = static_frames.get(frame_n, frame_n)
+    source_image_paths = [get_output_filepath(view_dir, source_frame_n, ".png") for view_dir in view_dirs]
+    if source_frame_n != frame_n and all(os.path.isfile(source_image_path) for source_image_path in source_image_paths):
+        for view_dir, source_image_path in zip(view_dirs, source_image_paths):
+            image_path = get_output_filepath(view_dir, frame_n, ".png")
+            shutil.copyfile(source_image_path, image_path)
+            print("Copied image of static frame: " + image_path)
+        if pipeline_enabled:
+            print(FRAME_DONE_MARKER + " " + str(frame_n), flush=True)
+        continue
 
     # Directory/filename of timestep-specific droplet geometry .ply file
     ply_path = get_output_filepath(blender_config["ply_input_dir"], frame_n, ".ply")
     
-    # Import and select geometry
-    ob = import_droplet(ply_path=ply_path, object_name="ply_frame_" + str(frame_n), dim=domain_dims, scale=render_scale, material_name=interface_material_name)
-    ob.select = True
-
-    # Split geometry in half if enabled
-    if blender_config["interface_half_enabled"]:
-        cut_mesh()
+    # Import geometry and swap it into the droplet object
+    with stage("blender_import", frame_n):
+        if archive is not None:
+            new_ob = import_droplet_archive(archive=archive, tstep=frame_n, object_name="droplet", dim=domain_dims, scale=render_scale, material_name=interface_material_name)
+        else:
+            new_ob = import_droplet(ply_path=ply_path, object_name="droplet", dim=domain_dims, scale=render_scale, material_name=interface_material_name)
+        ob = replace_geometry(ob, new_ob)
 
     # Apply 3D fog texture (.bvox voxel file) for this timestep if enabled
     if fog_enabled:
-        update_fog_cube_texture(get_output_filepath(blender_config["bvox_input_dir"], frame_n, ".bvox"))
+        with stage("blender_fog_texture", frame_n):
+            update_fog_cube_texture(get_output_filepath(blender_config["bvox_input_dir"], frame_n, ".bvox"))
+
+    # Render and save frame image from each view
+    for (camera_azimuth_angle, camera_elevation_angle, view_fraction), view_dir in zip(views, view_dirs):
+        configure_camera(render_scale=render_scale, view_fraction=view_fraction, camera_distance=15,
+                         camera_azimuth_angle=camera_azimuth_angle, camera_elevation_angle=camera_elevation_angle)
+        bpy.data.scenes["Scene"].render.filepath = get_output_filepath(view_dir, frame_n, ".png")
+        with stage("blender_render", frame_n):
+            bpy.ops.render.render(write_still=True)
+
+    # Free the datablocks no longer used (previous meshes, reloaded images), and log the memory in use
+    purge_orphans()
+    rss = get_rss()
+    if rss is not None:
+        print("Resident memory after frame " + str(frame_n) + ": " + str(round(rss/2**20, 1)) + " MB", flush=True)
 
-    # Render and save frame image
-    bpy.data.scenes["Scene"].render.filepath = get_output_filepath(blender_config["image_output_dir_spec"], frame_n, ".png")
-    bpy.ops.render.render(write_still=True)
+    # Report rendered frame to the pipeline
+    if pipeline_enabled:
+        print(FRAME_DONE_MARKER + " " + str(frame_n), flush=True)
 
-    # Delete object
-    bpy.ops.object.delete()
 
+if archive is not None:
+    archive.close()
@@ -3,6 +3,8 @@ import os.path
 from Blender.mesh_edit import *
 from Blender.transform_mesh import center_databox
 import mathutils
+import numpy as np
+from render_space import grid_to_blender
 
 def import_droplet(ply_path, object_name, dim, scale, material_name):
     """
@@ -59,6 +61,93 @@ def import_droplet(ply_path, object_name, dim, scale, material_name):
 
     return ob
 
+def import_droplet_archive(archive, tstep, object_name, dim, scale, material_name):
+    """
+    Creates an object from the droplet interface geometry of one timestep in a mesh archive (see mesh_archive). The
+    geometry is centered and scaled the same way as import_droplet, but directly from arrays instead of through the .ply
+    importer and edit mode.
+    :param archive: mesh_archive to read the geometry from
+    :param tstep: Timestep of the geometry
+    :param object_name: Name to give to the droplet object in Blender
+    :param dim: (x,y,z) dimensions of the droplet domain
+    :param scale: Scale factor to apply to imported geometry
+    :param material_name: Name of material to apply to geometry
+    :return: Object class of the imported geometry
+    """
+
+    # Create mesh from the vertices (moved to where center_databox puts them) and triangles
+    verts, tris, vcolors = archive.read(tstep, load_colors=True)
+    mesh = bpy.data.meshes.new(object_name)
+    mesh.from_pydata(grid_to_blender(verts, dim, scale).tolist(), [], tris.tolist())
+    mesh.update()
+
+    # Vertex colors are stored per face corner in Blender, in a layer with the same name as the .ply importer's
+    if vcolors is not None:
+        color_layer = mesh.vertex_colors.new(name="Col")
+        loop_verts = np.zeros(len(mesh.loops), dtype=np.int64)
+        mesh.loops.foreach_get("vertex_index", loop_verts)
+        color_layer.data.foreach_set("color", (vcolors[loop_verts]/255).ravel())
+
+    # Create object, and make it the selected, active object
+    ob = bpy.data.objects.new(object_name, mesh)
+    bpy.context.scene.objects.link(ob)
+    bpy.context.scene.objects.active = ob
+    ob.select = True
+
+    # Remove doubled vertices (geometry that was not welded on export, such as lambda2 contours)
+    remove_doubles()
+
+    # Assign interface material
+    mesh.materials.append(bpy.data.materials.get(material_name))
+
+    # Enable smooth shading on current mesh object
+    bpy.ops.object.shade_smooth()
+
+    return ob
+
+def replace_geometry(ob, new_ob):
+    """
+    Moves the mesh of a just-imported object into an existing object, and removes the imported object and the previous
+    mesh of the existing object. Importing each frame into a new object leaves the meshes of all earlier frames in
+    bpy.data (deleting an object does not free its mesh), so that memory grows over a sequence; reusing one object
+    keeps one mesh in memory.
+    :param ob: Object to reuse, or None if there is none yet
+    :param new_ob: Just-imported object
+    :return: Object holding the new geometry (new_ob itself if there was no object to reuse)
+    """
+    if ob is None:
+        return new_ob
+
+    # Swap the new mesh into the object, which keeps its name, and remove the imported object
+    mesh = new_ob.data
+    bpy.data.objects.remove(new_ob, do_unlink=True)
+    old_mesh = ob.data
+    ob.data = mesh
+    if old_mesh.users == 0:
+        bpy.data.meshes.remove(old_mesh)
+
+    bpy.context.scene.objects.active = ob
+    ob.select = True
+    return ob
+
+def purge_orphans():
+    """
+    Frees the mesh and image datablocks that are no longer used by anything (e.g. left behind by deleted objects or
+    reloaded textures), which Blender would otherwise keep until the file is closed. Materials and textures are kept,
+    since the appended project materials are not used until geometry is imported.
+    :return: Number of datablocks freed
+    """
+    num_freed = 0
+    for mesh in list(bpy.data.meshes):
+        if mesh.users == 0:
+            bpy.data.meshes.remove(mesh)
+            num_freed += 1
+    for image in list(bpy.data.images):
+        # Render results have no users but are needed to save renders
+        if image.users == 0 and image.type == "IMAGE":
+            bpy.data.images.remove(image)
+            num_freed += 1
+    return num_freed
 
 def import_ply_geometry(ply_path, object_name, translation, rotation, scale, material_name):
     """
@@ -38,8 +38,6 @@ def configure_scene(render_scale, view_fraction, bg_image_filepath, camera_dista
                           directory=directory_cwd + "/Blender/material.blend/Material/")
         # Apply background image filepath
         bpy.data.images["Backdrop.002"].filepath = bg_image_filepath
-        # Rotate bg object such that center of texture is always behind geometry
-        bpy.data.objects["Backdrop"].rotation_euler[2] = camera_azimuth_angle * np.pi / 180
 
     # Add all project materials to Blender workspace
     material_names = ["heatmapMaterial", "WaterMaterial5", "VoxelMaterialW2", "BodyMat"]
@@ -49,6 +47,24 @@ def configure_scene(render_scale, view_fraction, bg_image_filepath, camera_dista
     # Set resolution percentage of output images
     bpy.data.scenes["Scene"].render.resolution_percentage = resolution_percentage
 
+    # Set camera position, orientation and field of view
+    configure_camera(render_scale, view_fraction, camera_distance, camera_azimuth_angle, camera_elevation_angle)
+
+    # If fog enabled, create the cube object necessary to render voxel fog
+    if fog_enabled:
+        fog_cube.spawn_fog_cube(render_scale/2)
+
+def configure_camera(render_scale, view_fraction, camera_distance=15, camera_azimuth_angle=0, camera_elevation_angle=0):
+    """
+    Sets the camera position, orientation and field of view of a configured scene (see configure_scene). Can be called
+    again to render the same scene from another view.
+    :param render_scale: Amount by which all objects are scaled, used to determine view frame width of camera
+    :param view_fraction: Portion of imported objects/data to show, usually more than 1 to render entire object with some background area
+    :param camera_distance: Distance from which the camera views the imported objects (not zoom)
+    :param camera_azimuth_angle: Azimuth angle from which the camera points onto the object (positive is counterclockwise)
+    :param camera_elevation_angle: Elevation angle from which the camera points onto the object (upward is positive)
+    """
+
     # Set camera distance
     bpy.data.objects["MainCameraObject"].location[0] = camera_distance
 
@@ -59,7 +75,7 @@ def configure_scene(render_scale, view_fraction, bg_image_filepath, camera_dista
     bpy.data.objects["Empty"].rotation_euler[1] = -camera_elevation_angle*np.pi/180
     bpy.data.objects["Empty"].rotation_euler[2] = camera_azimuth_angle * np.pi / 180
 
-    # If fog enabled, create the cube object necessary to render voxel fog
-    if fog_enabled:
-        fog_cube.spawn_fog_cube(render_scale/2)
+    # Rotate bg object (if there is a background image) such that center of texture is always behind geometry
+    if "Backdrop" in bpy.data.objects:
+        bpy.data.objects["Backdrop"].rotation_euler[2] = camera_azimuth_angle * np.pi / 180
 
@@ -15,6 +15,7 @@ from Blender.fog_cube import *
 from Blender.geometry_importer import import_ply_geometry
 import load_config 
 from Blender.scene_config import configure_scene
+from stage_timer import stage
 
 # Get input arguments
 argv = os.sys.argv
@@ -56,5 +57,6 @@ for stream_n in range(num_streamlines):
 
 # Render and save frame image
 bpy.data.scenes["Scene"].render.filepath = blender_config["image_output_dir_spec"] + "frame_" + str(tstep) + ".png"
-bpy.ops.render.render(write_still=True)
+with stage("blender_render", tstep):
+    bpy.ops.render.render(write_still=True)
 
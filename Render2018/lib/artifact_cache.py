@@ -0,0 +1,168 @@
+import os
+import json
+import shutil
+import hashlib
+import contextlib
+from shared_files import append_jsonl
+
+# Version of the code that produces cached artifacts. Increment whenever a change to the converters alters their output,
+# so that artifacts produced by older code are regenerated.
+CODE_VERSION = 1
+
+# Absolute path to output directory -> artifact_cache of the directory, shared by all the conversions of a process (see
+# get_cache)
+caches = {}
+
+class artifact_cache:
+    """
+    Keeps track of the artifacts (.ply, .bvox, ... files) that have been exported to an output directory. Each artifact
+    is recorded in a manifest together with a key, which is a hash of everything the artifact depends on: the identity of
+    the input file (path, size and modification time), the timestep, the name of the conversion stage, the stage
+    parameters and the code version. An artifact is only considered done if its recorded key matches, so changed
+    settings or input data cause it to be regenerated, and files left behind by killed jobs are never recorded.
+    """
+    def __init__(self, cache_dir, manifest_name="manifest.jsonl"):
+        """
+        Class initializer. Loads the manifest of the directory if it exists.
+        :param cache_dir: Output directory whose artifacts are tracked
+        :param manifest_name: Filename of the manifest within the output directory
+        """
+        self.cache_dir = cache_dir
+        self.manifest_path = os.path.join(cache_dir, manifest_name)
+
+        # Artifact name -> key of the artifact as it exists on disk
+        self.entries = {}
+
+        # Identities of input files, so that each input file is only stat'ed once
+        self.input_ids = {}
+
+        # Length of the manifest that has been loaded
+        self.manifest_size = 0
+        self.load()
+
+    def load(self):
+        """
+        Loads the lines appended to the manifest since it was last loaded, e.g. by other processes converting the same
+        output directory. The manifest is append-only: later lines override earlier ones. A partially written last line
+        (from a job that is writing it, or was killed while writing it) is left for the next load.
+        """
+        manifest_size = os.path.getsize(self.manifest_path) if os.path.isfile(self.manifest_path) else 0
+        if manifest_size < self.manifest_size:
+            # The manifest has been removed or started over, e.g. when the output directory was cleared
+            self.entries = {}
+            self.manifest_size = 0
+        if manifest_size == self.manifest_size:
+            return
+        with open(self.manifest_path, "rb") as manifest:
+            manifest.seek(self.manifest_size)
+            for line in manifest:
+                if not line.endswith(b"\n"):
+                    break
+                self.manifest_size += len(line)
+                try:
+                    entry = json.loads(line.decode())
+                except ValueError:
+                    continue
+                self.entries[entry["name"]] = entry["key"]
+
+    def get_name(self, artifact_path):
+        """
+        :param artifact_path: Path to an artifact
+        :return: Name under which the artifact is recorded in the manifest (path relative to the output directory)
+        """
+        return os.path.relpath(artifact_path, self.cache_dir)
+
+    def get_input_identity(self, input_path):
+        """
+        :param input_path: Path to an input file
+        :return: Absolute path, size and modification time of the file
+        """
+        if input_path not in self.input_ids:
+            stat = os.stat(input_path)
+            self.input_ids[input_path] = [os.path.abspath(input_path), stat.st_size, stat.st_mtime_ns]
+        return self.input_ids[input_path]
+
+    def get_key(self, input_path, tstep, stage, params=None):
+        """
+        Determines the key of an artifact from everything it depends on.
+        :param input_path: Path to the file the artifact is converted from, or None if the artifact is converted from
+        another artifact whose key is included in params
+        :param tstep: Timestep of the artifact
+        :param stage: Name of the conversion stage, e.g. "interface_ply"
+        :param params: Dictionary of stage parameters (must be JSON serializable)
+        :return: Hex digest identifying the artifact contents
+        """
+        identity = {"input": self.get_input_identity(input_path) if input_path is not None else None, "tstep": tstep, "stage": stage,
+                    "params": params or {}, "code_version": CODE_VERSION}
+        return hashlib.sha1(json.dumps(identity, sort_keys=True).encode()).hexdigest()
+
+    def is_done(self, artifact_path, key):
+        """
+        Checks whether an artifact has already been exported with the same key. A lookup in the loaded manifest; only if
+        the artifact is not found there are the lines other processes have appended to the manifest since loaded.
+        :param artifact_path: Path to the artifact
+        :param key: Key of the artifact (see get_key)
+        :return: True if the artifact is up to date
+        """
+        name = self.get_name(artifact_path)
+        if self.entries.get(name) != key:
+            self.load()
+        return self.entries.get(name) == key
+
+    @contextlib.contextmanager
+    def write(self, artifact_path, key):
+        """
+        Context manager for exporting an artifact atomically. Yields a temporary path to write to; when the block
+        completes, the temporary file is renamed to the artifact path and the artifact is recorded in the manifest. If
+        the block fails, the temporary file is removed and nothing is recorded.
+        :param artifact_path: Path to the artifact
+        :param key: Key of the artifact (see get_key)
+        """
+        tmp_path = artifact_path + ".tmp" + str(os.getpid())
+        try:
+            yield tmp_path
+            os.replace(tmp_path, artifact_path)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+            raise
+        self.record(artifact_path, key)
+
+    def record(self, artifact_path, key):
+        """
+        Records an artifact that exists on disk in the manifest.
+        :param artifact_path: Path to the artifact
+        :param key: Key of the artifact
+        """
+        name = self.get_name(artifact_path)
+        self.entries[name] = key
+
+        append_jsonl(self.manifest_path, {"name": name, "key": key})
+
+    def link(self, source_path, artifact_path, key):
+        """
+        Exports an artifact as a hard link to another artifact with the same contents (a copy if the filesystem does not
+        support hard links), unless it is already up to date.
+        :param source_path: Path to the existing artifact to reuse
+        :param artifact_path: Path to the artifact
+        :param key: Key of the artifact (see get_key)
+        """
+        if self.is_done(artifact_path, key):
+            return
+        with self.write(artifact_path, key) as tmp_path:
+            try:
+                os.link(source_path, tmp_path)
+            except OSError:
+                shutil.copyfile(source_path, tmp_path)
+
+def get_cache(cache_dir):
+    """
+    Gets the artifact_cache of an output directory, created the first time it is requested and then shared by all the
+    conversions of the process, so that the manifest is only read once rather than on every timestep.
+    :param cache_dir: Output directory whose artifacts are tracked
+    :return: artifact_cache of the directory
+    """
+    cache_path = os.path.abspath(cache_dir)
+    if cache_path not in caches:
+        caches[cache_path] = artifact_cache(cache_dir)
+    return caches[cache_path]
@@ -0,0 +1,253 @@
+import os
+import sys
+import json
+import time
+import socket
+import argparse
+import tempfile
+import numpy as np
+import scipy.interpolate as interpolate
+import converters
+import streamline_creator
+import streamline_creator_noncartesian
+import streamline_geometry
+import cgns_load_data
+import h5dns_load_data
+import synthetic_data
+import mesh_decimate
+import mesh_archive
+import cart_resampler
+import extract_isosurf_mesh
+import vortex_fields
+# Benchmark suite: times the converters and streamline functions on synthetic data (see synthetic_data) across several
+# grid sizes, and saves the results so that later runs can be compared against them to catch performance regressions.
+# Example:
+#   python benchmark.py --sizes 32,64,128 --output before.json
+#   python benchmark.py --sizes 32,64,128 --output after.json --compare before.json
+
+def get_synthetic_data(work_dir, size, tres=2):
+    """
+    Gets the paths to synthetic data files of a given size, generating them if they do not exist yet.
+    :param work_dir: Directory in which synthetic data files are kept
+    :param size: Grid size: the h5dns domain is size^3, the cgns grid is (size, size/4, size/2), with at least 40 points
+    along i since streamline_creator_noncartesian.get_max_min_vels samples 40 layers of the last array axis
+    :param tres: Number of timesteps in each file
+    :return: Dictionary with paths to the "h5dns" and "cgns" files
+    """
+    h5dns_path = os.path.join(work_dir, "synthetic_" + str(size) + ".h5dns")
+    cgns_path = os.path.join(work_dir, "synthetic_" + str(size) + ".cgns")
+    if not os.path.isfile(h5dns_path):
+        synthetic_data.write_synthetic_h5dns(h5dns_path, res=(size, size, size), tres=tres)
+    if not os.path.isfile(cgns_path):
+        synthetic_data.write_synthetic_cgns(cgns_path, res=(max(size, 40), max(size//4, 4), max(size//2, 4)), tres=tres)
+    return {"h5dns": h5dns_path, "cgns": cgns_path}
+
+# Each benchmark takes the paths to the synthetic data and a scratch directory, does any setup that should not be timed,
+# and returns the function to time.
+
+def bench_convvof2geo(data, scratch_dir):
+    return lambda: converters.convvof2geo(data["h5dns"], 0)
+
+def bench_smooth_geo(data, scratch_dir):
+    verts, tris = converters.convvof2geo(data["h5dns"], 0)
+    return lambda: converters.smooth_geo(verts, tris)
+
+def bench_decimate_geo(data, scratch_dir):
+    verts, tris = converters.convvof2geo(data["h5dns"], 0)
+    return lambda: mesh_decimate.decimate_geo(verts, tris, max_tris=len(tris)//4)
+
+def bench_encode_record(data, scratch_dir):
+    verts, tris = converters.convvof2geo(data["h5dns"], 0)
+    vcolors = np.random.default_rng(0).integers(0, 256, size=(len(verts), 3))
+
+    # Check the round trip of each encoding before timing it: triangles and colors must be exact, and vertices within
+    # one quantization step (up to float32 rounding)
+    for encoding in mesh_archive.ENCODINGS:
+        decoded_verts, decoded_tris, decoded_vcolors = mesh_archive.decode_record(
+            *mesh_archive.encode_record(verts, tris, vcolors=vcolors, encoding=encoding))
+        step = np.ptp(verts, axis=0)/mesh_archive.QUANTIZED_MAX if encoding == "quantized" else 0
+        if not np.array_equal(decoded_tris, tris) or not np.array_equal(decoded_vcolors, vcolors):
+            raise AssertionError("Mesh archive " + encoding + " record does not restore the triangles and colors")
+        if np.any(np.abs(decoded_verts - verts) > step + 1E-6*np.max(np.abs(verts))):
+            raise AssertionError("Mesh archive " + encoding + " record does not restore the vertices within a step")
+
+    return lambda: mesh_archive.decode_record(*mesh_archive.encode_record(verts, tris, encoding="quantized"))
+
+def bench_convgeo2ply(data, scratch_dir):
+    verts, tris = converters.convvof2geo(data["h5dns"], 0)
+    return lambda: converters.convgeo2ply(verts, tris, os.path.join(scratch_dir, "bench.ply"))
+
+def bench_convyv2bvox(data, scratch_dir):
+    return lambda: converters.convyv2bvox(data["h5dns"], os.path.join(scratch_dir, "bench.bvox"), 0, 0.01, 0.3)
+
+def bench_convvert2color(data, scratch_dir):
+    verts, tris = converters.convvof2geo(data["h5dns"], 0)
+    return lambda: converters.convvert2color(data["h5dns"], verts, 0.6, 1.0, 0)
+
+def bench_lambda2_extract(data, scratch_dir):
+    return lambda: converters.lambda2_extract(data["h5dns"], 0)
+
+def bench_compute_vortex_fields(data, scratch_dir):
+    data_field = h5dns_load_data.field4Dlow(data["h5dns"])
+    velocity = [data_field.obtain3Dtimestep(0, component) for component in vortex_fields.VELOCITY_FIELDS]
+    data_field.close()
+    return lambda: vortex_fields.compute_vortex_fields(*velocity, vortex_fields.VORTEX_FIELDS)
+
+def bench_find_max_vapor(data, scratch_dir):
+    return lambda: converters.find_max_vapor(data["h5dns"])
+
+def bench_get_temp_prctiles(data, scratch_dir):
+    return lambda: converters.get_temp_prctiles(data["h5dns"], os.path.join(scratch_dir, "temp_prctiles.txt"))
+
+def bench_find_case_stats(data, scratch_dir):
+    return lambda: converters.find_case_stats(data["h5dns"])
+
+def bench_gen_streamline(data, scratch_dir):
+    size = h5dns_load_data.get_important_data(data["h5dns"])["xres"]
+    return lambda: streamline_creator.gen_streamline(data["h5dns"], 0, (size/4, size/2, size/2), 2)
+
+def bench_cgns_interpolator(data, scratch_dir):
+    data_loader = cgns_load_data.cgns_data(data["cgns"])
+    pts = data_loader.obtain_points()
+    vels = data_loader.obtain_vel_timestep(0)
+    data_loader.close()
+    return lambda: interpolate.NearestNDInterpolator(pts, vels)
+
+def bench_cart_resampler(data, scratch_dir):
+    data_loader = cgns_load_data.cgns_data(data["cgns"])
+    pts = data_loader.obtain_points()
+    data_loader.close()
+    return lambda: cart_resampler.cart_resampler([0, 30, 0, 11, 0, 11], 1).build(pts)
+
+def bench_extract_isosurf_curvilinear(data, scratch_dir):
+    return lambda: extract_isosurf_mesh.extract_isosurf_curvilinear(data["cgns"], 0, "Pressure", 0.25)
+
+def bench_gen_streamline_nonuni(data, scratch_dir):
+    data_loader = cgns_load_data.cgns_data(data["cgns"])
+    interpolator = interpolate.NearestNDInterpolator(data_loader.obtain_points(), data_loader.obtain_vel_timestep(0))
+    data_loader.close()
+    return lambda: streamline_creator_noncartesian.gen_streamline_nonuni(interpolator, (1.0, 3.0, 3.0), 0.05, 200,
+                                                                          [0, 30, 0, 11, 0, 11])
+
+def bench_create_streamline_geometry(data, scratch_dir):
+    verts_center, vel_mags = streamline_creator.gen_streamline(data["h5dns"], 0, (1, 1, 1), 2)
+    return lambda: streamline_geometry.create_streamline_geometry(verts_center, vel_mags, 8, np.min(vel_mags),
+                                                                  np.max(vel_mags))
+
+def bench_get_max_min_vels(data, scratch_dir):
+    def run():
+        # Percentiles are cached in the output dir, so remove them to time the full calculation
+        prctile_file = os.path.join(scratch_dir, "velocity_prctiles.csv")
+        if os.path.isfile(prctile_file):
+            os.remove(prctile_file)
+        return streamline_creator_noncartesian.get_max_min_vels(data["cgns"], scratch_dir + "/")
+    return run
+
+BENCHMARKS = {"convvof2geo": bench_convvof2geo, "smooth_geo": bench_smooth_geo, "decimate_geo": bench_decimate_geo,
+              "encode_record": bench_encode_record, "convgeo2ply": bench_convgeo2ply,
+              "convyv2bvox": bench_convyv2bvox, "convvert2color": bench_convvert2color,
+              "lambda2_extract": bench_lambda2_extract, "compute_vortex_fields": bench_compute_vortex_fields,
+              "find_max_vapor": bench_find_max_vapor, "find_case_stats": bench_find_case_stats,
+              "get_temp_prctiles": bench_get_temp_prctiles, "gen_streamline": bench_gen_streamline,
+              "cgns_interpolator": bench_cgns_interpolator, "cart_resampler": bench_cart_resampler,
+              "extract_isosurf_curvilinear": bench_extract_isosurf_curvilinear,
+              "gen_streamline_nonuni": bench_gen_streamline_nonuni,
+              "create_streamline_geometry": bench_create_streamline_geometry,
+              "get_max_min_vels": bench_get_max_min_vels}
+
+def time_function(func, repeats):
+    """
+    Times a function over several runs.
+    :param func: Function to time (no arguments)
+    :param repeats: Number of times to run it
+    :return: List of wall times of each run, in seconds
+    """
+    times = []
+    for repeat in range(repeats):
+        start = time.perf_counter()
+        func()
+        times.append(time.perf_counter() - start)
+    return times
+
+def run_benchmarks(work_dir, sizes, names=None, repeats=3):
+    """
+    Runs benchmarks on synthetic data of each size.
+    :param work_dir: Directory in which synthetic data files are kept
+    :param sizes: List of grid sizes
+    :param names: (optional) Names of the benchmarks to run, defaults to all
+    :param repeats: Number of timed runs of each benchmark
+    :return: Dictionary of results: {benchmark name: {size: {"min", "median", "times"}}}
+    """
+    names = names or list(BENCHMARKS.keys())
+    results = {}
+    for size in sizes:
+        data = get_synthetic_data(work_dir, size)
+        for name in names:
+            with tempfile.TemporaryDirectory(dir=work_dir) as scratch_dir:
+                times = time_function(BENCHMARKS[name](data, scratch_dir), repeats)
+            results.setdefault(name, {})[str(size)] = {"min": min(times), "median": float(np.median(times)),
+                                                       "times": times}
+            print("Benchmark %s, size %d: %.4f s" % (name, size, min(times)))
+    return results
+
+def save_results(results, output_path):
+    """
+    Saves benchmark results, together with information on the machine and software they were obtained with.
+    :param results: Benchmark results (see run_benchmarks)
+    :param output_path: Path to .json file to save
+    """
+    meta = {"time": time.strftime("%Y-%m-%d %H:%M:%S"), "host": socket.gethostname(), "python": sys.version.split()[0],
+            "numpy": np.__version__}
+    with open(output_path, "w") as output_file:
+        json.dump({"meta": meta, "results": results}, output_file, indent=1)
+    print("Saved benchmark results: " + output_path)
+
+def compare_results(results, baseline_path, threshold=1.2):
+    """
+    Compares benchmark results to results saved by an earlier run, and prints the speedup of each benchmark.
+    :param results: Benchmark results (see run_benchmarks)
+    :param baseline_path: Path to .json file of earlier results
+    :param threshold: Slowdown factor above which a benchmark is reported as a regression
+    :return: List of (benchmark name, size, slowdown factor) of regressions
+    """
+    with open(baseline_path, "r") as baseline_file:
+        baseline = json.load(baseline_file)["results"]
+
+    regressions = []
+    print("Benchmark                    Size   Baseline (s)    Current (s)   Speedup")
+    for name, size_results in results.items():
+        for size, result in size_results.items():
+            if size not in baseline.get(name, {}):
+                continue
+            baseline_time = baseline[name][size]["min"]
+            slowdown = result["min"]/baseline_time
+            flag = "  REGRESSION" if slowdown > threshold else ""
+            print("%-26s %6s %14.4f %14.4f %9.2fx%s" % (name, size, baseline_time, result["min"], 1/slowdown, flag))
+            if slowdown > threshold:
+                regressions.append((name, size, slowdown))
+    return regressions
+
+if __name__ == "__main__":
+    # Parse input arguments
+    parser = argparse.ArgumentParser(description="Times converters and streamline functions on synthetic data. ")
+    parser.add_argument("--sizes", type=str, default="32,64", help="Comma-separated list of grid sizes. ")
+    parser.add_argument("--only", type=str, default=None, help="Comma-separated list of benchmarks to run (default: all). Available: " + ", ".join(BENCHMARKS.keys()))
+    parser.add_argument("--repeats", type=int, default=3, help="Number of timed runs of each benchmark. ")
+    parser.add_argument("--work-dir", type=str, default=os.path.join(tempfile.gettempdir(), "render_benchmark"), help="Directory in which synthetic data is generated and kept. ")
+    parser.add_argument("--output", type=str, default=None, help="Path to .json file to save results to. ")
+    parser.add_argument("--compare", type=str, default=None, help="Path to .json file of earlier results to compare against. ")
+    parser.add_argument("--threshold", type=float, default=1.2, help="Slowdown factor reported as a regression. ")
+    args = parser.parse_args()
+
+    os.makedirs(args.work_dir, exist_ok=True)
+    sizes = [int(size) for size in args.sizes.split(",")]
+    names = args.only.split(",") if args.only else None
+    results = run_benchmarks(args.work_dir, sizes, names=names, repeats=args.repeats)
+
+    if args.output:
+        save_results(results, args.output)
+
+    # Exit with an error if any benchmark became slower, so that the comparison can be used in scripts
+    if args.compare:
+        if compare_results(results, args.compare, threshold=args.threshold):
+            sys.exit(1)
@@ -1,5 +1,7 @@
 import os
 import configparser
+import subprocess
+from stage_timer import timed
 
 def get_blender_dir():
     """
@@ -12,19 +14,39 @@ def get_blender_dir():
     # Return path
     return os.getcwd() + "/" + dirname_config["DIRECTORIES"]["blenderhome"]
 
-def launch_blender_new(blend_name, python_name, blender_config_filedir):
+@timed()
+def launch_blender_new(blend_name, python_name, blender_config_filedir, script_args=()):
     """
     Launches Blender in terminal given a .blend file and a Blender Python API script. Passes in a config file as an
     input to the Python API script.
     :param blend_name: Blender file to load
     :param python_name: Python file to run in Blender's Python API to perform rendering
     :param blender_config_filedir: Path to the Blender config file that specifies rendering settings and stuff
+    :param script_args: (optional) Additional arguments to pass to the Python API script after the config file
     """
     blender_dir = get_blender_dir()
     blender_kicker = "blender -b " + blender_dir + "/" + blend_name + " -P " + blender_dir + "/" + python_name + " -- " + blender_config_filedir
+    for script_arg in script_args:
+        blender_kicker += " " + str(script_arg)
     print("Running Blender with the following command: " + blender_kicker)
     os.system(blender_kicker)
 
+def launch_blender_pipe(blend_name, python_name, blender_config_filedir):
+    """
+    Launches Blender in the background the same way as launch_blender_new, but without waiting for it to finish. The
+    Blender process is connected through pipes, so the Python API script can be told which frames to render on stdin and
+    report rendered frames on stdout (used by the pipelined render mode).
+    :param blend_name: Blender file to load
+    :param python_name: Python file to run in Blender's Python API to perform rendering
+    :param blender_config_filedir: Path to the Blender config file that specifies rendering settings and stuff
+    :return: Blender process (subprocess.Popen)
+    """
+    blender_dir = get_blender_dir()
+    blender_kicker = ["blender", "-b", blender_dir + "/" + blend_name, "-P", blender_dir + "/" + python_name, "--", blender_config_filedir]
+    print("Running Blender with the following command: " + " ".join(blender_kicker))
+    return subprocess.Popen(blender_kicker, stdin=subprocess.PIPE, stdout=subprocess.PIPE, universal_newlines=True, bufsize=1)
+
+@timed()
 def launch_blender_smooth(output_dir_unsmooth, output_dir_smooth):
     """
     Launches Blender in terminal to perform geometry smoothing on a series of .ply files. Used to perform smoothing on
@@ -2,6 +2,7 @@ import configparser
 import load_config
 import extract_isosurf_mesh
 import streamline_creator_noncartesian
+import convert_data
 import dircheck
 import blender_launcher
 
@@ -115,4 +116,66 @@ def vortexline(case_config_filepath, render_config_filepath):
         load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"tstep": tstep},
                                       append_config=True)
         blender_launcher.launch_blender_new(blender_config_filedir=blender_config_filedir,
-                                            python_name="streamline_body_render.py", blend_name="droplet_render.blend")
\ No newline at end of file
+                                            python_name="streamline_body_render.py", blend_name="droplet_render.blend")
+
+def isosurface(case_config_filepath, render_config_filepath):
+    """
+    Renders an isosurface of a scalar field (e.g. lambda2) for flow around Abhiram's axisymmetric body, given a case
+    config file and rendering config file.
+    :param case_config_filepath: Path to case configuration file, which contains information on the data file to render.
+    :param render_config_filepath: Path to render configuration file, which contains information on how to render the data.
+    """
+
+    # Load config file with all common directory names
+    dirname_config = configparser.ConfigParser()
+    dirname_config.read("dirname.cfg")
+
+    # Get information from config files
+    cconfd = load_config.get_config_params(case_config_filepath)  # Case file
+    rconfd = load_config.get_config_params(render_config_filepath)  # Render file
+
+    # Main output directory
+    case_output = dirname_config["DIRECTORIES"]["RenderOutput"] + cconfd["case_name"] + "/"
+
+    # Isosurface geometry output dir, specific to the field and contour level
+    isosurf_specifier = rconfd["isosurf_field"] + str(rconfd["isosurf_level"]) + "/"
+    ply_output_dir = case_output + dirname_config["DIRECTORIES"]["ply_isosurf"] + isosurf_specifier
+    dircheck.check_make(ply_output_dir)
+
+    # Determine individual frame output dir
+    image_output_dir_spec = dircheck.count_png_dirs(case_output + dirname_config["DIRECTORIES"]["tstep_isosurf"] + isosurf_specifier)
+    dircheck.check_make(image_output_dir_spec)  # Make it if nonexistent
+
+    # Extract geometry of the simulated body
+    extract_isosurf_mesh.extract_geometry_general(data_file=cconfd["h5dns_path"], output_dir=ply_output_dir, nth_coord=5, axis="K", level=1)
+
+    # Extract isosurface geometry on each tstep, on the curvilinear grid or resampled to a Cartesian grid
+    method = rconfd.get("isosurf_method", "curvilinear")
+    cart_grid = {}
+    if method == "cartesian":
+        cart_grid = {"bounds": list(map(float, rconfd["cart_bounds"].split(","))), "spacing": rconfd["cart_spacing"]}
+    convert_data.conv_bodyflow_isosurf_ply(cgns_path=cconfd["h5dns_path"], output_dir=ply_output_dir, tres=cconfd["tres"],
+                                           field_name=rconfd["isosurf_field"], contour_level=rconfd["isosurf_level"],
+                                           method=method, **cart_grid)
+
+    # Write Blender config file
+    blender_config_filedir = case_output + rconfd["render_name"] + "_blender.cfg"
+    load_config.write_config_file(config_filedir=blender_config_filedir,
+                                  config_dict={"image_output_dir_spec": image_output_dir_spec,
+                                               "ply_input_dir": ply_output_dir,
+                                               "interface_material_name": "Lambda2Contour",
+                                               "bg_image_filepath": rconfd["bg_image_filepath"],
+                                               "view_fraction": rconfd["view_fraction"], "render_scale": 10,
+                                               "resolution_percentage": rconfd["resolution_percentage"],
+                                               "domain_res": 30, "tres": cconfd["tres"],
+                                               "interface_half_enabled": False, "fog_enabled": False,
+                                               "camera_azimuth_angle": rconfd["camera_azimuth_angle"],
+                                               "camera_elevation_angle": rconfd["camera_elevation_angle"],
+                                               "bg_color_1": rconfd["bg_color_1"], "bg_color_2": rconfd["bg_color_2"]})
+
+    # Launch Blender to render each timestep
+    for tstep in range(cconfd["tres"]):
+        load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"tstep": tstep},
+                                      append_config=True)
+        blender_launcher.launch_blender_new(blender_config_filedir=blender_config_filedir,
+                                            python_name="isosurf_body_render.py", blend_name="droplet_render.blend")
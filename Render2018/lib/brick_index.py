@@ -0,0 +1,253 @@
+import os
+import sys
+import numpy as np
+import h5py as h5
+from h5dns_load_data import field4Dlow
+from field_store import get_read_path, get_source_identity
+from shared_files import file_lock
+# Index of the minimum and maximum of each field over bricks (blocks of brick_size^3 cells) of every timestep, used to
+# skip the empty space of a case: most of a turbdrops domain is pure gas, where the VOF field is 0 and the vapor field is
+# below the fog threshold. Marching cubes then only runs on the bricks that straddle the interface value, and the fog
+# transform and interface temperature sampling only touch the bricks that contain anything.
+#
+# Each brick spans brick_size + 1 samples along each axis (one layer of overlap with the next brick), so that every
+# marching cubes cell lies entirely within one brick. The index of a field on a timestep is computed the first time it
+# is needed, from the field already loaded by the converter, and stored in a small sidecar file next to the .h5dns file,
+# so that it is shared by all render types and outputs of a case.
+
+# Version of the index format, stored in the index. Indexes of a different version are rebuilt.
+INDEX_VERSION = 1
+
+# Default edge length of bricks, in cells
+BRICK_SIZE = 16
+
+# (Path to .h5dns file, brick size) -> brick_index, shared by all the conversions of a case (see get_brick_index)
+brick_indexes = {}
+
+def get_index_path(h5dns_path):
+    """
+    :param h5dns_path: Path to .h5dns file
+    :return: Path to the brick index of the file (next to the .h5dns file)
+    """
+    return os.path.splitext(h5dns_path)[0] + ".bricks.h5"
+
+def reduce_bricks(values, axis, brick_size, reduce):
+    """
+    Reduces a field over bricks along one axis, including the first sample of the next brick.
+    :param values: Array to reduce
+    :param axis: Axis to reduce along
+    :param brick_size: Edge length of bricks
+    :param reduce: np.minimum or np.maximum
+    :return: Array with one entry per brick along the axis
+    """
+    values = np.moveaxis(values, axis, 0)
+
+    # Repeat the last sample so that the bricks (plus their overlap) fill the axis
+    num_bricks = max(1, -(-(len(values) - 1)//brick_size))
+    num_padding = num_bricks*brick_size + 1 - len(values)
+    if num_padding > 0:
+        values = np.concatenate((values, np.repeat(values[-1:], num_padding, axis=0)))
+
+    blocks = reduce.reduce(values[:-1].reshape((num_bricks, brick_size) + values.shape[1:]), axis=1)
+    return np.moveaxis(reduce(blocks, values[brick_size::brick_size]), 0, axis)
+
+def compute_brick_bounds(field, brick_size=BRICK_SIZE):
+    """
+    Computes the minimum and maximum of a 3D field over each brick, including the overlap with the next brick.
+    :param field: 3D array
+    :param brick_size: Edge length of bricks
+    :return: mins, maxs: 3D arrays of the minimum and maximum of each brick
+    """
+    mins = field
+    maxs = field
+    for axis in range(3):
+        mins = reduce_bricks(mins, axis, brick_size, np.minimum)
+        maxs = reduce_bricks(maxs, axis, brick_size, np.maximum)
+    return mins, maxs
+
+def get_brick_slices(shape, brick, brick_size=BRICK_SIZE, overlap=True):
+    """
+    :param shape: Shape of the field
+    :param brick: Index of the brick along each axis
+    :param brick_size: Edge length of bricks
+    :param overlap: Include the first layer of the next brick (for marching cubes). Without it, bricks partition the
+    field (for operations on each sample).
+    :return: Tuple of slices of the field covered by the brick
+    """
+    slices = []
+    for dim, brick_id in zip(shape, brick):
+        start = brick_id*brick_size
+        end = start + brick_size + 1 if overlap else start + brick_size
+        if (brick_id + 1)*brick_size >= dim - 1:
+            # The last brick extends to the end of the field
+            end = dim
+        slices.append(slice(start, min(end, dim)))
+    return tuple(slices)
+
+class brick_index:
+    """
+    Brick minimum/maximum index of the fields of an .h5dns file, built incrementally.
+    """
+    def __init__(self, h5dns_path, brick_size=BRICK_SIZE):
+        """
+        Class initializer
+        :param h5dns_path: Path to .h5dns file
+        :param brick_size: Edge length of bricks, e.g. 16 or 32
+        """
+        self.h5dns_path = h5dns_path
+        self.brick_size = brick_size
+        self.index_path = get_index_path(h5dns_path)
+
+        # Identity of the file fields are read from (the render-optimized store, if any), which the index records so that
+        # it is rebuilt when the data changes
+        self.source_identity = get_source_identity(get_read_path(h5dns_path))
+
+        # (Timestep, field) -> (mins, maxs) of the bounds already loaded or computed, so that the index file is only
+        # opened once per timestep and field
+        self.bounds = {}
+
+        # Whether the index could not be updated, in which case it is not attempted again (and the warning is only
+        # printed once)
+        self.read_only = False
+
+    def is_valid(self, index):
+        """
+        :param index: Open h5py File of the index
+        :return: True if the index was built from the current data, with the same brick size
+        """
+        return index.attrs.get("INDEX_VERSION") == INDEX_VERSION and \
+               index.attrs.get("BRICK_SIZE") == self.brick_size and \
+               (index.attrs.get("SOURCE_SIZE"), index.attrs.get("SOURCE_MTIME_NS")) == self.source_identity
+
+    def load(self, tstep, field_name):
+        """
+        Loads the brick bounds of a field on a timestep from the index.
+        :param tstep: Timestep
+        :param field_name: Field, e.g. "VOF"
+        :return: mins, maxs (see compute_brick_bounds), or None if they are not in the index
+        """
+        if not os.path.isfile(self.index_path):
+            return None
+        try:
+            # Locked while reading, so that several conversion processes can share the index
+            with file_lock(self.index_path + ".lock"):
+                with h5.File(self.index_path, "r") as index:
+                    name = "FIELD_DATA_%06d/%s" % (tstep, field_name)
+                    if not self.is_valid(index) or name not in index:
+                        return None
+                    return index[name]["min"][()], index[name]["max"][()]
+        except OSError:
+            # Unreadable index, e.g. left behind by a job killed while writing it
+            return None
+
+    def store(self, tstep, field_name, mins, maxs):
+        """
+        Adds the brick bounds of a field on a timestep to the index. The index is started over if it was built from
+        other data. If the index cannot be written (e.g. the data directory is read-only), the bounds are not stored.
+        :param tstep: Timestep
+        :param field_name: Field, e.g. "VOF"
+        :param mins: Minimum of each brick
+        :param maxs: Maximum of each brick
+        """
+        if self.read_only:
+            return
+        try:
+            with file_lock(self.index_path + ".lock", exclusive=True):
+
+                # Start over if the index is unreadable or was built from other data
+                try:
+                    index = h5.File(self.index_path, "a")
+                    if not self.is_valid(index):
+                        index.close()
+                        index = h5.File(self.index_path, "w")
+                except OSError:
+                    index = h5.File(self.index_path, "w")
+
+                with index:
+                    index.attrs["INDEX_VERSION"] = INDEX_VERSION
+                    index.attrs["BRICK_SIZE"] = self.brick_size
+                    index.attrs["SOURCE_SIZE"], index.attrs["SOURCE_MTIME_NS"] = self.source_identity
+                    name = "FIELD_DATA_%06d/%s" % (tstep, field_name)
+                    if name in index:
+                        del index[name]
+                    group = index.create_group(name)
+                    group.create_dataset("min", data=mins)
+                    group.create_dataset("max", data=maxs)
+        except OSError as error:
+            print("Could not update brick index " + self.index_path + ", bounds will not be saved: " + str(error))
+            self.read_only = True
+
+    def get_bounds(self, tstep, field_name, field=None):
+        """
+        Gets the brick bounds of a field on a timestep, computing and storing them if they are not in the index yet.
+        :param tstep: Timestep
+        :param field_name: Field, e.g. "VOF"
+        :param field: (optional) The field, in [i,j,k] order, if already loaded. Otherwise it is read if needed.
+        :return: mins, maxs: 3D arrays of the minimum and maximum of each brick, indexed [i,j,k]
+        """
+        if (tstep, field_name) in self.bounds:
+            return self.bounds[(tstep, field_name)]
+        bounds = self.load(tstep, field_name)
+        if bounds is None:
+            if field is None:
+                data_field = field4Dlow(self.h5dns_path)
+                field = data_field.obtain3Dtimestep(tstep, field_name)
+                data_field.close()
+            bounds = compute_brick_bounds(field, self.brick_size)
+            self.store(tstep, field_name, *bounds)
+        self.bounds[(tstep, field_name)] = bounds
+        return bounds
+
+    def get_bricks(self, tstep, field_name, field=None, lower=None, upper=None):
+        """
+        Finds the bricks of a field that contain values in a range, e.g. the bricks a contour level passes through.
+        :param tstep: Timestep
+        :param field_name: Field, e.g. "VOF"
+        :param field: (optional) The field, in [i,j,k] order, if already loaded
+        :param lower: (optional) Skip bricks whose values are all below this value
+        :param upper: (optional) Skip bricks whose values are all above this value
+        :return: (N,3) array of the indices of the bricks
+        """
+        mins, maxs = self.get_bounds(tstep, field_name, field)
+        active = np.ones(mins.shape, dtype=bool)
+        if lower is not None:
+            active &= maxs >= lower
+        if upper is not None:
+            active &= mins <= upper
+        return np.argwhere(active)
+
+def get_brick_index(h5dns_path, brick_size=BRICK_SIZE):
+    """
+    Gets the brick index of an .h5dns file, created the first time it is requested and then shared by all the
+    conversions of the case, so that the index file is not checked again on every timestep.
+    :param h5dns_path: Path to .h5dns file
+    :param brick_size: Edge length of bricks
+    :return: brick_index of the file
+    """
+    index = brick_indexes.get((h5dns_path, brick_size))
+    if index is None:
+        index = brick_index(h5dns_path, brick_size)
+        brick_indexes[(h5dns_path, brick_size)] = index
+    return index
+
+def build(h5dns_path, fields, brick_size=BRICK_SIZE):
+    """
+    Adds the brick bounds of fields on all timesteps of an .h5dns file to its index, e.g. ahead of a batch of renders.
+    Timesteps that are already indexed are skipped.
+    :param h5dns_path: Path to .h5dns file
+    :param fields: List of fields to index, e.g. ["VOF", "YV"]
+    :param brick_size: Edge length of bricks
+    """
+    index = get_brick_index(h5dns_path, brick_size)
+    data_field = field4Dlow(h5dns_path)
+    for tstep in range(data_field.tres):
+        for field_name in fields:
+            if index.load(tstep, field_name) is None:
+                index.get_bounds(tstep, field_name, data_field.obtain3Dtimestep(tstep, field_name))
+        print("Indexed timestep " + str(tstep))
+    data_field.close()
+    print("Saved brick index: " + index.index_path)
+
+if __name__ == "__main__":
+    # Index the .h5dns file given as first argument, on the fields given as the remaining arguments
+    build(sys.argv[1], sys.argv[2:] or ["VOF", "YV"])
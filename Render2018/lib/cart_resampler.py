@@ -0,0 +1,151 @@
+import numpy as np
+import scipy.sparse
+from scipy.spatial import Delaunay, ConvexHull, cKDTree
+from stage_timer import timed
+# Resampling of fields on the curvilinear grid of a .cgns file to a Cartesian grid, so that isosurfaces of body flow data
+# can be extracted with marching cubes. Interpolating with scipy griddata triangulates every grid point on each call,
+# although the grid is the same on every timestep. Instead, the Delaunay triangulation is built once, the simplex and
+# barycentric weights of every Cartesian point are stored in a sparse (Cartesian points x grid points) matrix, and each
+# field is resampled with a single sparse matrix-vector product. The weights are the same as those of griddata's linear
+# method, so the results match.
+#
+# Structured grids are degenerate point sets for Qhull (many cospherical points), on which Delaunay.find_simplex often
+# falls back to a brute-force search over all simplices. Points are therefore located among the simplices with the
+# nearest centroids first (see find_simplices), and find_simplex is only used for the few points that are left.
+
+class cart_resampler:
+    """
+    Linear resampling from the points of a curvilinear grid to a Cartesian grid.
+    """
+    def __init__(self, bounds, spacing):
+        """
+        Class initializer. Sets up the Cartesian grid; the weights are computed with build or loaded with load.
+        :param bounds: [xmin, xmax, ymin, ymax, zmin, zmax] of the Cartesian grid
+        :param spacing: Approximate distance between Cartesian grid points (rounded so that the grid spans the bounds)
+        """
+        self.bounds = bounds
+        self.spacing = spacing
+
+        # Points along each axis of the Cartesian grid
+        self.ranges = [np.linspace(bounds[2*axis], bounds[2*axis + 1], int(round((bounds[2*axis + 1] - bounds[2*axis])/spacing)) + 1)
+                       for axis in range(3)]
+        self.shape = tuple(len(axis_range) for axis_range in self.ranges)
+
+        # Sparse (Cartesian points x grid points) interpolation matrix, and which Cartesian points lie within the grid
+        self.weights = None
+        self.inside = None
+
+    @timed()
+    def build(self, points, chunk_size=2**16):
+        """
+        Computes the interpolation weights of every Cartesian grid point from the Delaunay triangulation of the grid.
+        :param points: (N,3) array of grid point positions (see cgns_load_data.cgns_data.obtain_points)
+        :param chunk_size: Number of Cartesian points located at once, to bound memory use
+        """
+        print("Triangulating " + str(len(points)) + " grid points...")
+        triangulation = Delaunay(points)
+        centroid_tree = cKDTree(points[triangulation.simplices].mean(axis=1))
+        hull_equations = ConvexHull(points).equations
+
+        # Cartesian points in the order of a (x,y,z)-indexed array
+        cart_points = np.stack(np.meshgrid(*self.ranges, indexing="ij"), axis=-1).reshape(-1, 3)
+
+        rows = []
+        cols = []
+        vals = []
+        for start in range(0, len(cart_points), chunk_size):
+            chunk = cart_points[start:start + chunk_size]
+
+            # Simplex containing each point (-1 if outside the grid)
+            simplices = find_simplices(triangulation, centroid_tree, hull_equations, chunk)
+            point_ids = np.flatnonzero(simplices >= 0)
+            simplices = simplices[point_ids]
+
+            # Barycentric coordinates of each point within its simplex
+            transforms = triangulation.transform[simplices]
+            barycentric = np.einsum("nij,nj->ni", transforms[:,:3], chunk[point_ids] - transforms[:,3])
+            barycentric = np.hstack((barycentric, 1 - barycentric.sum(axis=1, keepdims=True)))
+
+            rows.append(np.repeat(start + point_ids, 4))
+            cols.append(triangulation.simplices[simplices].reshape(-1))
+            vals.append(barycentric.reshape(-1))
+
+        self.weights = scipy.sparse.csr_matrix((np.concatenate(vals), (np.concatenate(rows), np.concatenate(cols))),
+                                               shape=(len(cart_points), len(points)))
+        self.inside = np.diff(self.weights.indptr) > 0
+        print("Built resampling weights: " + str(np.count_nonzero(self.inside)) + " of " + str(len(cart_points)) + " points within the grid")
+
+    def save(self, path):
+        """
+        Saves the interpolation weights to a .npz file.
+        :param path: Path or file object to save to
+        """
+        scipy.sparse.save_npz(path, self.weights)
+
+    def load(self, path):
+        """
+        Loads interpolation weights saved with save. The file must have been built for the same grid and Cartesian grid.
+        :param path: Path to .npz file
+        """
+        self.weights = scipy.sparse.load_npz(path).tocsr()
+        self.inside = np.diff(self.weights.indptr) > 0
+
+    @timed()
+    def resample(self, values, fill_value=np.nan):
+        """
+        Resamples a field from the grid points to the Cartesian grid.
+        :param values: (N,) array of a scalar field, or (N,C) array of a vector field, on the grid points
+        :param fill_value: Value of Cartesian points outside the grid
+        :return: (nx,ny,nz) array of the scalar field, or (nx,ny,nz,C) array of the vector field
+        """
+        resampled = self.weights @ np.asarray(values, dtype=float)
+        resampled[~self.inside] = fill_value
+        return resampled.reshape(self.shape + resampled.shape[1:])
+
+    def grid_to_cart(self, verts):
+        """
+        Converts positions in Cartesian grid index units (e.g. marching cubes vertices) to positions in the coordinate
+        system of the .cgns file.
+        :param verts: Vertices array, in grid index units
+        :return: Vertices array, in .cgns coordinates
+        """
+        verts = np.asarray(verts, dtype=float)
+        return np.stack([np.interp(verts[:,axis], np.arange(self.shape[axis]), self.ranges[axis]) for axis in range(3)], axis=1)
+
+def find_simplices(triangulation, centroid_tree, hull_equations, points, num_candidates=(16, 128), eps=1E-10):
+    """
+    Finds the simplex of a Delaunay triangulation that contains each point, like Delaunay.find_simplex. Each point is
+    tested against the simplices with the nearest centroids, with more candidates for the points not found at first;
+    points outside the convex hull are skipped, and only the remaining points are passed to find_simplex.
+    :param triangulation: scipy.spatial.Delaunay triangulation
+    :param centroid_tree: cKDTree of the centroids of the simplices
+    :param hull_equations: Facet equations of the convex hull of the triangulated points (see ConvexHull.equations)
+    :param points: (N,3) array of points to locate
+    :param num_candidates: Numbers of nearest simplices to test, in turn
+    :param eps: Tolerance of the barycentric coordinates and hull test
+    :return: Array of the simplex containing each point, -1 for points outside the triangulation
+    """
+    simplices = np.full(len(points), -1, dtype=np.int64)
+
+    # Points outside the convex hull are outside all simplices
+    remaining = np.flatnonzero(np.all(points @ hull_equations[:,:3].T + hull_equations[:,3] <= eps, axis=1))
+
+    for k in num_candidates:
+        if len(remaining) == 0 or k > triangulation.nsimplex:
+            break
+        _, candidates = centroid_tree.query(points[remaining], k=k)
+
+        # Smallest barycentric coordinate of each point within each candidate simplex
+        transforms = triangulation.transform[candidates]
+        barycentric = np.einsum("nkij,nkj->nki", transforms[:,:,:3], points[remaining,np.newaxis,:] - transforms[:,:,3])
+        min_coord = np.minimum(barycentric.min(axis=2), 1 - barycentric.sum(axis=2))
+
+        # Keep the first candidate that contains each point
+        contains = min_coord >= -eps
+        found = contains.any(axis=1)
+        simplices[remaining[found]] = candidates[found, np.argmax(contains[found], axis=1)]
+        remaining = remaining[~found]
+
+    if len(remaining) > 0:
+        simplices[remaining] = triangulation.find_simplex(points[remaining])
+    return simplices
@@ -1,5 +1,9 @@
 import h5py as h5
 import numpy as np
+# Grid coordinates and flow fields of a .cgns file are read straight into preallocated buffers (with read_direct, or
+# copied from a memory map of the file when a dataset is stored contiguously), rather than flattened, stacked and
+# transposed, which made several full-size copies of the grid on every read. Components are stored as rows of a (3,N)
+# buffer and returned as its transpose, an (N,3) view.
 
 def get_important_data(cgns_path):
     """
@@ -11,38 +15,86 @@ def get_important_data(cgns_path):
     # Open data file
     data = h5.File(cgns_path, "r")
 
+    # Get important params
+    params = read_important_data(data)
+
+    # Close data file
+    data.close()
+
+    return params
+
+def read_important_data(data):
+    """
+    Returns important parameters from an open .cgns file used in Abhiram's simulations
+    :param data: Open h5py File of the .cgns file
+    :return: Dictionary with important parameters
+    """
+
     # Get # of timesteps
     tres = len(data["Base"]["TimeIterValues"]["TimeValues"][" data"])
 
     # Get resolution in each dimension (noncartesian)
     kres, jres, ires = data["Base"]["Zone1"][" data"][0]
 
-    # Close data file
-    data.close()
-
     # Return dictionary of important values
     return {"tres": tres, "ires": ires, "jres": jres, "kres": kres}
 
+def map_dataset(dataset):
+    """
+    Memory-maps a dataset of an HDF5 file, if it is stored contiguously and uncompressed.
+    :param dataset: h5py Dataset
+    :return: Read-only numpy memmap of the dataset, or the dataset itself if it cannot be memory-mapped
+    """
+    offset = dataset.id.get_offset()
+    if dataset.chunks is not None or offset is None or dataset.size == 0:
+        return dataset
+    return np.memmap(dataset.file.filename, dtype=dataset.dtype, mode="r", offset=offset, shape=dataset.shape)
+
+def read_into(source, out):
+    """
+    Reads a whole dataset into a preallocated array, converting it to the array's data type.
+    :param source: h5py Dataset, or memmap of it (see map_dataset)
+    :param out: C-contiguous array of the same shape
+    """
+    if isinstance(source, np.ndarray):
+        np.copyto(out, source)
+    else:
+        source.read_direct(out)
+
 class cgns_data:
     """
     Provides information on a cgns dataset from Abhiram's simulation. Allows for easy retrieval of data.
     """
-    def __init__(self, filepath):
+    def __init__(self, filepath, dtype=np.float32):
         """
         Class initializer
         :param filepath: Path to .cgns file
+        :param dtype: Data type of the arrays returned for points and fields
         """
         self.filepath = filepath
+        self.dtype = dtype
 
         # Open file
         self.data = h5.File(self.filepath, "r")
+        self.zone = self.data["Base"]["Zone1"]
 
         # Get important info
-        cgns_params = get_important_data(self.filepath)
+        cgns_params = read_important_data(self.data)
         self.ires = cgns_params["ires"]
         self.jres = cgns_params["jres"]
         self.kres = cgns_params["kres"]
         self.tres = cgns_params["tres"]
+        self.shape = (self.kres, self.jres, self.ires)
+
+        # Grid coordinates, memory-mapped if possible so that slices of them are read without h5py
+        self.coordinates = [map_dataset(self.zone["GridCoordinates"][coordinate_name][" data"])
+                            for coordinate_name in ("CoordinateX", "CoordinateY", "CoordinateZ")]
+
+        # Buffers, allocated on first use: (3,k,j,i) grid points (loaded once), vector and scalar fields (reused on every
+        # timestep)
+        self.points = None
+        self.vector_buffer = None
+        self.scalar_buffer = None
 
     def obtain_range_near_surface(self, dist_from_surf=10):
         """
@@ -50,51 +102,72 @@ class cgns_data:
         :param dist_from_surf: Top k-layer to return - will return all layers between 1 and this number, inclusive.
         :return: 3D arrays of X, Y, and Z (cartesian locations) of points near surface
         """
-        return np.ndarray.flatten(self.data["Base"]["Zone1"]["GridCoordinates"]["CoordinateX"][" data"][1:dist_from_surf, :, :]),\
-               np.ndarray.flatten(self.data["Base"]["Zone1"]["GridCoordinates"]["CoordinateY"][" data"][1:dist_from_surf, :, :]),\
-               np.ndarray.flatten(self.data["Base"]["Zone1"]["GridCoordinates"]["CoordinateZ"][" data"][1:dist_from_surf, :, :])
+        return tuple(np.ravel(coordinate[1:dist_from_surf, :, :]) for coordinate in self.coordinates)
 
     def obtain_points(self):
         """
-        Gets the X, Y, and Z arrays of grid coordinate positions. Each is a 3D array where [i,j,k] refers to the position
-        in the simulation coordinate system, and the values in the array are the cartesian positions.
-        :return: 3D arrays for the X, Y, and Z cartesian locations of points
+        Gets the cartesian positions of all grid points, in the [k,j,i] order of the fields. The grid is only read on
+        the first call.
+        :return: (N,3) array of the X, Y, and Z cartesian locations of points (a view of the loaded grid)
+        """
+        if self.points is None:
+            self.points = np.empty((3,) + self.shape, dtype=self.dtype)
+            for coordinate, points_component in zip(self.coordinates, self.points):
+                read_into(coordinate, points_component)
+        return self.points.reshape(3, -1).T
+
+    def obtain_vector_timestep(self, field_names, tstep):
+        """
+        Gets the cartesian components of a vector field corresponding to [k,j,i] points. The field is read into a buffer
+        that is reused on every call, so the returned array is overwritten by the next call of obtain_vel_timestep,
+        obtain_vor_timestep or obtain_vector_timestep.
+        :param field_names: Names of the X, Y and Z component fields
+        :param tstep: Timestep of field
+        :return: (N,3) array of the X, Y and Z components (a view of the buffer)
         """
-        # Swapaxes makes the output a column rather than a row
-        return np.swapaxes(np.array([np.ndarray.flatten(self.data["Base"]["Zone1"]["GridCoordinates"]["CoordinateX"][" data"][:, :, :]),
-                                     np.ndarray.flatten(self.data["Base"]["Zone1"]["GridCoordinates"]["CoordinateY"][" data"][:, :, :]),
-                                     np.ndarray.flatten(self.data["Base"]["Zone1"]["GridCoordinates"]["CoordinateZ"][" data"][:, :, :])]), 0, 1)
+        if self.vector_buffer is None:
+            self.vector_buffer = np.empty((3,) + self.shape, dtype=self.dtype)
+        flow_solution = self.zone["FlowSolution_%04d" % tstep]
+        for field_name, buffer_component in zip(field_names, self.vector_buffer):
+            flow_solution[field_name][" data"].read_direct(buffer_component)
+        return self.vector_buffer.reshape(3, -1).T
 
     def obtain_vel_timestep(self, tstep):
         """
-        Gets the arrays containing cartesian components of velocity (Vx,Vy,Vz) corresponding to [i,j,k] points
+        Gets the arrays containing cartesian components of velocity (Vx,Vy,Vz) corresponding to [i,j,k] points. The
+        returned array is overwritten by the next vector field read (see obtain_vector_timestep).
         :param tstep: Timestep of velocity field
-        :return: 3D arrays for Vx, Vy, and Vz
+        :return: (N,3) array of Vx, Vy, and Vz
         """
-        return np.swapaxes(np.array([np.ndarray.flatten(self.data["Base"]["Zone1"]["FlowSolution_%04d" % tstep]["VelocityX"][" data"][:, :, :]),
-                                     np.ndarray.flatten(self.data["Base"]["Zone1"]["FlowSolution_%04d" % tstep]["VelocityY"][" data"][:, :, :]),
-                                     np.ndarray.flatten(self.data["Base"]["Zone1"]["FlowSolution_%04d" % tstep]["VelocityZ"][" data"][:, :, :])]), 0, 1)
+        return self.obtain_vector_timestep(("VelocityX", "VelocityY", "VelocityZ"), tstep)
 
     def obtain_vor_timestep(self, tstep):
         """
         Same as obtain_vel_timestep but with vorticity vector components.
         :param tstep: Timestep of vorticity field
-        :return: 3D arrays for Wx, Wy, and Wz
+        :return: (N,3) array of Wx, Wy, and Wz
         """
-        return np.swapaxes(np.array([np.ndarray.flatten(self.data["Base"]["Zone1"]["FlowSolution_%04d" % tstep]["VorticityX"][" data"][:, :, :]),
-                                     np.ndarray.flatten(self.data["Base"]["Zone1"]["FlowSolution_%04d" % tstep]["VorticityY"][" data"][:, :, :]),
-                                     np.ndarray.flatten(self.data["Base"]["Zone1"]["FlowSolution_%04d" % tstep]["VorticityZ"][" data"][:, :, :])]), 0, 1)
+        return self.obtain_vector_timestep(("VorticityX", "VorticityY", "VorticityZ"), tstep)
 
     def obtain_field_timestep(self, field_name, tstep):
         """
-        Obtain values on a scalar field...
+        Obtain values on a scalar field. The field is read into a buffer that is reused on every call, so the returned
+        array is overwritten by the next call.
+        :param field_name: Name of the field, e.g. "Lambda2"
         :param tstep: Timestep of field
-        :return: 3d array for the extracted field
+        :return: (N,) array of the field (a view of the buffer)
         """
-        return np.ndarray.flatten(self.data["Base"]["Zone1"]["FlowSolution_%04d" % tstep][field_name][" data"][:,:,:])
+        if self.scalar_buffer is None:
+            self.scalar_buffer = np.empty(self.shape, dtype=self.dtype)
+        self.zone["FlowSolution_%04d" % tstep][field_name][" data"].read_direct(self.scalar_buffer)
+        return self.scalar_buffer.reshape(-1)
 
     def close(self):
         """
         Close out the .cgns data file - frees up the memory it uses when done extracting data.
         """
+        self.coordinates = None
+        self.points = None
+        self.vector_buffer = None
+        self.scalar_buffer = None
         self.data.close()
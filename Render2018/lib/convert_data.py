@@ -1,114 +1,768 @@
 import os, os.path
+import json
+import contextlib
 from converters import *
-from dircheck import get_output_filepath, check_make, check_file_sanity
-from blender_launcher import launch_blender_smooth
+from dircheck import get_output_filepath
+from artifact_cache import get_cache
+from mesh_clip import clip_geo
+from render_space import blender_to_grid
+from preview_pyramid import downsample_block_mean
+from mesh_decimate import decimate_geo
+from frustum_cull import cull_geo
+from mesh_archive import mesh_archive, get_archive_path
+from cart_resampler import cart_resampler
+from cgns_load_data import cgns_data
+from extract_isosurf_mesh import extract_isosurf_curvilinear
 
-def conv_ply(h5dns_path, output_dir, tres):
+# Options of the exported geometry, shared by the geometry converters and passed to them as one dictionary (geo_options),
+# usually made of the settings bundles of a render config (mesh_decimate.get_decimation_params,
+# mesh_archive.get_archive_params and frustum_cull.get_culling_params). Options that are not given take these defaults:
+#  decimate_cell_size: Clustering cell size to decimate the geometry with (see mesh_decimate.get_cell_size), or 0
+#  max_tris: Triangle budget to decimate the geometry to, or 0 for none
+#  use_archive: Store the geometry of all timesteps in a mesh archive instead of .ply files
+#  archive_encoding: Encoding of the geometry in mesh archives (see mesh_archive.ENCODINGS)
+#  view: Camera settings to cull the geometry to (see frustum_cull.get_culling_params), or None
+GEO_OPTIONS = {"decimate_cell_size": 0, "max_tris": 0, "use_archive": False, "archive_encoding": "raw", "view": None}
+
+def get_geo_options(geo_options=None):
+    """
+    :param geo_options: (optional) Dictionary of options of the exported geometry, possibly with only some of them
+    :return: Dictionary of all options of the exported geometry, with the defaults of GEO_OPTIONS for those not given
+    """
+    return dict(GEO_OPTIONS, **(geo_options or {}))
+
+def add_geo_params(params, geo_options):
+    """
+    Adds the options of the exported geometry that change it to the parameters of its cache key (see
+    artifact_cache.get_key). Options left at their defaults are not added, so that keys stay the same as without them.
+    :param params: Dictionary of parameters of the key
+    :param geo_options: Options of the exported geometry (see GEO_OPTIONS)
+    :return: params
+    """
+    if geo_options["decimate_cell_size"] or geo_options["max_tris"]:
+        params["decimate"] = [geo_options["decimate_cell_size"], geo_options["max_tris"]]
+    if geo_options["view"] is not None:
+        params["view"] = geo_options["view"]
+    return params
+
+def reduce_geo(verts, tris, geo_options, weld=False):
+    """
+    Removes detail that the render cannot resolve and geometry outside the view, according to the options of the
+    exported geometry.
+    :param verts: Vertices array
+    :param tris: Triangles array
+    :param geo_options: Options of the exported geometry (see GEO_OPTIONS)
+    :param weld: Weld the geometry before decimating it, so that clustering keeps it connected (see converters.weld_geo)
+    :return: verts, tris: Decimated and culled vertices and triangles
+    """
+    if geo_options["decimate_cell_size"] or geo_options["max_tris"]:
+        if weld:
+            verts, tris = weld_geo(verts, tris)
+        verts, tris, _ = decimate_geo(verts, tris, cell_size=geo_options["decimate_cell_size"], max_tris=geo_options["max_tris"])
+    if geo_options["view"] is not None:
+        verts, tris, _ = cull_geo(verts, tris, geo_options["view"])
+    return verts, tris
+
+def get_static_frames(h5dns_path, output_dir, tres, threshold, fields=("VOF",), coarse_factor=4):
+    """
+    Finds timesteps in which the data has barely changed since an earlier timestep, so that the earlier timestep's
+    geometry (and images) can be reused. Each timestep is compared to the last timestep that is not reused, by the mean
+    absolute difference of each field on a coarse grid (block means over coarse_factor^3 cells). The result is saved to
+    a file in the output directory, and reloaded when the data and settings are the same.
+    :param h5dns_path: Path to h5dns file
+    :param output_dir: Directory in which to save the result (static_frames.json)
+    :param tres: Number of timesteps in .h5dns
+    :param threshold: Largest mean change of a field for which a timestep reuses the earlier timestep
+    :param fields: Fields that must all be near-static, e.g. ("VOF", "Temperature") for surface temperature maps
+    :param coarse_factor: Downsampling factor of the coarse grid
+    :return: static_frames: Dictionary mapping each timestep to the timestep whose geometry it uses (itself if changed)
+    """
+    static_frames_path = output_dir + "static_frames.json"
+    params = {"input": get_cache(output_dir).get_input_identity(h5dns_path), "tres": tres, "threshold": threshold,
+              "fields": list(fields), "coarse_factor": coarse_factor}
+    if os.path.isfile(static_frames_path):
+        with open(static_frames_path, "r") as static_frames_file:
+            saved = json.load(static_frames_file)
+        if saved["params"] == params:
+            return {int(tstep): source_tstep for tstep, source_tstep in saved["frames"].items()}
+
+    # Compare the coarse fields of each timestep to those of the last timestep that was not reused
+    print("Detecting near-static frames...")
+    data_field = field4Dlow(h5dns_path)
+    static_frames = {}
+    reference = None
+    for tstep in range(tres):
+        coarse = [downsample_block_mean(data_field.obtain3Dtimestep(tstep, field), coarse_factor) for field in fields]
+        if reference is None or max(np.mean(np.abs(c - r)) for c, r in zip(coarse, reference)) >= threshold:
+            reference = coarse
+            source_tstep = tstep
+        static_frames[tstep] = source_tstep
+    data_field.close()
+    num_reused = sum(1 for tstep, source_tstep in static_frames.items() if tstep != source_tstep)
+    print(str(num_reused) + " of " + str(tres) + " frames reuse an earlier frame")
+
+    # Save result
+    with open(static_frames_path + ".tmp", "w") as static_frames_file:
+        json.dump({"params": params, "frames": static_frames}, static_frames_file)
+    os.replace(static_frames_path + ".tmp", static_frames_path)
+
+    return static_frames
+
+@contextlib.contextmanager
+def open_geo_archive(output_dir, use_archive, encoding="raw"):
+    """
+    Context manager that opens the mesh archive of a geometry output directory for appending, and closes it at the end
+    of the block.
+    :param output_dir: Geometry output directory
+    :param use_archive: Whether the geometry of the directory is stored in a mesh archive instead of .ply files
+    :param encoding: Encoding of the geometry appended to the archive (see mesh_archive.ENCODINGS)
+    :return: mesh_archive of the directory, or None if geometry is stored in .ply files
+    """
+    if not use_archive:
+        yield None
+        return
+    with mesh_archive(get_archive_path(output_dir), "a", encoding) as archive:
+        yield archive
+
+def get_tstep_cache(output_dir, caches=None):
+    """
+    Gets the artifact_cache of an output directory for the conversion of one timestep.
+    :param output_dir: Output directory
+    :param caches: (optional) Dictionary of output directory -> artifact_cache, e.g. created once by each worker process
+    of a pipelined render
+    :return: artifact_cache of the output directory, taken from caches if it is there, else the one shared by the process
+    """
+    if caches is not None and output_dir in caches:
+        return caches[output_dir]
+    return get_cache(output_dir)
+
+def is_geo_done(output_dir, tstep, key, cache, archive=None):
+    """
+    Checks whether the geometry of a timestep has already been exported with the same key.
+    :param output_dir: Geometry output directory
+    :param tstep: Timestep
+    :param key: Key of the geometry (see artifact_cache.get_key)
+    :param cache: artifact_cache of the output directory
+    :param archive: (optional) mesh_archive of the output directory, if geometry is stored in a mesh archive
+    :return: True if the geometry is up to date
+    """
+    if archive is not None:
+        return archive.is_done(tstep, key)
+    return cache.is_done(get_output_filepath(output_dir, tstep, ".ply"), key)
+
+def save_geo(output_dir, tstep, key, verts, tris, cache, archive=None, vcolors=None):
+    """
+    Exports the geometry of a timestep to a .ply file, or appends it to the mesh archive of the output directory.
+    :param output_dir: Geometry output directory
+    :param tstep: Timestep
+    :param key: Key of the geometry (see artifact_cache.get_key)
+    :param verts: Vertices array
+    :param tris: Triangles array
+    :param cache: artifact_cache of the output directory
+    :param archive: (optional) mesh_archive of the output directory, if geometry is stored in a mesh archive
+    :param vcolors: (optional) Vertex colors array
+    """
+    if archive is not None:
+        archive.append(tstep, verts, tris, vcolors, key=key)
+        return
+    ply_path = get_output_filepath(output_dir, tstep, ".ply")
+    with cache.write(ply_path, key) as tmp_path:
+        convgeo2ply(verts=verts, tris=tris, vcolors=vcolors if vcolors is not None else False, output_path_ply=tmp_path,
+                    verbose=False)
+    print("Saved PLY file: " + ply_path)
+
+def link_geo(output_dir, source_tstep, tstep, key, cache, archive=None):
+    """
+    Reuses the exported geometry of an earlier timestep for a timestep, without copying it if possible.
+    :param output_dir: Geometry output directory
+    :param source_tstep: Timestep whose geometry to reuse
+    :param tstep: Timestep
+    :param key: Key of the geometry (see artifact_cache.get_key)
+    :param cache: artifact_cache of the output directory
+    :param archive: (optional) mesh_archive of the output directory, if geometry is stored in a mesh archive
+    """
+    if archive is not None:
+        if not archive.is_done(tstep, key):
+            archive.link(source_tstep, tstep, key)
+        return
+    cache.link(get_output_filepath(output_dir, source_tstep, ".ply"), get_output_filepath(output_dir, tstep, ".ply"), key)
+
+def load_geo(input_dir, tstep, archive=None, load_colors=False):
+    """
+    Loads the exported geometry of a timestep from its .ply file, or from the mesh archive of the directory.
+    :param input_dir: Geometry output directory
+    :param tstep: Timestep
+    :param archive: (optional) mesh_archive of the directory, if geometry is stored in a mesh archive
+    :param load_colors: Whether to also return the vertex colors
+    :return: verts, tris, (vcolors if load_colors): Vertices, triangles, and vertex colors (None if there are none)
+    """
+    if archive is not None:
+        return archive.read(tstep, load_colors=load_colors)
+    return convply2geo(get_output_filepath(input_dir, tstep, ".ply"), load_colors=load_colors)
+
+def conv_ply_tstep(h5dns_path, output_dir, tstep, interface_value=0.8, smooth_iterations=10, smooth_method="laplacian", cache=None, source_tstep=None,
+                   geo_options=None, archive=None, data_field=None):
+    """
+    Converts the VOF field of a data file at one timestep to a smoothed droplet interface geometry file (.ply). Marching
+    cubes, vertex welding and smoothing are all performed in this process so that the final mesh is written directly.
+    Skips the timestep if its file has already been exported with the same settings.
+    :param h5dns_path: Path to h5dns file that contains VOF field
+    :param output_dir: Directory to export .ply geometry to
+    :param tstep: Timestep to convert
+    :param interface_value: VOF value at which to draw the interface
+    :param smooth_iterations: Number of smoothing iterations to apply to the interface geometry
+    :param smooth_method: "laplacian" or "taubin" (see converters.smooth_geo)
+    :param cache: (optional) artifact_cache of the output directory, defaults to the one shared by the process (see
+    artifact_cache.get_cache)
+    :param source_tstep: (optional) Earlier timestep whose geometry to reuse, because the interface has barely changed
+    since (see get_static_frames). Only reused if that timestep has already been exported.
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS). Whether to store it in a mesh
+    archive is given by archive instead.
+    :param archive: (optional) mesh_archive of the output directory, to append the geometry to instead of a .ply file
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    """
+
+    if cache is None:
+        cache = get_cache(output_dir)
+    geo_options = get_geo_options(geo_options)
+
+    params = add_geo_params({"interface_value": interface_value, "smooth_iterations": smooth_iterations,
+                             "smooth_method": smooth_method}, geo_options)
+
+    # Link to the geometry of the earlier timestep if it can be reused
+    if source_tstep is not None and source_tstep != tstep:
+        source_key = cache.get_key(h5dns_path, source_tstep, "interface_ply", params)
+        if is_geo_done(output_dir, source_tstep, source_key, cache, archive):
+            link_geo(output_dir, source_tstep, tstep, cache.get_key(h5dns_path, tstep, "interface_ply", dict(params, reused_from=source_key)),
+                     cache, archive)
+            return
+
+    # Check if the file has already been exported with the same data and settings on a previous run. If not, export it.
+    key = cache.get_key(h5dns_path, tstep, "interface_ply", params)
+    if not is_geo_done(output_dir, tstep, key, cache, archive):
+
+        # Convert VOF data to raw vertex/triangle geometry data (Uses marching cubes)
+        vof_field = data_field.obtain3Dtimestep(tstep, "VOF") if data_field is not None else None
+        vertices, triangles = convvof2geo(h5dns_path, tstep, interface_value, vof_field=vof_field)
+
+        # Smooth the blocky marching cubes geometry (already welded by convvof2geo)
+        vertices = smooth_geo(vertices, triangles, iterations=smooth_iterations, method=smooth_method)
+
+        # Remove detail that the render cannot resolve, and geometry outside the view
+        vertices, triangles = reduce_geo(vertices, triangles, geo_options)
+
+        # Convert vertices/triangles to PLY files at destination directory
+        save_geo(output_dir, tstep, key, vertices, triangles, cache, archive)
+
+def conv_ply(h5dns_path, output_dir, tres, interface_value=0.8, smooth_iterations=10, smooth_method="laplacian", static_frames=None,
+             geo_options=None):
     """
     For a series of timesteps, converts the VOF field of a data file to droplet interface geometry files (.ply) that can
-    be loaded and rendered in Blender. Checks whether files exist before converting, and skips those that already exist.
+    be loaded and rendered in Blender. Skips files that have already been exported with the same data and settings.
     :param h5dns_path: Path to h5dns file that contains VOF field
     :param output_dir: Directory to export .ply geometry to
     :param tres: Number of timesteps in .h5dns
+    :param interface_value: VOF value at which to draw the interface
+    :param smooth_iterations: Number of smoothing iterations to apply to the interface geometry
+    :param smooth_method: "laplacian" or "taubin" (see converters.smooth_geo)
+    :param static_frames: (optional) Timesteps whose geometry is reused from earlier timesteps (see get_static_frames)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS)
     """
 
-    # Make dir for initial (unsmoothed) export of geometry
-    output_dir_unsmooth = output_dir + "/unsmooth/"
-    check_make(output_dir_unsmooth)
-
     # Convert all tsteps in .h5dns file
-    for tstep in range(0, tres):
-        # Determine filepath of .ply to export on this tstep
-        ply_path = get_output_filepath(output_dir_unsmooth, tstep, ".ply")
-
-        # Check if file exists already and is larger than the smallest possible size - if so, the file has already been exported on a previous run.
-        # If not, export the file. (need to better determine whether a file valid, and add some warning/error for possible bad files)
-        if not check_file_sanity(ply_path):
-            
-            # Convert VOF data to raw vertex/triangle geometry data (Uses marching cubes)
-            vertices, triangles = convvof2geo(h5dns_path, tstep)
-            
-            # Convert vertices/triangles to PLY files at destination directory
-            convgeo2ply(verts=vertices, tris=triangles, output_path_ply=ply_path)
- 
-    # Perform mesh smoothing in Blender. Will export smoothed .ply files to the output dir.
-    launch_blender_smooth(output_dir_unsmooth=output_dir_unsmooth, output_dir_smooth=output_dir)
-
-def conv_bvox(h5dns_path, output_dir, tres, vapor_min, fog_halved):
+    cache = get_cache(output_dir)
+    geo_options = get_geo_options(geo_options)
+    with open_geo_archive(output_dir, geo_options["use_archive"], geo_options["archive_encoding"]) as archive:
+        for tstep in range(0, tres):
+            conv_ply_tstep(h5dns_path=h5dns_path, output_dir=output_dir, tstep=tstep, interface_value=interface_value,
+                           smooth_iterations=smooth_iterations, smooth_method=smooth_method, cache=cache,
+                           source_tstep=static_frames.get(tstep) if static_frames else None, geo_options=geo_options,
+                           archive=archive)
+
+def get_half_plane(dim, render_scale, dist_from_origin=0, normal_vector=(1,0,0)):
     """
-    For a series of timesteps, converts the vapor (YV) field of a data file to voxel data (.bvox) that can be loaded
-    and rendered as fog in Blender. Checks whether files exist before converting, and skips those that already exist.
-    :param h5dns_path: Path to h5dns file that contains YV field
-    :param output_dir: Directory to export .bvox voxel data to
+    Converts a cut plane specified in Blender scene coordinates, the same way as Blender/split_half.cut_mesh, to the
+    grid coordinates of the exported geometry.
+    :param dim: (x,y,z) resolution of the domain
+    :param render_scale: Scale the geometry is rendered at in Blender
+    :param dist_from_origin: Distance from the origin at which to perform cut - the distance is taken in the direction of the normal vector.
+    :param normal_vector: Vector normal to the cut plane.
+    :return: plane_point, normal_vector: Point on the plane in grid coordinates, and the normal vector
+    """
+    normal_vector = np.array(normal_vector, dtype=float)
+    return blender_to_grid(normal_vector*dist_from_origin, dim, render_scale), normal_vector
+
+def conv_half_ply_tstep(input_dir, output_dir, tstep, plane_point, normal_vector, cache=None, archive=None, input_archive=None,
+                        view=None):
+    """
+    Cuts the droplet interface geometry file (.ply) of one timestep at a plane and fills the cross-section. Skips the
+    timestep if its file has already been exported from the same geometry.
+    :param input_dir: Directory of full interface .ply files (exported by conv_ply)
+    :param output_dir: Directory to export cut .ply geometry to
+    :param tstep: Timestep to cut
+    :param plane_point: Point on the cut plane in grid coordinates (see get_half_plane)
+    :param normal_vector: Vector normal to the cut plane, pointing toward the side to delete
+    :param cache: (optional) artifact_cache of the output directory, defaults to the one shared by the process (see
+    artifact_cache.get_cache)
+    :param archive: (optional) mesh_archive of the output directory, to append the geometry to instead of a .ply file
+    :param input_archive: (optional) mesh_archive of the input directory, if its geometry is stored in a mesh archive
+    :param view: (optional) Camera settings to cull the cut geometry to (see frustum_cull.get_culling_params). The full
+    geometry must not be culled, since the cross-section can only be filled where the cut goes around closed surfaces.
+    """
+
+    if cache is None:
+        cache = get_cache(output_dir)
+
+    # The full geometry files are replaced whenever they are re-exported, so their identity (or their key in a mesh
+    # archive) determines the cut files
+    params = {"plane_point": np.asarray(plane_point).tolist(), "normal_vector": np.asarray(normal_vector).tolist()}
+    if view is not None:
+        params["view"] = view
+    if input_archive is not None:
+        key = cache.get_key(None, tstep, "half_ply", dict(params, source=input_archive.get_key(tstep)))
+    else:
+        key = cache.get_key(get_output_filepath(input_dir, tstep, ".ply"), tstep, "half_ply", params)
+    if not is_geo_done(output_dir, tstep, key, cache, archive):
+        verts, tris = load_geo(input_dir, tstep, input_archive)
+        verts, tris = clip_geo(verts, tris, plane_point=plane_point, plane_normal=normal_vector)
+        if view is not None:
+            verts, tris, _ = cull_geo(verts, tris, view)
+        save_geo(output_dir, tstep, key, verts, tris, cache, archive)
+
+def conv_half_ply(input_dir, output_dir, tres, dim, render_scale, dist_from_origin=0, normal_vector=(1,0,0), geo_options=None):
+    """
+    For a series of timesteps, cuts droplet interface geometry files (.ply) in half and fills the cross-section, so that
+    Blender does not have to cut every frame on import. The cut plane is specified in Blender scene coordinates, the same
+    way as Blender/split_half.cut_mesh. Skips files that have already been exported with the same data and settings.
+    :param input_dir: Directory of full interface .ply files (exported by conv_ply)
+    :param output_dir: Directory to export cut .ply geometry to
     :param tres: Number of timesteps in .h5dns
-    :param vapor_min: Minimum vapor value to render. Vapor intensity is rendered on a logarithmic scale. (max value is determined by taking the maximum YV value in time and space)
-    :param fog_halved: Whether or not to cut fog field in half. If true, will export "halved" .bvox data - this is a workaround because Blender is not good at rendering only one half of data, if provided the entire field.
+    :param dim: (x,y,z) resolution of the domain
+    :param render_scale: Scale the geometry is rendered at in Blender
+    :param dist_from_origin: Distance from the origin at which to perform cut - the distance is taken in the direction of the normal vector.
+    :param normal_vector: Vector normal to the cut plane.
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS). The geometry of the input
+    directory is stored in a mesh archive if the cut geometry is. Decimation options are not used, since the full
+    geometry is decimated when it is exported.
     """
 
-    # Determine max vapor value. We want the maximum value that exists across all timesteps and in the entire domain.
-    # Exports max vapor value to a file, so that when scripts are run multiple times on the same data, this value can be reloaded without recalculating.
-    # Loads this file if it exists, otherwise, run the calculations.
+    # Convert cut plane from Blender scene coordinates to the grid coordinates of the exported geometry
+    plane_point, normal_vector = get_half_plane(dim, render_scale, dist_from_origin, normal_vector)
+
+    cache = get_cache(output_dir)
+    geo_options = get_geo_options(geo_options)
+    with open_geo_archive(output_dir, geo_options["use_archive"], geo_options["archive_encoding"]) as archive, \
+         open_geo_archive(input_dir, geo_options["use_archive"]) as input_archive:
+        for tstep in range(0, tres):
+            conv_half_ply_tstep(input_dir=input_dir, output_dir=output_dir, tstep=tstep, plane_point=plane_point,
+                                normal_vector=normal_vector, cache=cache, archive=archive, input_archive=input_archive,
+                                view=geo_options["view"])
+
+def get_vapor_max(h5dns_path, output_dir, sweep=None):
+    """
+    Determines max vapor value. We want the maximum value that exists across all timesteps and in the entire domain.
+    Exports max vapor value to a file, so that when scripts are run multiple times on the same data, this value can be reloaded without recalculating.
+    Loads this file if it exists, otherwise, run the calculations.
+    :param h5dns_path: Path to h5dns file that contains YV field
+    :param output_dir: Directory that .bvox voxel data is exported to
+    :param sweep: (optional) convert_sweep whose statistics pre-sweep computes the value, together with the other
+    statistics of the case (see convert_sweep.get_stats)
+    :return: vapor_max: Maximum vapor value
+    """
     vapor_max_filepath = output_dir + "vapor_max.txt"
     if os.path.isfile(vapor_max_filepath):
         with open(vapor_max_filepath, "r") as vapor_max_file:
             vapor_max = float(vapor_max_file.readline())
     else:
-        vapor_max = find_max_vapor(h5dns_path)
+        vapor_max = sweep.get_stats(h5dns_path)["vapor_max"] if sweep is not None else find_max_vapor(h5dns_path)
         with open(vapor_max_filepath, "w") as vapor_max_file:
             vapor_max_file.write(str(vapor_max))
+    return vapor_max
 
-    # Check if file exists already and is larger than the smallest possible size - if so, the file has already been exported on a previous run.
-    # If not, export the file. (need to better determine whether a file valid, and add some warning/error for possible bad files)
+def conv_bvox_tstep(h5dns_path, output_dir, tstep, vapor_min, vapor_max, fog_halved, cache=None, view=None, data_field=None):
+    """
+    Converts the vapor (YV) field of a data file at one timestep to voxel data (.bvox). Skips the timestep if its file
+    has already been exported with the same data and settings.
+    :param h5dns_path: Path to h5dns file that contains YV field
+    :param output_dir: Directory to export .bvox voxel data to
+    :param tstep: Timestep to convert
+    :param vapor_min: Minimum vapor value to render
+    :param vapor_max: Maximum vapor value to render (see get_vapor_max)
+    :param fog_halved: Whether or not to cut fog field in half
+    :param cache: (optional) artifact_cache of the output directory, defaults to the one shared by the process (see
+    artifact_cache.get_cache)
+    :param view: (optional) Camera settings to crop the fog to (see frustum_cull.get_culling_params)
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    """
+
+    if cache is None:
+        cache = get_cache(output_dir)
+
+    # Check if the file has already been exported with the same data and settings on a previous run. If not, export it.
+    bvox_path = get_output_filepath(output_dir, tstep, ".bvox")
+    params = {"vapor_min": vapor_min, "vapor_max": vapor_max, "fog_halved": fog_halved}
+    if view is not None:
+        params["view"] = view
+    key = cache.get_key(h5dns_path, tstep, "fog_bvox", params)
+    if not cache.is_done(bvox_path, key):
+        # Convert YV data to .bvox and export to output directory.
+        with cache.write(bvox_path, key) as tmp_path:
+            convyv2bvox(h5dns_path=h5dns_path, output_path=tmp_path, tstep=tstep, vapor_min=vapor_min, vapor_max=vapor_max, fog_halved=fog_halved,
+                        view=view, data_field=data_field, verbose=False)
+        print("Saved fog file: " + bvox_path)
+
+def conv_bvox(h5dns_path, output_dir, tres, vapor_min, fog_halved, view=None):
+    """
+    For a series of timesteps, converts the vapor (YV) field of a data file to voxel data (.bvox) that can be loaded
+    and rendered as fog in Blender. Skips files that have already been exported with the same data and settings.
+    :param h5dns_path: Path to h5dns file that contains YV field
+    :param output_dir: Directory to export .bvox voxel data to
+    :param tres: Number of timesteps in .h5dns
+    :param vapor_min: Minimum vapor value to render. Vapor intensity is rendered on a logarithmic scale. (max value is determined by taking the maximum YV value in time and space)
+    :param fog_halved: Whether or not to cut fog field in half. If true, will export "halved" .bvox data - this is a workaround because Blender is not good at rendering only one half of data, if provided the entire field.
+    :param view: (optional) Camera settings to crop the fog to (see frustum_cull.get_culling_params)
+    """
+
+    # Determine max vapor value across all timesteps
+    vapor_max = get_vapor_max(h5dns_path, output_dir)
+
+    cache = get_cache(output_dir)
     for tstep in range(0, tres):
-        # Check if file exists before converting
-        bvox_path = get_output_filepath(output_dir, tstep, ".bvox")
-        if not check_file_sanity(bvox_path):
-            # Convert YV data to .bvox and export to output directory.
-            convyv2bvox(h5dns_path=h5dns_path, output_path=bvox_path, tstep=tstep, vapor_min=vapor_min, vapor_max=vapor_max, fog_halved=fog_halved)
+        conv_bvox_tstep(h5dns_path=h5dns_path, output_dir=output_dir, tstep=tstep, vapor_min=vapor_min,
+                        vapor_max=vapor_max, fog_halved=fog_halved, cache=cache, view=view)
+
+def conv_photorealistic_tstep(tstep, h5dns_path, geometry_output_dir, half_output_dir=None, half_plane=None,
+                              bvox_output_dir=None, vapor_min=None, vapor_max=None, fog_halved=False, static_frames=None,
+                              geo_options=None, caches=None, data_field=None):
+    """
+    Performs all conversions needed to render one timestep of a photorealistic render: droplet interface geometry,
+    optionally cut in half, and optionally vapor fog. Used by the pipelined render mode, which runs this in worker
+    processes while Blender renders earlier timesteps, and by the single-sweep conversion of several renders (see
+    convert_sweep).
+    :param tstep: Timestep to convert
+    :param h5dns_path: Path to h5dns file
+    :param geometry_output_dir: Directory to export interface .ply geometry to
+    :param half_output_dir: (optional) Directory to export cut interface geometry to
+    :param half_plane: (plane_point, normal_vector) of the cut, required if half_output_dir is given (see get_half_plane)
+    :param bvox_output_dir: (optional) Directory to export .bvox fog data to
+    :param vapor_min: Minimum vapor value to render, required if bvox_output_dir is given
+    :param vapor_max: Maximum vapor value to render, required if bvox_output_dir is given (see get_vapor_max)
+    :param fog_halved: Whether or not to cut fog field in half
+    :param static_frames: (optional) Timesteps whose geometry is reused from earlier timesteps (see get_static_frames)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS). The fog is cropped to the same
+    view. If the geometry is cut in half, only the cut geometry is culled.
+    :param caches: (optional) Dictionary of output directory -> artifact_cache, defaults to the caches shared by the
+    process (see artifact_cache.get_cache)
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    :return: tstep: The converted timestep
+    """
+    geo_options = get_geo_options(geo_options)
+    use_archive, archive_encoding, view = geo_options["use_archive"], geo_options["archive_encoding"], geo_options["view"]
+    with open_geo_archive(geometry_output_dir, use_archive, archive_encoding) as archive:
+        conv_ply_tstep(h5dns_path=h5dns_path, output_dir=geometry_output_dir, tstep=tstep,
+                       source_tstep=static_frames.get(tstep) if static_frames else None,
+                       geo_options=geo_options if half_output_dir is None else dict(geo_options, view=None),
+                       cache=get_tstep_cache(geometry_output_dir, caches), archive=archive, data_field=data_field)
+        if half_output_dir is not None:
+            with open_geo_archive(half_output_dir, use_archive, archive_encoding) as half_archive:
+                conv_half_ply_tstep(input_dir=geometry_output_dir, output_dir=half_output_dir, tstep=tstep,
+                                    plane_point=half_plane[0], normal_vector=half_plane[1],
+                                    cache=get_tstep_cache(half_output_dir, caches), archive=half_archive,
+                                    input_archive=archive, view=view)
+    if bvox_output_dir is not None:
+        conv_bvox_tstep(h5dns_path=h5dns_path, output_dir=bvox_output_dir, tstep=tstep, vapor_min=vapor_min,
+                        vapor_max=vapor_max, fog_halved=fog_halved, cache=get_tstep_cache(bvox_output_dir, caches),
+                        view=view, data_field=data_field)
+    return tstep
+
+def conv_color_geo_tstep(h5dns_path, output_dir, tstep, color_min, color_max, color_field="Temperature", interface_value=0.8,
+                         smooth_iterations=10, smooth_method="laplacian", cache=None, source_tstep=None,
+                         geo_options=None, archive=None, data_field=None):
+    """
+    Converts the VOF field of a data file at one timestep to a smoothed droplet interface geometry file (.ply) colored
+    by a scalar field (e.g. surface temperature), in one pass: the VOF and color fields are read once, and the colors
+    are sampled at the vertices of the final (smoothed, decimated and culled) geometry while the field is in memory,
+    instead of exporting uncolored geometry and reading it back to add colors.
+    Skips the timestep if its file has already been exported with the same settings.
+    :param h5dns_path: Path to h5dns file that contains VOF and color fields
+    :param output_dir: Directory to export colored .ply geometry to
+    :param tstep: Timestep to convert
+    :param color_min: Value of the color field at the lowest color (anything below will just be the lowest color)
+    :param color_max: Value of the color field at the highest color
+    :param color_field: Scalar field to color the interface by
+    :param interface_value: VOF value at which to draw the interface
+    :param smooth_iterations: Number of smoothing iterations to apply to the interface geometry
+    :param smooth_method: "laplacian" or "taubin" (see converters.smooth_geo)
+    :param cache: (optional) artifact_cache of the output directory, defaults to the one shared by the process (see
+    artifact_cache.get_cache)
+    :param source_tstep: (optional) Earlier timestep whose colored geometry to reuse, because both the interface and the
+    color field have barely changed since (see get_static_frames). Only reused if that timestep has already been exported.
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS). Whether to store it in a mesh
+    archive is given by archive instead.
+    :param archive: (optional) mesh_archive of the output directory, to append the geometry to instead of a .ply file
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    """
+
+    if cache is None:
+        cache = get_cache(output_dir)
+    geo_options = get_geo_options(geo_options)
+
+    params = {"interface_value": interface_value, "smooth_iterations": smooth_iterations, "smooth_method": smooth_method,
+              "color_min": color_min, "color_max": color_max}
+    if color_field != "Temperature":
+        params["color_field"] = color_field
+    add_geo_params(params, geo_options)
+
+    # Link to the geometry of the earlier timestep if it can be reused
+    if source_tstep is not None and source_tstep != tstep:
+        source_key = cache.get_key(h5dns_path, source_tstep, "color_geo", params)
+        if is_geo_done(output_dir, source_tstep, source_key, cache, archive):
+            link_geo(output_dir, source_tstep, tstep, cache.get_key(h5dns_path, tstep, "color_geo", dict(params, reused_from=source_key)),
+                     cache, archive)
+            return
 
-def conv_color_ply(h5dns_path, output_dir, uncolored_ply_dir, tres, temp_min, temp_max):
+    # Check if the file has already been exported with the same data and settings on a previous run. If not, export it.
+    key = cache.get_key(h5dns_path, tstep, "color_geo", params)
+    if not is_geo_done(output_dir, tstep, key, cache, archive):
+
+        # Read the VOF and color fields of the timestep, unless the data file is already open
+        data = data_field if data_field is not None else field4Dlow(h5dns_path)
+        vof_field = data.obtain3Dtimestep(tstep, "VOF")
+        color_values = get_color_field(data, tstep, color_field)
+        if data_field is None:
+            data.close()
+
+        # Extract, smooth, decimate and cull the interface geometry the same way as conv_ply_tstep
+        vertices, triangles = convvof2geo(h5dns_path, tstep, interface_value, vof_field=vof_field)
+        vertices = smooth_geo(vertices, triangles, iterations=smooth_iterations, method=smooth_method)
+        vertices, triangles = reduce_geo(vertices, triangles, geo_options)
+
+        # Sample the colors at the final vertices, and export the colored geometry
+        colors = get_vert_colors(color_values, vertices, color_min, color_max)
+        save_geo(output_dir, tstep, key, vertices, triangles, cache, archive, vcolors=colors)
+
+def conv_color_geo(h5dns_path, output_dir, tres, color_min, color_max, color_field="Temperature", interface_value=0.8,
+                   smooth_iterations=10, smooth_method="laplacian", static_frames=None, geo_options=None):
     """
-    Adds color to the vertices of a droplet interface in a .ply file, which allows interface surface temperature to be visualized.
-    Accepts uncolored .ply as input and adds color based on interpolated temperature data at each vertex location.
-    :param h5dns_path: Path to h5dns file that contains Temperature field
+    For a series of timesteps, converts the VOF field of a data file to droplet interface geometry colored by a scalar
+    field (see conv_color_geo_tstep). Skips files that have already been exported with the same data and settings.
+    :param h5dns_path: Path to h5dns file that contains VOF and color fields
     :param output_dir: Directory to export colored .ply geometry to
-    :param uncolored_ply_dir: Directory in which to find original (uncolored) .ply files exported previously
     :param tres: Number of timesteps in .h5dns
-    :param temp_min: Minimum temperature bound to visualize (anything below will just be the lowest color)
+    :param color_min: Value of the color field at the lowest color
+    :param color_max: Value of the color field at the highest color
+    :param color_field: Scalar field to color the interface by
+    :param interface_value: VOF value at which to draw the interface
+    :param smooth_iterations: Number of smoothing iterations to apply to the interface geometry
+    :param smooth_method: "laplacian" or "taubin" (see converters.smooth_geo)
+    :param static_frames: (optional) Timesteps whose colored geometry is reused from earlier timesteps, because both
+    the interface and the color field have barely changed (see get_static_frames)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS)
+    """
+    cache = get_cache(output_dir)
+    geo_options = get_geo_options(geo_options)
+    with open_geo_archive(output_dir, geo_options["use_archive"], geo_options["archive_encoding"]) as archive:
+        for tstep in range(0, tres):
+            conv_color_geo_tstep(h5dns_path=h5dns_path, output_dir=output_dir, tstep=tstep, color_min=color_min,
+                                 color_max=color_max, color_field=color_field, interface_value=interface_value,
+                                 smooth_iterations=smooth_iterations, smooth_method=smooth_method, cache=cache,
+                                 source_tstep=static_frames.get(tstep) if static_frames else None,
+                                 geo_options=geo_options, archive=archive)
+
+def conv_surf_tempmap_tstep(tstep, h5dns_path, output_dir, temp_min, temp_max, static_frames=None, geo_options=None,
+                            caches=None, data_field=None):
+    """
+    Performs all conversions needed to render one timestep of a surface temperature render: droplet interface geometry
+    colored by surface temperature. Used by the single-sweep conversion of several renders (see convert_sweep).
+    :param tstep: Timestep to convert
+    :param h5dns_path: Path to h5dns file
+    :param output_dir: Directory to export colored .ply geometry to
+    :param temp_min: Minimum temperature bound to visualize
     :param temp_max: Maximum temperature bound to visualize
+    :param static_frames: (optional) Timesteps whose colored geometry is reused from earlier timesteps (see get_static_frames)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS)
+    :param caches: (optional) Dictionary of output directory -> artifact_cache, defaults to the caches shared by the
+    process (see artifact_cache.get_cache)
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    :return: tstep: The converted timestep
     """
+    geo_options = get_geo_options(geo_options)
+    with open_geo_archive(output_dir, geo_options["use_archive"], geo_options["archive_encoding"]) as archive:
+        conv_color_geo_tstep(h5dns_path=h5dns_path, output_dir=output_dir, tstep=tstep, color_min=temp_min,
+                             color_max=temp_max, source_tstep=static_frames.get(tstep) if static_frames else None,
+                             geo_options=geo_options, cache=get_tstep_cache(output_dir, caches), archive=archive,
+                             data_field=data_field)
+    return tstep
 
-    # Iterate through all timesteps, check if colored .ply already exists, and if not, create it
-    for tstep in range(0, tres):
-        output_temp_dir = get_output_filepath(output_dir, tstep, ".ply")
-        if not check_file_sanity(output_temp_dir):
-            # Convert existing uncolored .ply data to verts/tris
-            smooth_verts, smooth_tris = convply2geo(get_output_filepath(uncolored_ply_dir, tstep, ".ply"))
-            # Use verts to determine corresponding color at each vert
-            colors = convvert2color(h5dns_path, smooth_verts, temp_min, temp_max, tstep)
-            # Create .ply file with added color data
-            convgeo2ply(verts=smooth_verts, tris=smooth_tris, vcolors=colors, output_path_ply=output_temp_dir)
-
-def conv_lambda2_ply(h5dns_path, output_dir, tres, contour_level):
-    """
-    Creates geometry that represents lambda2 contours, given cartesian velocity data in the .h5dns file, and exports
-    it to .ply files for each timestep.
+def conv_lambda2_ply_tstep(tstep, h5dns_path, output_dir, contour_level, geo_options=None, field_name="Lambda2",
+                           cached_fields=(), cache=None, archive=None, data_field=None):
+    """
+    Converts one timestep of a vortex identification field (lambda2 by default) to contour geometry (see
+    conv_lambda2_ply). Skips the timestep if its file has already been exported with the same settings.
+    :param tstep: Timestep to convert
+    :param h5dns_path: Path to h5dns file
+    :param output_dir: Directory to export .ply geometry to
+    :param contour_level: Contour to render in 3D (must be negative to make sense for lambda2)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS). Whether to store it in a mesh
+    archive is given by archive instead.
+    :param field_name: Field to contour, from vortex_fields.VORTEX_FIELDS
+    :param cached_fields: (optional) Other vortex identification fields to compute from the same velocity gradients and
+    add to the derived field cache, for later renders of them
+    :param cache: (optional) artifact_cache of the output directory, defaults to the one shared by the process (see
+    artifact_cache.get_cache)
+    :param archive: (optional) mesh_archive of the output directory, to append the geometry to instead of a .ply file
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    """
+
+    if cache is None:
+        cache = get_cache(output_dir)
+    geo_options = get_geo_options(geo_options)
+
+    params = {"contour_level": contour_level}
+    if field_name != "Lambda2":
+        params["field"] = field_name
+    add_geo_params(params, geo_options)
+    key = cache.get_key(h5dns_path, tstep, "lambda2_ply", params)
+    if not is_geo_done(output_dir, tstep, key, cache, archive):
+        # Run calculations to determine lambda2 contour geometry
+        verts, tris = convlambda22geo(h5dns_path, tstep, contour_level, field_name, cached_fields, data_field=data_field)
+        # Remove detail that the render cannot resolve and geometry outside the view. Contours are welded first so that
+        # clustering keeps them connected.
+        verts, tris = reduce_geo(verts, tris, geo_options, weld=True)
+        # Export this geometry to .ply
+        save_geo(output_dir, tstep, key, verts, tris, cache, archive)
+
+def conv_lambda2_tstep(tstep, h5dns_path, output_dir, contour_level, geo_options=None, field_name="Lambda2", cached_fields=(),
+                       caches=None, data_field=None):
+    """
+    Performs all conversions needed to render one timestep of a lambda2 render: contour geometry of a vortex
+    identification field. Used by the single-sweep conversion of several renders (see convert_sweep).
+    :param tstep: Timestep to convert
+    :param h5dns_path: Path to h5dns file
+    :param output_dir: Directory to export .ply geometry to
+    :param contour_level: Contour to render in 3D (must be negative to make sense for lambda2)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS)
+    :param field_name: Field to contour, from vortex_fields.VORTEX_FIELDS
+    :param cached_fields: (optional) Other vortex identification fields to add to the derived field cache
+    :param caches: (optional) Dictionary of output directory -> artifact_cache, defaults to the caches shared by the
+    process (see artifact_cache.get_cache)
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    :return: tstep: The converted timestep
+    """
+    geo_options = get_geo_options(geo_options)
+    with open_geo_archive(output_dir, geo_options["use_archive"], geo_options["archive_encoding"]) as archive:
+        conv_lambda2_ply_tstep(tstep=tstep, h5dns_path=h5dns_path, output_dir=output_dir, contour_level=contour_level,
+                               geo_options=geo_options, field_name=field_name, cached_fields=cached_fields,
+                               cache=get_tstep_cache(output_dir, caches), archive=archive, data_field=data_field)
+    return tstep
+
+def conv_lambda2_ply(h5dns_path, output_dir, tres, contour_level, geo_options=None, field_name="Lambda2", cached_fields=()):
+    """
+    Creates geometry that represents contours of a vortex identification field (lambda2 by default), given cartesian
+    velocity data in the .h5dns file, and exports it to .ply files for each timestep.
     :param h5dns_path: Path to h5dns file
     :param output_dir: Directory to export colored .ply geometry to
     :param tres: Number of timesteps in .h5dns
-    :param contour_level: Lambda2 contour to render in 3D (must be negative to make sense)
+    :param contour_level: Contour to render in 3D (must be negative to make sense for lambda2)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS)
+    :param field_name: Field to contour, from vortex_fields.VORTEX_FIELDS
+    :param cached_fields: (optional) Other vortex identification fields to compute from the same velocity gradients and
+    add to the derived field cache, for later renders of them
     """
 
-    # Iterate through all timesteps, check if lambda2 contour .ply files already exist, and create them if not
-    for tstep in range(0, tres):
-        ply_path = get_output_filepath(output_dir, tstep, ".ply")
-        if not check_file_sanity(ply_path):
-            # Run calculations to determine lambda2 contour geometry
-            verts, tris = convlambda22geo(h5dns_path, tstep, contour_level)
-            # Export this geometry to .ply
-            convgeo2ply(verts, tris, ply_path)
+    # Iterate through all timesteps, check if lambda2 contour .ply files are up to date, and create them if not
+    cache = get_cache(output_dir)
+    geo_options = get_geo_options(geo_options)
+    with open_geo_archive(output_dir, geo_options["use_archive"], geo_options["archive_encoding"]) as archive:
+        for tstep in range(0, tres):
+            conv_lambda2_ply_tstep(tstep=tstep, h5dns_path=h5dns_path, output_dir=output_dir, contour_level=contour_level,
+                                   geo_options=geo_options, field_name=field_name, cached_fields=cached_fields,
+                                   cache=cache, archive=archive)
+
+def get_cart_resampler(cgns_path, output_dir, bounds, spacing, cache=None):
+    """
+    Gets the resampler from the curvilinear grid of a .cgns file to a Cartesian grid (see cart_resampler). Its weights are
+    saved in the output directory, and loaded instead of rebuilt when the data file and Cartesian grid are the same.
+    :param cgns_path: Path to .cgns file
+    :param output_dir: Directory in which to save the weights (cart_resampler.npz)
+    :param bounds: [xmin, xmax, ymin, ymax, zmin, zmax] of the Cartesian grid
+    :param spacing: Approximate distance between Cartesian grid points
+    :param cache: (optional) artifact_cache of the output directory, defaults to the one shared by the process (see
+    artifact_cache.get_cache)
+    :return: cart_resampler with its weights
+    """
+    if cache is None:
+        cache = get_cache(output_dir)
+    resampler = cart_resampler(bounds, spacing)
+    weights_path = output_dir + "cart_resampler.npz"
+    key = cache.get_key(cgns_path, None, "cart_resampler", {"bounds": list(bounds), "spacing": spacing})
+    if cache.is_done(weights_path, key):
+        resampler.load(weights_path)
+        return resampler
+
+    # Triangulate the grid points, which are the same on every timestep
+    data = cgns_data(cgns_path)
+    resampler.build(data.obtain_points())
+    data.close()
+    with cache.write(weights_path, key) as tmp_path:
+        with open(tmp_path, "wb") as weights_file:
+            resampler.save(weights_file)
+    return resampler
+
+def conv_bodyflow_isosurf_ply(cgns_path, output_dir, tres, field_name, contour_level, method="curvilinear", bounds=None,
+                              spacing=None, fill_value=0, geo_options=None):
+    """
+    Creates geometry of an isosurface of a scalar field in a .cgns file (e.g. "Lambda2"), and exports it for each
+    timestep. The isosurface is either extracted on the curvilinear grid itself (see
+    extract_isosurf_mesh.extract_isosurf_curvilinear), or on a Cartesian grid the field is resampled to, with resampling
+    weights computed once for all timesteps (see get_cart_resampler). Vertices are in the coordinate system of the .cgns
+    file, like the body geometry (see extract_isosurf_mesh).
+    :param cgns_path: Path to .cgns file
+    :param output_dir: Directory to export .ply geometry to
+    :param tres: Number of timesteps in .cgns
+    :param field_name: Name of the scalar field
+    :param contour_level: Value of the field at which to draw the isosurface
+    :param method: "curvilinear" or "cartesian"
+    :param bounds: [xmin, xmax, ymin, ymax, zmin, zmax] of the Cartesian grid, required for the "cartesian" method
+    :param spacing: Approximate distance between Cartesian grid points, required for the "cartesian" method
+    :param fill_value: Value of the field outside the curvilinear grid, which should lie on the outer side of the
+    isosurface ("cartesian" method)
+    :param geo_options: (optional) Options of the exported geometry (see GEO_OPTIONS). The view is not used, since the
+    geometry is in the coordinate system of the .cgns file rather than on the grid the camera settings refer to.
+    """
+
+    # Iterate through all timesteps, check if isosurface .ply files are up to date, and create them if not
+    cache = get_cache(output_dir)
+    geo_options = dict(get_geo_options(geo_options), view=None)
+    params = {"field_name": field_name, "contour_level": contour_level, "method": method}
+    if method == "cartesian":
+        params.update(bounds=list(bounds), spacing=spacing, fill_value=fill_value)
+    add_geo_params(params, geo_options)
+    resampler = None
+    data = None
+    with open_geo_archive(output_dir, geo_options["use_archive"], geo_options["archive_encoding"]) as archive:
+        for tstep in range(0, tres):
+            key = cache.get_key(cgns_path, tstep, "bodyflow_isosurf_ply", params)
+            if not is_geo_done(output_dir, tstep, key, cache, archive):
+                if method == "cartesian":
+                    # Only build or load the resampler once a timestep needs converting
+                    if resampler is None:
+                        resampler = get_cart_resampler(cgns_path, output_dir, bounds, spacing, cache)
+                        data = cgns_data(cgns_path)
+                    # Resample the field to the Cartesian grid and extract the isosurface
+                    field = resampler.resample(data.obtain_field_timestep(field_name, tstep), fill_value=fill_value)
+                    verts, tris = mcubes.marching_cubes(field, contour_level)
+                    verts = resampler.grid_to_cart(verts)
+                else:
+                    verts, tris = extract_isosurf_curvilinear(cgns_path, tstep, field_name, contour_level)
+                # Remove detail that the render cannot resolve. Contours are welded first so that clustering keeps them connected.
+                verts, tris = reduce_geo(verts, tris, geo_options, weld=True)
+                # Export this geometry to .ply
+                save_geo(output_dir, tstep, key, verts, tris, cache, archive)
+    if data is not None:
+        data.close()
 
-def temp_bounds(h5dns_path, ply_temp_output_dir, prc_min, prc_max):
+def temp_bounds(h5dns_path, ply_temp_output_dir, prc_min, prc_max, sweep=None):
     """
     Determines the temperature associated with a particular temperature percentile across the droplet interface on all timesteps.
     The first time this function is run for a particular .h5dns, it saves a .csv with many percentiles and the associated
@@ -118,6 +772,8 @@ def temp_bounds(h5dns_path, ply_temp_output_dir, prc_min, prc_max):
     :param ply_temp_output_dir: Output dir for temperature percentile csv (ply/geometry files also go here)
     :param prc_min: Min percentile to interpolate to temperature value (nondimensional)
     :param prc_max: Max percentile to interpolate to temperature value (nondimensional)
+    :param sweep: (optional) convert_sweep whose statistics pre-sweep computes the percentiles, together with the other
+    statistics of the case (see convert_sweep.get_stats)
     :return: temp_min, temp_max: Min and max temperature bounds associated with min and max percentiles.
     """
     print("Determining temperature bounds...")
@@ -129,7 +785,11 @@ def temp_bounds(h5dns_path, ply_temp_output_dir, prc_min, prc_max):
     else:
         # Calculate percentiles
         print("Determining percentiles and saving (may take a while)...")
-        temp_prctiles = get_temp_prctiles(h5dns_path, temp_prctile_file)
+        if sweep is not None:
+            temp_prctiles = sweep.get_stats(h5dns_path)["temp_prctiles"]
+            np.savetxt(temp_prctile_file, temp_prctiles)
+        else:
+            temp_prctiles = get_temp_prctiles(h5dns_path, temp_prctile_file)
 
     # Interpolate between discrete percentiles/associated temperature values
     temp_min, temp_max = np.interp([prc_min, prc_max], temp_prctiles[:,0], temp_prctiles[:,1])
@@ -0,0 +1,124 @@
+from h5dns_load_data import field4Dlow
+from converters import find_case_stats
+from stage_timer import timed
+from artifact_cache import get_cache
+# Single-sweep conversion of several renders of a case. Each render (photorealistic, surface temperature, lambda2...)
+# otherwise converts the whole time series on its own, reading the same fields of every timestep again. Instead, the
+# renders add the conversion of one of their timesteps (e.g. convert_data.conv_photorealistic_tstep) to a sweep, which
+# then reads each timestep once and passes it to all of them before moving on to the next timestep. Each conversion
+# still checks its artifact cache first, so fields are only read for timesteps that have something left to convert.
+# Statistics taken across all timesteps (vapor max, temperature percentiles) are needed before the first timestep is
+# converted, so if any of them has not been saved yet, all the statistics the renders need are computed in one
+# pre-sweep (see converters.find_case_stats).
+
+class timestep_fields:
+    """
+    Reader of an .h5dns file with the interface of field4Dlow, that keeps the fields read on the current timestep, so
+    that all the conversions of a timestep share one read of each field. Fields of the previous timestep are dropped
+    when another timestep is read. Fields are shared, so conversions must not modify them in place.
+    """
+    def __init__(self, h5dns_path):
+        """
+        Class initializer. Opens the data file.
+        :param h5dns_path: Path to .h5dns file
+        """
+        self.data_field = field4Dlow(h5dns_path)
+
+        # Timestep whose fields are kept, and field name -> 3D field
+        self.tstep = None
+        self.fields = {}
+
+    def __getattr__(self, name):
+        """
+        Information on the data (resolution, dimensions...) is that of the data file (see field4Dlow).
+        """
+        return getattr(self.data_field, name)
+
+    def obtain3Dtimestep(self, tstep, field):
+        """
+        Returns 3D data for a specific timestep on a specific scalar field, indexed as [i,j,k] (see
+        field4Dlow.obtain3Dtimestep). Only read from the data file the first time it is requested on the timestep.
+        :param tstep: Timestep
+        :param field: Field to take data from
+        :return: 3D scalar field of data.
+        """
+        if tstep != self.tstep:
+            self.tstep = tstep
+            self.fields = {}
+        if field not in self.fields:
+            self.fields[field] = self.data_field.obtain3Dtimestep(tstep, field)
+        return self.fields[field]
+
+    def close(self):
+        """
+        Drops the fields that are kept and closes the data file.
+        """
+        self.fields = {}
+        self.data_field.close()
+
+class convert_sweep:
+    """
+    Conversions of several renders, run in a single sweep over the timesteps of their data files.
+    """
+    def __init__(self, stats=()):
+        """
+        Class initializer.
+        :param stats: Names of the statistics the renders need (see converters.CASE_STATS), all computed in one
+        pre-sweep when the first of them is requested
+        """
+        self.stats = stats
+
+        # (convert_tstep, convert_kwargs, tres, cache_dirs) of each conversion, in the order they were added
+        self.conversions = []
+
+        # Path to data file -> dictionary of statistics
+        self.case_stats = {}
+
+    def add(self, convert_tstep, convert_kwargs, tres, cache_dirs=()):
+        """
+        Adds the conversion of a render to the sweep.
+        :param convert_tstep: Function that converts one timestep, called as convert_tstep(tstep=tstep,
+        data_field=data_field, caches=caches, **convert_kwargs), e.g. convert_data.conv_photorealistic_tstep
+        :param convert_kwargs: Dictionary of keyword arguments to pass to convert_tstep, including "h5dns_path"
+        :param tres: Number of timesteps to convert
+        :param cache_dirs: (optional) Output directories of the conversion, whose artifact caches are created once before
+        the sweep and passed to every timestep
+        """
+        self.conversions.append((convert_tstep, convert_kwargs, int(tres), tuple(cache_dirs)))
+
+    def get_stats(self, h5dns_path):
+        """
+        Gets the statistics of a data file, computing all the statistics the renders need in one pre-sweep over the
+        timesteps the first time. Called by the functions that save the statistics (convert_data.get_vapor_max and
+        convert_data.temp_bounds) when they have not been saved yet.
+        :param h5dns_path: Path to .h5dns file
+        :return: Dictionary of statistic name -> value (see converters.find_case_stats)
+        """
+        if h5dns_path not in self.case_stats:
+            print("Computing case statistics in one sweep: " + ", ".join(self.stats))
+            self.case_stats[h5dns_path] = find_case_stats(h5dns_path, self.stats)
+        return self.case_stats[h5dns_path]
+
+    @timed("convert_sweep")
+    def run(self):
+        """
+        Runs all the conversions that have been added. Each data file is swept once: every timestep is read once and
+        converted by all the conversions of that data file before the next timestep is read.
+        """
+        h5dns_paths = []
+        for convert_tstep, convert_kwargs, tres, cache_dirs in self.conversions:
+            if convert_kwargs["h5dns_path"] not in h5dns_paths:
+                h5dns_paths.append(convert_kwargs["h5dns_path"])
+
+        for h5dns_path in h5dns_paths:
+            conversions = [conversion for conversion in self.conversions if conversion[1]["h5dns_path"] == h5dns_path]
+            # Artifact caches of the output directories of each conversion, shared by all timesteps
+            caches = [{cache_dir: get_cache(cache_dir) for cache_dir in cache_dirs} for _, _, _, cache_dirs in conversions]
+
+            data_field = timestep_fields(h5dns_path)
+            for tstep in range(max(tres for _, _, tres, _ in conversions)):
+                print("Converting timestep " + str(tstep) + " for " + str(len(conversions)) + " renders")
+                for (convert_tstep, convert_kwargs, tres, _), conversion_caches in zip(conversions, caches):
+                    if tstep < tres:
+                        convert_tstep(tstep=tstep, data_field=data_field, caches=conversion_caches, **convert_kwargs)
+            data_field.close()
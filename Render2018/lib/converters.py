@@ -1,20 +1,31 @@
 import numpy as np
 import mcubes
 from h5dns_load_data import *
+from brick_index import get_brick_index, get_brick_slices
+from frustum_cull import is_box_visible
+from vortex_fields import VELOCITY_FIELDS, compute_vortex_fields, get_vortex_fields
 from scipy.interpolate import RegularGridInterpolator
+import scipy.sparse
+from stage_timer import timed
 # Import matplotlib so it works on Mox
 import matplotlib as mpl
 mpl.use('Agg')
 import matplotlib.pyplot as plt, matplotlib.cm as cm
 plt.ioff() #http://matplotlib.org/faq/usage_faq.html (interactive mode)
 
-def convply2geo(ply_path):
+# Statistics of a case taken across all timesteps (see find_case_stats)
+CASE_STATS = ("vapor_max", "temp_prctiles")
+
+def convply2geo(ply_path, load_colors=False):
     """
     Loads geometry (vertices and triangles) from a .ply file and returns numpy arrays of vertices and triangles.
     :param ply_path: Directory and filename of .ply file.
-    :return: verts, tris: Vertices and triangles.
+    :param load_colors: Whether to also return the vertex colors in the file
+    :return: verts, tris, (vcolors if load_colors): Vertices, triangles, and vertex colors (None if the file has none).
     """
 
+    vcolors = None
+
     # Open .ply file
     with open(ply_path, "r") as ply:
         linenum = 0
@@ -34,6 +45,11 @@ def convply2geo(ply_path):
                 verts = np.zeros([num_verts, 3])
                 continue
 
+            # Check if vertices have colors
+            if line.startswith("property uchar red"):
+                vcolors = np.zeros([num_verts, 3], dtype=int)
+                continue
+
             if line.startswith("element face "):
                 num_tris = int(line.split()[-1])
 
@@ -48,7 +64,10 @@ def convply2geo(ply_path):
 
             # If in verts section, load them 
             if loading_verts:
-                verts[verti,:] = list(map(float,line.split()))[0:3]
+                vert_vals = line.split()
+                verts[verti,:] = list(map(float,vert_vals[0:3]))
+                if vcolors is not None:
+                    vcolors[verti,:] = list(map(int,vert_vals[3:6]))
                 verti += 1
                 if verti >= num_verts:
                     loading_verts = False
@@ -64,9 +83,12 @@ def convply2geo(ply_path):
 
             linenum += 1
 
+    if load_colors:
+        return verts, tris, vcolors
     return verts, tris
 
-def convgeo2ply(verts, tris, output_path_ply, vcolors=False):
+@timed()
+def convgeo2ply(verts, tris, output_path_ply, vcolors=False, verbose=True):
     """
     Saves geometry (vertices and triangles) in the .ply file format. This can be imported into Blender.
     :param verts: Vertices array
@@ -74,6 +96,8 @@ def convgeo2ply(verts, tris, output_path_ply, vcolors=False):
     :param output_path_ply: Path at which to save .ply file
     :param vcolors: (optional) vertex colors associated with each vert. Each color is in [R,G,B] format (each color is
     an int from 0 to 255), and each row corresponds to the vert in verts.
+    :param verbose: Print the path of the saved file. Callers that write to a temporary path and then move the file
+    into place print the final path themselves.
     """
         
     # Determine if vertex colors are provided - if so, include them in the .ply file
@@ -114,38 +138,72 @@ def convgeo2ply(verts, tris, output_path_ply, vcolors=False):
             triangle = tris[j,:]
             ply.write("3 " + np.array_str(triangle).strip("[ ]") + "\n")
 
-    print("Saved PLY file: " + output_path_ply)
+    if verbose:
+        print("Saved PLY file: " + output_path_ply)
 
-def find_max_vapor(h5dns_path):
+def find_case_stats(h5dns_path, stats=CASE_STATS):
     """
-    Finds the maximum YV (vapor) value across all timesteps and throughout the domain.
-    :param h5dns_path: Path to .h5dns with YV data
-    :return: max_val: Maximum vapor value (nondimensional)
+    Computes statistics of a case that are taken across all timesteps, in one pass over the timesteps: each timestep is
+    read once for all the requested statistics.
+    :param h5dns_path: Path to .h5dns file
+    :param stats: Names of the statistics to compute, from CASE_STATS:
+     vapor_max: Maximum YV (vapor) value across all timesteps and throughout the domain
+     temp_prctiles: Temperatures associated with many percentiles of temperature on the VOF interface (left column:
+     percentiles, right column: temperatures)
+    :return: Dictionary of statistic name -> value
     """
 
-    # Load h5dns file 
-    vofFieldInfo = field4Dlow(h5dns_path)
-    
-    # Iterate thru all tsteps to find max vapor value
+    # Load h5dns file
+    data_field = field4Dlow(h5dns_path)
+    index = get_brick_index(h5dns_path)
+
+    # Iterate thru all tsteps, reading the fields needed by all the statistics
     max_val = 0
-    for tstep in range(vofFieldInfo.tres):
-        
-        # Get field of vapor (YV) data on this timestep
-        u = vofFieldInfo.obtain3Dtimestep(tstep, "YV")
-        
-        # Get max value from field on this timestep
-        tstep_max_val = np.max(u)
+    vals = []
+    for tstep in range(data_field.tres):
+        print("Tstep: " + str(tstep))
+
+        if "vapor_max" in stats:
+            # Get max value of the vapor (YV) field on this timestep (as a Python float, since fields may be float32)
+            max_val = max(max_val, float(np.max(data_field.obtain3Dtimestep(tstep, "YV"))))
+
+        if "temp_prctiles" in stats:
+            vof_field = data_field.obtain3Dtimestep(tstep, "VOF")
+            t_field = data_field.obtain3Dtimestep(tstep, "Temperature")
+
+            # Remove all non-interface points from the percentile calculations since these points don't matter for
+            # surface temperature maps. Bricks that are entirely gas (VOF of 0) are skipped.
+            vof_mins, vof_maxs = index.get_bounds(tstep, "VOF", vof_field)
+            for brick in np.argwhere(vof_maxs > 0):
+                brick_slices = get_brick_slices(vof_field.shape, brick, overlap=False)
+                t_brick = t_field[brick_slices]
+                vals.append(t_brick[(vof_field[brick_slices] > 0) & (t_brick > 0.01)])
 
-        # Check if greater than the previous max value
-        if tstep_max_val > max_val:
-            max_val = tstep_max_val
-    
     # Close h5dns
-    vofFieldInfo.close()
-    
-    return max_val
+    data_field.close()
+
+    case_stats = {}
+    if "vapor_max" in stats:
+        case_stats["vapor_max"] = max_val
+    if "temp_prctiles" in stats:
+        # Determine percentile values
+        vals = np.concatenate(vals) if vals else np.zeros(0)
+        prctiles = np.arange(0,100,0.1)
+        case_stats["temp_prctiles"] = np.column_stack((prctiles, np.percentile(vals, prctiles)))
+
+    return case_stats
+
+def find_max_vapor(h5dns_path):
+    """
+    Finds the maximum YV (vapor) value across all timesteps and throughout the domain.
+    :param h5dns_path: Path to .h5dns with YV data
+    :return: max_val: Maximum vapor value (nondimensional)
+    """
+    return find_case_stats(h5dns_path, ["vapor_max"])["vapor_max"]
 
-def convyv2bvox(h5dns_path, output_path, tstep, vapor_min, vapor_max, fog_halved=False):
+@timed()
+def convyv2bvox(h5dns_path, output_path, tstep, vapor_min, vapor_max, fog_halved=False, view=None, data_field=None,
+                verbose=True):
     """
     Performs calculations to convert vapor (YV) data to voxel data (.bvox) readable by Blender, for a specific timestep
     :param h5dns_path: h5dns file within which to find YV data
@@ -154,25 +212,45 @@ def convyv2bvox(h5dns_path, output_path, tstep, vapor_min, vapor_max, fog_halved
     :param vapor_min: Minimum vapor value to render (point at which fog becomes visible)
     :param vapor_max: Maximum vapor value to render (maximum visual density in Blender)
     :param fog_halved: Export only half of the fog domain. In some cases renders of half of the domain are preferred, but Blender is bad at rendering only half of data when entire domain is given in the .bvox file
+    :param view: (optional) Camera settings to crop the fog to: bricks of voxels outside the view are left empty (see frustum_cull.get_culling_params)
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    :param verbose: Print the path of the saved file (see convgeo2ply)
     """
 
-    # Load h5dns file 
-    vofFieldInfo = field4Dlow(h5dns_path)
+    # Load h5dns file, unless already open
+    vofFieldInfo = data_field if data_field is not None else field4Dlow(h5dns_path)
 
     # Header of the BVOX file. This is how Blender knows data dimensions.
     header = np.array([vofFieldInfo.xres, vofFieldInfo.yres, vofFieldInfo.zres, 1])
 
-    # Get field of vapor (YV) data, normalized by max vapor value
-    u = vofFieldInfo.obtain3Dtimestep(tstep, "YV")/vapor_max
+    # Get field of vapor (YV) data
+    yv = vofFieldInfo.obtain3Dtimestep(tstep, "YV")
+
+    # Fog is only visible where vapor exceeds vapor_min, so only the bricks that contain such values are transformed. The
+    # fog field is stored in Fortran order, so that flattening it for Blender below does not copy it.
+    u = np.zeros(yv.shape, dtype="<f4", order="F")
+    brick_slices_list = [get_brick_slices(yv.shape, brick, overlap=False)
+                         for brick in get_brick_index(h5dns_path).get_bricks(tstep, "YV", yv, lower=vapor_min)]
+
+    # Crop the fog to the bricks within the view (each voxel extends half a cell around its grid point)
+    if view is not None and len(brick_slices_list) > 0:
+        visible = is_box_visible([[brick_slice.start - 0.5 for brick_slice in brick_slices] for brick_slices in brick_slices_list],
+                                 [[brick_slice.stop - 0.5 for brick_slice in brick_slices] for brick_slices in brick_slices_list], view)
+        brick_slices_list = [brick_slices for brick_slices, brick_visible in zip(brick_slices_list, visible) if brick_visible]
+
+    for brick_slices in brick_slices_list:
+
+        # Normalize by max vapor value, and make all negative values 0 - don't want to take a logarithm of a negative - will get -inf values, which will later be set to 0 again
+        u_brick = yv[brick_slices]/vapor_max
+        u_brick[u_brick < 0] = 0
+
+        # Perform fog intensity calculation. The logarithm of 0 is -inf, which is expected here, so don't warn about it.
+        with np.errstate(divide="ignore"):
+            u_brick = 1 - np.log10(u_brick)/np.log10(vapor_min/vapor_max)
 
-    # Make all negative values in the field 0 - don't want to take a logarithm of a negative - will get -inf values, which will later be set to 0 again
-    u[u < 0] = 0 
-    
-    # Perform fog intensity calculation
-    u = 1 - np.log10(u)/np.log10(vapor_min/vapor_max) # TODO: find computationally fastest way to perform this operation. or just re-write it in C++...
-    
-    # Remove all <0 values including -inf
-    u[u < 0] = 0
+        # Remove all <0 values including -inf
+        u_brick[u_brick < 0] = 0
+        u[brick_slices] = u_brick
 
     # Perform halving if enabled
     if fog_halved:
@@ -184,32 +262,129 @@ def convyv2bvox(h5dns_path, output_path, tstep, vapor_min, vapor_max, fog_halved
     # Save as BVOX file (binary)
     binfile = open(output_path, "wb")
     header.astype("<i4").tofile(binfile)
-    vdata.astype("<f4").tofile(binfile)
+    vdata.tofile(binfile)
     binfile.close()
-    print("Saved fog file: " + output_path)
+    if verbose:
+        print("Saved fog file: " + output_path)
 
-    # Close h5dns
-    vofFieldInfo.close()
+    # Close h5dns, if opened here
+    if data_field is None:
+        vofFieldInfo.close()
 
-def convvof2geo(h5dns_path, tstep, interface_value = 0.8):
+@timed()
+def convvof2geo(h5dns_path, tstep, interface_value = 0.8, vof_field=None):
     """
     Finds fluid interface in VOF data and exports as geometry, for a specific timestep. The Marching Cubes algorithm
     is used to extract interface geometry from the VOF field.
     :param h5dns_path: h5dns file within which to find VOF data
     :param tstep: Timestep from which to export interface geometry
     :param interface_value: VOF value between 0 and 1 at which to draw surface. 0.8 seems to work well to minimize blockiness
+    :param vof_field: (optional) The VOF field of the timestep, in [i,j,k] order, if already loaded
     :return: vertices, triangles: Numpy arrays of geometry (vertices and triangles)
     """
 
-    # Load h5dns file
-    vofFieldInfo = field4Dlow(h5dns_path)
+    # Get field of VOF data from the h5dns file, unless already loaded
+    u = vof_field
+    if u is None:
+        vofFieldInfo = field4Dlow(h5dns_path)
+        u = vofFieldInfo.obtain3Dtimestep(tstep, "VOF")
+        vofFieldInfo.close()
+
+    # Use Marching Cubes on VOF field to obtain interface geometry, only on the bricks that the interface passes through
+    vertices = [np.zeros((0, 3))]
+    triangles = [np.zeros((0, 3), dtype=np.int64)]
+    num_verts = 0
+    for brick in get_brick_index(h5dns_path).get_bricks(tstep, "VOF", u, lower=interface_value, upper=interface_value):
+        brick_slices = get_brick_slices(u.shape, brick)
+        brick_vertices, brick_triangles = mcubes.marching_cubes(u[brick_slices], interface_value)  # (u = 3D VOF field, interface_value = value at which to generate isosurface)
+        vertices.append(brick_vertices + [brick_slice.start for brick_slice in brick_slices])
+        triangles.append(brick_triangles + num_verts)
+        num_verts += len(brick_vertices)
+
+    # Stitch the geometry of the bricks together by merging the vertices they share on their faces
+    return weld_geo(np.concatenate(vertices), np.concatenate(triangles))
+
+def weld_geo(verts, tris, tolerance=1E-6):
+    """
+    Merges duplicate vertices, such as the coincident vertices emitted by marching cubes on adjacent cells, so that
+    triangles share vertices and the mesh is connected. Triangles that collapse as a result are removed. Equivalent to
+    Blender's "remove doubles" operation.
+    :param verts: Vertices array
+    :param tris: Triangles array
+    :param tolerance: Vertices closer than this distance (in grid units) are merged
+    :return: verts, tris: Welded vertices and triangles
+    """
+
+    # Snap vertices to a grid of the tolerance size so that nearly coincident vertices have identical keys
+    keys = np.round(np.asarray(verts)/tolerance).astype(np.int64)
+
+    # Find unique vertices and the new index of every original vertex
+    _, unique_ids, inverse = np.unique(keys, axis=0, return_index=True, return_inverse=True)
+    verts = np.asarray(verts)[unique_ids]
+    tris = inverse.reshape(-1)[np.asarray(tris, dtype=np.int64)]
 
-    # Get field of VOF data
-    u = vofFieldInfo.obtain3Dtimestep(tstep, "VOF")
-    
-    # Use Marching Cubes on VOF field to obtain interface geometry.
-    vertices, triangles = mcubes.marching_cubes(u, interface_value)  # (u = 3D VOF field, interface_value = value at which to generate isosurface)
-    return vertices, triangles
+    # Remove degenerate triangles (two or more corners merged into the same vertex)
+    valid = (tris[:,0] != tris[:,1]) & (tris[:,1] != tris[:,2]) & (tris[:,2] != tris[:,0])
+
+    return verts, tris[valid]
+
+def get_vert_adjacency(num_verts, tris):
+    """
+    Builds the row-normalized vertex adjacency matrix of a triangle mesh, such that multiplying it with the vertices
+    array gives the average of the neighbors of each vertex.
+    :param num_verts: Number of vertices in the mesh
+    :param tris: Triangles array
+    :return: Sparse (num_verts x num_verts) adjacency matrix
+    """
+
+    # Each triangle contributes its three edges, in both directions
+    tris = np.asarray(tris, dtype=np.int64)
+    rows = np.concatenate((tris[:,0], tris[:,1], tris[:,2], tris[:,1], tris[:,2], tris[:,0]))
+    cols = np.concatenate((tris[:,1], tris[:,2], tris[:,0], tris[:,0], tris[:,1], tris[:,2]))
+
+    # Edges shared by two triangles are summed when converting, so reset all entries to 1
+    adjacency = scipy.sparse.coo_matrix((np.ones(len(rows)), (rows, cols)), shape=(num_verts, num_verts)).tocsr()
+    adjacency.data[:] = 1
+
+    # Vertices that are not part of any triangle keep their own position
+    num_neighbors = np.asarray(adjacency.sum(axis=1)).flatten()
+    isolated = np.flatnonzero(num_neighbors == 0)
+    if len(isolated) > 0:
+        adjacency = adjacency + scipy.sparse.coo_matrix((np.ones(len(isolated)), (isolated, isolated)), shape=(num_verts, num_verts)).tocsr()
+        num_neighbors[isolated] = 1
+
+    # Normalize each row so that it averages the neighboring vertices
+    return scipy.sparse.diags(1.0/num_neighbors) @ adjacency
+
+@timed()
+def smooth_geo(verts, tris, iterations=10, factor=0.5, method="laplacian", taubin_mu=-0.53):
+    """
+    Smooths geometry by iteratively moving each vertex toward the average of its neighbors. Used to remove the blocky
+    appearance of geometry exported by the marching cubes algorithm. The defaults (10 iterations, factor 0.5) reproduce
+    the Smooth modifier that was previously applied in Blender (smooth_geom.py), since Blender's modifier at factor 1
+    moves each vertex to the average of its edge midpoints. Taubin smoothing alternates a shrinking and an inflating step
+    so that droplets do not lose volume.
+    :param verts: Vertices array (should be welded first, see weld_geo)
+    :param tris: Triangles array
+    :param iterations: Number of smoothing iterations
+    :param factor: Fraction of the distance to the neighbor average to move each vertex per iteration
+    :param method: "laplacian" or "taubin"
+    :param taubin_mu: Inflation factor of the second Taubin step (must be negative, with magnitude larger than factor)
+    :return: verts: Smoothed vertices (triangles are unchanged)
+    """
+
+    if method not in ("laplacian", "taubin"):
+        raise ValueError("Unknown smoothing method: " + str(method))
+
+    # Build the averaging operator once, then apply it with sparse matrix products
+    adjacency = get_vert_adjacency(len(verts), tris)
+    verts = np.array(verts, dtype=float)
+    for iteration in range(iterations):
+        verts += factor*(adjacency @ verts - verts)
+        if method == "taubin":
+            verts += taubin_mu*(adjacency @ verts - verts)
+
+    return verts
 
 def get_temp_prctiles(h5dns_path, save_dir):
     """
@@ -219,39 +394,47 @@ def get_temp_prctiles(h5dns_path, save_dir):
     :return: Percentile data: Left column contains percentiles, right column contains associated values
     """
 
-    # Get temperature values at VOF interface
-    data_field = field4Dlow(h5dns_path)
-    tsteps = data_field.tres
-
-    vals = []
-    # Iterate through each timestep to retrieve all temperature data points on fluid interface
-    for tstep in range(tsteps):
-        print("Tstep: " + str(tstep))
-        vof_field = data_field.obtain3Dtimestep(tstep, "VOF")
-        t_field = data_field.obtain3Dtimestep(tstep, "Temperature")
-    
-        # Remove all non-interface points from the percentile calculations since these points don't matter for surface temperature maps
-        vof_field[vof_field > 0] = 1
-        t_field_vals = np.multiply(t_field, vof_field).flatten()
-        for val in t_field_vals:
-            if val > 0.01:
-                vals.append(val)
-
-    # Determine percentile values
-    prctiles = np.arange(0,100,0.1)
-    prctile_vals = np.zeros(len(prctiles))
-    for i in range(len(prctiles)):
-        prctile = prctiles[i]
-        prctile_val = np.percentile(vals, prctile)
-        prctile_vals[i] = prctile_val
+    # Get percentiles of temperature values at VOF interface
+    output_data = find_case_stats(h5dns_path, ["temp_prctiles"])["temp_prctiles"]
 
     # Save percentile data
-    output_data = np.column_stack((prctiles, prctile_vals))
     np.savetxt(save_dir, output_data)
 
     # Return percentile data
     return output_data
 
+@timed()
+def get_color_field(data_field, tstep, field_name="Temperature"):
+    """
+    Reads the scalar field that surface colors are sampled from.
+    :param data_field: Open field4Dlow of the data file
+    :param tstep: Timestep
+    :param field_name: Scalar field, e.g. "Temperature"
+    :return: 3D scalar field, indexed [i,j,k]
+    """
+    color_field = data_field.obtain3Dtimestep(tstep, field_name)
+    if field_name == "Temperature":
+        # Not modified in place, since the data field may be shared with other converters (see convert_sweep)
+        color_field = np.where(color_field == 1.0, 0.0, color_field)
+    return color_field
+
+def get_vert_colors(color_field, vertices, lower_bound, upper_bound):
+    """
+    Determines colors at each vertex by trilinear interpolation of a scalar field, for all vertices at once. Colors are
+    determined using matplotlib's Inferno colorbar, which is perceptually uniform (can be converted to grayscale).
+    :param color_field: 3D scalar field, indexed [i,j,k] (see get_color_field)
+    :param vertices: vertices at which to extract data, in grid coordinates
+    :param lower_bound: Lowest value on colorbar
+    :param upper_bound: Highest value on colorbar
+    :return: colors: Array of colors associated with each vertex.
+    """
+
+    # Create 3D interpolator of the field, and interpolate nearby points on grid at every vertex
+    interpolator = RegularGridInterpolator(tuple(range(res) for res in color_field.shape), color_field)
+    values = interpolator(np.asarray(vertices, dtype=float).reshape(-1, 3))
+
+    return (cm.inferno((values - lower_bound)/(upper_bound - lower_bound))[:,0:3]*255).astype(int)
+
 def convvert2color(h5dns_path, vertices, lower_bound, upper_bound, tstep):
     """
     Given an array of vertices, determines surface tempmap colors at each vertex by interpolating temperature data.
@@ -264,38 +447,14 @@ def convvert2color(h5dns_path, vertices, lower_bound, upper_bound, tstep):
     :return: colors: Array of colors associated with each vertex.
     """
 
-    # Load h5dns file
-    vof_field_info = field4Dlow(h5dns_path)
-
-    # Create trilinear interpolation grid
-    xvals = range(vof_field_info.xres)
-    yvals = range(vof_field_info.yres)
-    zvals = range(vof_field_info.zres)
- 
     # Get temperature field
-    t_field = vof_field_info.obtain3Dtimestep(tstep, "Temperature")
-    t_field[t_field == 1.0] = 0.0
-    print("Is this 0? : " + str(t_field[5,5,5]))
-
-    # Create 3D interpolator for this timestep
-    temp_interpolator = RegularGridInterpolator((xvals, yvals, zvals), t_field)
-
-    # Allocate colors array
-    colors = np.zeros([np.shape(vertices)[0], 3], dtype=int)
-
-    # Loop through all verts
-    verti = 0
-    for vert in vertices:
-        # Interpolate nearby temperature points on grid
-        temperature = temp_interpolator(vert)[0] # temp_interpolator returns an array of length 1 for some unknown reason, so the [0] just gets this single element
-        # Add color for corresponding vert to array
-        colors[verti,:] = (np.array(cm.inferno((temperature - lower_bound) / (upper_bound - lower_bound))[0:3])*255).astype(int)
-        verti += 1
-
+    vof_field_info = field4Dlow(h5dns_path)
+    t_field = get_color_field(vof_field_info, tstep, "Temperature")
     vof_field_info.close()
 
-    return colors
+    return get_vert_colors(t_field, vertices, lower_bound, upper_bound)
 
+@timed()
 def lambda2_extract(h5dns_filepath, tstep):
     """
     Calculates the lambda2 field from the cartesian velocity field at a specific timestep.
@@ -306,53 +465,30 @@ def lambda2_extract(h5dns_filepath, tstep):
 
     # Load h5dns data
     vofFieldInfo = field4Dlow(h5dns_filepath)
-    u = vofFieldInfo.obtain3Dtimestep(tstep, "XVelocity")
-    v = vofFieldInfo.obtain3Dtimestep(tstep, "YVelocity")
-    w = vofFieldInfo.obtain3Dtimestep(tstep, "ZVelocity")
-
-    # Take velocity gradients
-    gradu = np.gradient(u) # [d/dx(u), d/dy(u), d/dz(u)]
-    gradv = np.gradient(v)
-    gradw = np.gradient(w)
-
-    # Determine J and Jt (J transposed) for each point
-    J = np.array([gradu, gradv, gradw])
-    Jt = np.transpose(J,(1,0,2,3,4))
-
-    # Determine S, Omega
-    S = (J+Jt)/2
-    Omega = (J-Jt)/2
-
-    # Move axes around to get last 2 as the ones to multiply
-    Sm = np.moveaxis(S,(0,1,2,3,4),(3,4,0,1,2))
-    Omegam = np.moveaxis(Omega,(0,1,2,3,4),(3,4,0,1,2))
-
-    # Square "Last 2" indices using matrix multiplication
-    eigmat = np.matmul(Sm,Sm) + np.matmul(Omegam,Omegam)
-
-    # Find eigenvalues of "Last 2" index matrices, sort ascending to descending
-    eigvalmat = np.sort(np.linalg.eigvals(eigmat))
-
-    # Separate second eigenvalue
-    lambda2vals = eigvalmat[:,:,:,1]
-
-    # Close h5dns data
+    velocity = [vofFieldInfo.obtain3Dtimestep(tstep, component) for component in VELOCITY_FIELDS]
     vofFieldInfo.close()
 
-    return lambda2vals
+    # Compute lambda2 from the velocity gradients (see vortex_fields)
+    return compute_vortex_fields(*velocity, ["Lambda2"])["Lambda2"]
 
-def convlambda22geo(h5dns_path, tstep, level):
+def convlambda22geo(h5dns_path, tstep, level, field_name="Lambda2", cached_fields=(), data_field=None):
     """
-    Creates geometry from lambda2 contours at specified level at a specific timestep. Finds lambda2 contours using velocity
-    field, then uses marching cubes to convert it to geometry.
+    Creates geometry from contours of a vortex identification field (lambda2 by default) at specified level at a
+    specific timestep. Gets the field from the derived field cache, or computes it from the velocity field, then uses
+    marching cubes to convert it to geometry.
     :param h5dns_path: Path to h5dns file with velocity data
     :param tstep: Timestep to convert
-    :param level: Lambda2 level to find contours at (must be negative)
+    :param level: Level to find contours at (must be negative for lambda2)
+    :param field_name: Field to contour, from vortex_fields.VORTEX_FIELDS
+    :param cached_fields: (optional) Other vortex identification fields to compute in the same pass and cache for later
+    renders
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
     :return: verts, tris: Vertices and triangles of contour geometry.
     """
 
     # Run marching cubes for the level specified by the user
-    u = lambda2_extract(h5dns_path, tstep)
+    field_names = [field_name] + [cached_field for cached_field in cached_fields if cached_field != field_name]
+    u = get_vortex_fields(h5dns_path, tstep, field_names, data_field=data_field)[field_name]
     verts, tris = mcubes.marching_cubes(u, level)
     return verts, tris
 
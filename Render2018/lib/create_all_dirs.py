@@ -1,11 +1,13 @@
 import configparser
 from dircheck import check_make, absolutify
 
-def create_all(case_name):
+def create_all(case_name, case_output=None):
     """
     Creates all the directories necessary for a specific .h5dns case, that are not specific to certain rendering
     settings (these directories are created separately)
     :param case_name: User-specified name of case that corresponds to .h5dns file
+    :param case_output: (optional) Main output directory to create the case directories in, instead of the one of the
+    case in RenderOutput (used for preview renders)
     """
 
     # Load directory name settings
@@ -13,20 +15,21 @@ def create_all(case_name):
     dirname_config.read("dirname.cfg")
 
     # Construct all directory paths and put them in an array
-    case_namesl = case_name + "/"
-    render_output_dir = dirname_config["DIRECTORIES"]["RenderOutput"]
+    if case_output is None:
+        case_output = dirname_config["DIRECTORIES"]["RenderOutput"] + case_name + "/"
     dirs = [] 
     dirs.append(dirname_config["DIRECTORIES"]["RenderConfig"])
     dirs.append(dirname_config["DIRECTORIES"]["RenderJobscripts"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["geometry_data"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["image_output"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["ply"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["bvox"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["ply_temp"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["ply_lambda2"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["ply_streamline"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["tstep_sequence_photorealistic"])
-    dirs.append(render_output_dir + case_namesl + dirname_config["DIRECTORIES"]["ply_vortexline"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["geometry_data"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["image_output"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["ply"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["bvox"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["ply_temp"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["ply_lambda2"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["ply_streamline"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["tstep_sequence_photorealistic"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["ply_vortexline"])
+    dirs.append(case_output + dirname_config["DIRECTORIES"]["ply_isosurf"])
 
     # Check if all dirs exist, and if not, make them
     check_make(dirs)
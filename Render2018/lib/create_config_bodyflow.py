@@ -64,7 +64,7 @@ else:
 
 # Get render-specific config settings from user. This specifies what type of render to perform (photorealistic, surface
 # temperature, ...), and other render settings (scale of droplet to render, etc.)
-render_type = int(input("Select type of render to perform (enter number).\n 1  Streamline render\n 2  Vortex line render\n"))
+render_type = int(input("Select type of render to perform (enter number).\n 1  Streamline render\n 2  Vortex line render\n 3  Isosurface render\n"))
 render_name = input("Enter render profile name. This can be any string that refers to specific rendering settings for a data case. ")
 
 # Initialize categories based on data types
@@ -84,9 +84,24 @@ if (render_type == 1): # Streamline
 elif (render_type == 2): # Vortex line
     render_config_path = dirname_config["DIRECTORIES"]["RenderConfig"] + render_name + "-render-vortexline.cfg"
 
+elif (render_type == 3): # Isosurface
+    render_config_path = dirname_config["DIRECTORIES"]["RenderConfig"] + render_name + "-render-isosurf.cfg"
+    new_render_config["STRING"]["isosurf_field"] = input("Specify name of scalar field to draw isosurface of (for example, Lambda2): ")
+    new_render_config["FLOAT"]["isosurf_level"] = input("Specify value of the field at which to draw isosurface: ")
+    # Isosurfaces are extracted on the curvilinear grid, unless resampling to a Cartesian grid is requested
+    if get_yesno_input("Extract isosurface on the curvilinear grid (otherwise resample to a Cartesian grid)? "):
+        new_render_config["STRING"]["isosurf_method"] = "curvilinear"
+    else:
+        new_render_config["STRING"]["isosurf_method"] = "cartesian"
+        new_render_config["STRING"]["cart_bounds"] = input("Specify xmin,xmax,ymin,ymax,zmin,zmax of the Cartesian grid (for example, 0,30,0,11,0,11): ")
+        new_render_config["FLOAT"]["cart_spacing"] = input("Specify spacing of the Cartesian grid: ")
+
+# Streamline inputs
+if render_type in (1, 2):
+    new_render_config["INT"]["num_streamlines"] = input("Specify number of streamlines: ")
+    new_render_config["INT"]["streamline_seed"] = "777" #input("Specify random seed number to determine streamline start positions from: ")
+
 # General inputs
-new_render_config["INT"]["num_streamlines"] = input("Specify number of streamlines: ")
-new_render_config["INT"]["streamline_seed"] = "777" #input("Specify random seed number to determine streamline start positions from: ")
 new_render_config["FLOAT"]["view_fraction"] = input("Specify desired render frame width as multiple of domain length: ")
 new_render_config["FLOAT"]["camera_azimuth_angle"] = input("Specify camera azimuth angle from the x-axis (deg): ")
 new_render_config["FLOAT"]["camera_elevation_angle"] = input("Specify camera elevation angle from the horizontal (deg): ")
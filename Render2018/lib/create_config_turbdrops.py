@@ -1,10 +1,11 @@
 import os.path
 import configparser
 from dircheck import get_yesno_input
-from create_jobscripts import create_mox_slurm, create_local_py
+from create_jobscripts import create_mox_slurm, create_local_py, create_mox_slurm_array, run_slurm_array_local
 from create_dirname_config import config_dirname_cfg
 from create_all_dirs import create_all
 import h5dns_load_data 
+import field_store
 import socket
 # Script that creates the two configuration files (case and render files) necessary to run the scripts, with a data file from Michael or Pablo's droplet simulations as input.
 
@@ -64,6 +65,11 @@ else:
     with open(case_config_path, "w") as case_config_file:
         new_case_config.write(case_config_file)
 
+    # Transcode the .h5dns file once into a store that is faster to read during renders (can also be done later with
+    # "python field_store.py <h5dns path>" or "render_init.py --ingest")
+    if get_yesno_input("Ingest .h5dns file into a render-optimized store (compressed float32 copy, read faster by all renders)? "):
+        field_store.ingest(h5dns_path)
+
 # Get render-specific config settings from user. This specifies what type of render to perform (photorealistic, surface
 # temperature, ...), and other render settings (scale of droplet to render, etc.)
 render_type = int(input("Select type of render to perform (enter number).\n 1  Photorealistic render\n 2  Surface temperature render\n 3  Lambda2 render \n"))
@@ -93,6 +99,16 @@ if (render_type == 1): # Photorealistic
         new_render_config["BOOL"]["fog_half_enabled"] = str(get_yesno_input("Split fog in half? "))
     new_render_config["BOOL"]["interface_half_enabled"] = str(get_yesno_input("Split droplet in half? "))
 
+    # Determine whether to reuse the geometry and images of frames in which the droplet has barely changed
+    if get_yesno_input("Reuse frames in which the droplet has barely changed since an earlier frame? "):
+        new_render_config["FLOAT"]["static_threshold"] = input("Specify largest mean change of VOF per coarse grid cell for a frame to be reused (for example, 1E-4): ")
+
+    # Determine whether to overlap data conversion with rendering
+    pipeline_enabled = get_yesno_input("Convert data while rendering (pipeline mode)? ")
+    new_render_config["BOOL"]["pipeline_enabled"] = str(pipeline_enabled)
+    if pipeline_enabled:
+        new_render_config["INT"]["pipeline_workers"] = input("Specify number of data conversion processes: ")
+
 elif (render_type == 2): # Surface temp map
     render_config_path = dirname_config["DIRECTORIES"]["RenderConfig"] + render_name + "-render-surf_temp.cfg"
     new_render_config["FLOAT"]["droplet_scale"] = input("Specify desired visible droplet diameter as a fraction of render frame width: ")
@@ -108,6 +124,10 @@ elif (render_type == 2): # Surface temp map
     if add_temp_bar:
         new_render_config["BOOL"]["add_temp_bar"] = str(add_temp_bar)
 
+    # Determine whether to reuse the geometry and images of frames in which the droplet has barely changed
+    if get_yesno_input("Reuse frames in which the droplet has barely changed since an earlier frame? "):
+        new_render_config["FLOAT"]["static_threshold"] = input("Specify largest mean change of VOF and temperature per coarse grid cell for a frame to be reused (for example, 1E-4): ")
+
 elif (render_type == 3): # Lambda2 contours
     render_config_path = dirname_config["DIRECTORIES"]["RenderConfig"] + render_name + "-render-lambda2.cfg"
 
@@ -117,12 +137,20 @@ elif (render_type == 3): # Lambda2 contours
     # Ask whether to get lambda2 data directly or convert from velocity field  TODO: actually implement this
     # new_render_config["BOOL"]["lambda2_direct"] = str(get_yesno_input("Get lambda2 data directly from the .h5dns file? (if no, will convert from velocity data) "))
 
-    # Get lambda2 contour level
-    new_render_config["FLOAT"]["lambda2_level"] = input("Specify lambda2 contour level to render (must be negative): ")
+    # Get field to contour (all are computed from the same velocity gradients, see vortex_fields) and contour level
+    new_render_config["STRING"]["vortex_field"] = input("Specify field to contour (Lambda2, Q, VorticityMagnitude or SwirlingStrength): ")
+    new_render_config["FLOAT"]["lambda2_level"] = input("Specify contour level to render (must be negative for Lambda2): ")
+
+    # Other fields to compute in the same pass and cache next to the .h5dns file, for later renders of them
+    new_render_config["STRING"]["vortex_cache_fields"] = input("Specify other fields to compute and cache, separated by commas (leave blank for none): ")
 
 # General inputs
 new_render_config["FLOAT"]["camera_azimuth_angle"] = input("Specify camera azimuth angle from the x-axis (deg): ")
 new_render_config["FLOAT"]["camera_elevation_angle"] = input("Specify camera elevation angle from the horizontal (deg): ")
+
+# Determine whether to render each frame from several camera views (each frame is loaded once for all views)
+if get_yesno_input("Render each frame from several camera views? "):
+    new_render_config["STRING"]["views"] = input("Specify views as azimuth,elevation,view fraction, separated by semicolons (for example, \"0,0,2;90,30,1.5\"): ")
 bg_image_enabled = get_yesno_input("Use custom background image? ")
 if bg_image_enabled:
     new_render_config["STRING"]["bg_image_filepath"] = dirname_config["DIRECTORIES"]["background_images"] + input("Specify background image name (in \"Render2018/BackgroundImages\"): ")
@@ -134,20 +162,48 @@ else:
     new_render_config["STRING"]["bg_color_2"] = input("Specify R,G,B value of upper background color (separate floats by commas, values range from 0 to 1): ")
 new_render_config["FLOAT"]["resolution_percentage"] = input("Specify resolution percentage out of 100, as a percentage of 4K: ")
 
+# Determine whether to decimate exported geometry to the detail the render can resolve
+if get_yesno_input("Decimate geometry to the detail visible at this resolution? "):
+    new_render_config["FLOAT"]["decimate_pixel_error"] = input("Specify largest allowed change of the surface, in pixels (for example, 0.5): ")
+    new_render_config["INT"]["max_triangles"] = input("Specify largest number of triangles per frame (0 for no limit): ")
+
+# Determine whether to leave out geometry and fog outside the view of the camera
+new_render_config["BOOL"]["frustum_cull_enabled"] = str(get_yesno_input("Remove geometry and fog outside the camera view before export (for zoomed-in renders)? "))
+if new_render_config["BOOL"]["frustum_cull_enabled"] == "True":
+    new_render_config["FLOAT"]["frustum_margin"] = input("Specify margin kept around the view, as a fraction of the frame width (for example, 0.25 to keep geometry seen in reflections): ")
+
+# Determine whether to store geometry in one file per directory instead of one .ply file per frame
+new_render_config["BOOL"]["mesh_archive_enabled"] = str(get_yesno_input("Store geometry of all frames in a single mesh archive file instead of .ply files (fewer files on scratch filesystems)? "))
+if new_render_config["BOOL"]["mesh_archive_enabled"] == "True":
+    new_render_config["BOOL"]["mesh_archive_quantized"] = str(get_yesno_input("Store archived geometry with 16-bit quantized vertices (around a third of the size)? "))
+
 # Write render config file
 with open(render_config_path, "w") as render_config_file:
     new_render_config.write(render_config_file)
 
+# Determine whether to split the render over several jobs (one conversion job, a job array of render tasks that each
+# render a subset of the frames, and a final compositing job)
+num_shards = int(input("Specify number of render jobs to split frames over (1 for a single job): "))
+
 # Create slurm jobscript to run on Mox
 slurm_name = case_name + "_" + render_name + ".slurm"
-create_mox_slurm(slurm_dir=dirname_config["DIRECTORIES"]["RenderJobscripts"], slurm_name=slurm_name, job_name=case_name+"_"+render_name, lib_dir=os.getcwd(), python_file_to_run="render_init.py", case_config_path=case_config_path, render_config_path=render_config_path)
+if num_shards > 1:
+    convert_name, render_name_slurm, composite_name, submit_name = create_mox_slurm_array(slurm_dir=dirname_config["DIRECTORIES"]["RenderJobscripts"], slurm_name=slurm_name, job_name=case_name+"_"+render_name, lib_dir=os.getcwd(), python_file_to_run="render_init.py", case_config_path=case_config_path, render_config_path=render_config_path, num_shards=num_shards)
+else:
+    create_mox_slurm(slurm_dir=dirname_config["DIRECTORIES"]["RenderJobscripts"], slurm_name=slurm_name, job_name=case_name+"_"+render_name, lib_dir=os.getcwd(), python_file_to_run="render_init.py", case_config_path=case_config_path, render_config_path=render_config_path)
 local_py_name = case_name + "_" + render_name + ".py"
 create_local_py(python_dir=dirname_config["DIRECTORIES"]["RenderJobscripts"], python_filename=local_py_name, lib_dir=dirname_config["DIRECTORIES"]["lib"], python_file_to_run="render_init.py", case_config_path=case_config_path, render_config_path=render_config_path)
 
 # Run jobscript
 if mox:
-    if get_yesno_input("Run " + slurm_name + " to launch this rendering job?"):
+    if num_shards > 1:
+        if get_yesno_input("Run " + submit_name + " to launch this rendering job?"):
+            os.system("bash " + dirname_config["DIRECTORIES"]["RenderJobscripts"] + "/" + submit_name)
+    elif get_yesno_input("Run " + slurm_name + " to launch this rendering job?"):
         os.system("sbatch -p ferrante -A ferrante " + dirname_config["DIRECTORIES"]["RenderJobscripts"] + "/" + slurm_name)
 else:
-    if get_yesno_input("Run " + local_py_name + " to launch this rendering job?"):
+    if num_shards > 1:
+        if get_yesno_input("Run the jobscripts of this rendering job locally?"):
+            run_slurm_array_local(slurm_dir=dirname_config["DIRECTORIES"]["RenderJobscripts"], convert_name=convert_name, render_name=render_name_slurm, composite_name=composite_name, num_shards=num_shards, lib_dir=os.getcwd())
+    elif get_yesno_input("Run " + local_py_name + " to launch this rendering job?"):
         os.system("python3 " + dirname_config["DIRECTORIES"]["RenderJobscripts"] + local_py_name) 
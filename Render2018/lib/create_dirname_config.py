@@ -21,11 +21,13 @@ def config_dirname_cfg():
     dirname_config["DIRECTORIES"]["ply_lambda2"] = geometry_data_dir + "ply_lambda2/"
     dirname_config["DIRECTORIES"]["ply_streamline"] = geometry_data_dir + "ply_streamline/"
     dirname_config["DIRECTORIES"]["ply_vortexline"] = geometry_data_dir + "ply_vortexline/"
+    dirname_config["DIRECTORIES"]["ply_isosurf"] = geometry_data_dir + "ply_isosurf/"
     dirname_config["DIRECTORIES"]["tstep_lambda2"] = image_output_dir + "tstep_lambda2/"
     dirname_config["DIRECTORIES"]["tstep_sequence_photorealistic"] = image_output_dir + "photorealistic_tstep_sequence/"
     dirname_config["DIRECTORIES"]["tstep_sequence_surftempmap"] = image_output_dir + "surftempmap_tstep_sequence/"
     dirname_config["DIRECTORIES"]["tstep_streamline"] = image_output_dir + "tstep_streamline/"
     dirname_config["DIRECTORIES"]["tstep_vortexline"] = image_output_dir + "tstep_vortexline/"
+    dirname_config["DIRECTORIES"]["tstep_isosurf"] = image_output_dir + "tstep_isosurf/"
     dirname_config["DIRECTORIES"]["animations"] = image_output_dir + "animations/" # TODO: The animations functionality hasn't been properly implemented into this version of the rendering scripts
     dirname_config["DIRECTORIES"]["RenderHome"] = absolutify(".", slash_at_end=True)
     dirname_config["DIRECTORIES"]["BlenderHome"] = absolutify("/Blender/", slash_at_end=True)
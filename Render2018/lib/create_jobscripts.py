@@ -1,3 +1,6 @@
+import os
+import subprocess
+
 def create_mox_slurm(slurm_dir, slurm_name, job_name, lib_dir, python_file_to_run, case_config_path, render_config_path):
     """
     Creates slurm file that can be used to run a particular rendering script job on Mox.
@@ -33,3 +36,104 @@ def create_local_py(python_dir, python_filename, lib_dir, python_file_to_run, ca
         python_file.write("import os\n")
         python_file.write("os.chdir(\"" + lib_dir + "\")\n")
         python_file.write("os.system(\"python3 " + lib_dir + "/" + python_file_to_run + " -c " + case_config_path + " -r " + render_config_path + "\")")
+
+def create_mox_slurm_array(slurm_dir, slurm_name, job_name, lib_dir, python_file_to_run, case_config_path, render_config_path, num_shards, shard_mode="interleaved"):
+    """
+    Creates the jobscripts of a render that is split over several jobs on Mox: one job that converts the data, a job
+    array of num_shards tasks that each render a subset (shard) of the frames, and a final job that composites the
+    images (adds colorbars etc.). Also creates a shell script that submits the three with dependencies, so that each
+    starts only when the previous one has finished successfully.
+    :param slurm_dir: Directory in which to save jobscripts
+    :param slurm_name: Base name of jobscripts (".slurm" extension is replaced by the stage name)
+    :param job_name: Name of job
+    :param lib_dir: Directory from which rendering scripts are run (lib directory).
+    :param case_config_path: Directory to case config file to use
+    :param render_config_path: Directory to render config file to use
+    :param num_shards: Number of render tasks in the job array
+    :param shard_mode: How frames are split into shards: "interleaved" or "contiguous" (see get_shard_frames)
+    :return: Names of the convert, render and composite jobscripts, and of the submit script
+    """
+    base_name = slurm_name[:-len(".slurm")] if slurm_name.endswith(".slurm") else slurm_name
+    run_command = "python " + python_file_to_run + " -c " + case_config_path + " -r " + render_config_path
+    slurm_names = {}
+
+    for stage in ["convert", "render", "composite"]:
+        slurm_names[stage] = base_name + "_" + stage + ".slurm"
+        with open(slurm_dir + "/" + slurm_names[stage], "w") as jobscript:
+            jobscript.write("#!/bin/bash\n")
+            jobscript.write("#SBATCH --job-name=" + job_name + "_" + stage + "\n")
+            jobscript.write("#SBATCH --nodes=1\n")
+            jobscript.write("#SBATCH --time=24:00:00\n")
+            jobscript.write("#SBATCH --mem=50G\n")
+            jobscript.write("#SBATCH --workdir=" + lib_dir + "\n")
+            if stage == "render":
+                jobscript.write("#SBATCH --array=0-" + str(num_shards - 1) + "\n")
+            jobscript.write("export PATH=$PATH:/gscratch/ferrante/blender/blender-2.78c-linux-glibc219-x86_64/\n")  # Add Blender directory
+            if stage == "render":
+                jobscript.write(run_command + " --stage render --shard $SLURM_ARRAY_TASK_ID --num-shards " + str(num_shards) + " --shard-mode " + shard_mode + "\n")
+            else:
+                jobscript.write(run_command + " --stage " + stage + "\n")
+
+    # Submit script: each job depends on the successful completion of the previous one (all tasks, for the job array)
+    submit_name = base_name + "_submit.sh"
+    with open(slurm_dir + "/" + submit_name, "w") as submit_script:
+        submit_script.write("#!/bin/bash\n")
+        submit_script.write("cd " + slurm_dir + "\n")
+        submit_script.write("convert_id=$(sbatch --parsable -p ferrante -A ferrante " + slurm_names["convert"] + ")\n")
+        submit_script.write("render_id=$(sbatch --parsable -p ferrante -A ferrante --dependency=afterok:$convert_id " + slurm_names["render"] + ")\n")
+        submit_script.write("sbatch -p ferrante -A ferrante --dependency=afterok:$render_id " + slurm_names["composite"] + "\n")
+
+    print("Created jobscripts: " + slurm_dir)
+    return slurm_names["convert"], slurm_names["render"], slurm_names["composite"], submit_name
+
+def run_slurm_array_local(slurm_dir, convert_name, render_name, composite_name, num_shards, lib_dir, num_parallel=1):
+    """
+    Stand-in for Slurm that runs the jobscripts created by create_mox_slurm_array on the local machine, in the same
+    order as the submit script would on Mox: the convert job, then every task of the render job array (num_parallel at
+    a time, with SLURM_ARRAY_TASK_ID set), then the composite job. Stops if a job fails.
+    :param slurm_dir: Directory of the jobscripts
+    :param convert_name: Name of the convert jobscript
+    :param render_name: Name of the render job array jobscript
+    :param composite_name: Name of the composite jobscript
+    :param num_shards: Number of tasks in the render job array
+    :param lib_dir: Directory from which rendering scripts are run (lib directory).
+    :param num_parallel: Number of render tasks to run at the same time
+    """
+    def run_job(name, env=None):
+        return subprocess.Popen(["bash", slurm_dir + "/" + name], cwd=lib_dir, env=env)
+
+    def check_job(name, job):
+        if job.wait() != 0:
+            raise RuntimeError("Job failed: " + name)
+
+    check_job(convert_name, run_job(convert_name))
+
+    # Run render tasks, at most num_parallel at a time
+    running = []
+    for task_id in range(num_shards):
+        env = dict(os.environ, SLURM_ARRAY_TASK_ID=str(task_id))
+        running.append(run_job(render_name, env))
+        if len(running) >= num_parallel:
+            check_job(render_name, running.pop(0))
+    for job in running:
+        check_job(render_name, job)
+
+    check_job(composite_name, run_job(composite_name))
+
+def get_shard_frames(tres, shard, num_shards, shard_mode="interleaved"):
+    """
+    Determines the frames rendered by one shard of a render that is split over several jobs.
+    :param tres: Number of timesteps (frames)
+    :param shard: Index of the shard
+    :param num_shards: Number of shards
+    :param shard_mode: "interleaved" (shard i renders frames i, i+num_shards, ...) or "contiguous" (each shard renders
+    one consecutive block of frames)
+    :return: List of frames to render
+    """
+    if shard_mode == "interleaved":
+        return list(range(shard, tres, num_shards))
+    elif shard_mode == "contiguous":
+        frames_per_shard = -(-tres // num_shards) # Ceiling division
+        return list(range(shard*frames_per_shard, min(tres, (shard + 1)*frames_per_shard)))
+    else:
+        raise ValueError("Unknown shard mode: " + str(shard_mode))
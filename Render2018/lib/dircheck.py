@@ -86,6 +86,18 @@ def get_output_filepath(base_dir, tstep, extension):
     """
     return base_dir + get_base_output_name() + str(tstep) + extension
 
+def get_view_dirs(image_dir, num_views):
+    """
+    Determines the image output directory of each camera view of a render. A single view renders directly into the
+    image directory, several views each into a numbered subdirectory of it.
+    :param image_dir: Image output directory of the render
+    :param num_views: Number of camera views
+    :return: List of image output directories, one per view
+    """
+    if num_views == 1:
+        return [image_dir]
+    return [image_dir + "view" + str(view_n) + "/" for view_n in range(num_views)]
+
 def absolutify(path, slash_at_end=False):
     """
     Converts a relative path into an absolute path. Can specify whether to add a slash at the end
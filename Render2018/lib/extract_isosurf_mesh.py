@@ -1,6 +1,9 @@
 import numpy as np
 import h5py as h5
-from converters import convgeo2ply
+import mcubes
+from scipy.ndimage import map_coordinates
+from converters import convgeo2ply, weld_geo
+from stage_timer import timed
 
 def extract_geometry(data_file, output_dir, nth_coord):
     """
@@ -36,8 +39,8 @@ def extract_geometry(data_file, output_dir, nth_coord):
     num_tris_half = np.shape(upper_lefts)[0]
 
     # Delete "wraparound" faces
-    upper_lefts = np.delete(upper_lefts, np.arange(ires - 1, num_tris_half + 1, ires), 0)
-    lower_rights = np.delete(lower_rights, np.arange(ires - 1, num_tris_half + 1, ires), 0)
+    upper_lefts = np.delete(upper_lefts, np.arange(ires - 1, num_tris_half, ires), 0)
+    lower_rights = np.delete(lower_rights, np.arange(ires - 1, num_tris_half, ires), 0)
 
     # Concatenate triangle arrays together
     tris = np.concatenate((upper_lefts, lower_rights), axis=0)
@@ -109,11 +112,61 @@ def extract_geometry_general(data_file, output_dir, nth_coord, axis="K", level=1
     num_tris_half = np.shape(upper_lefts)[0]
 
     # Delete "wraparound" faces
-    upper_lefts = np.delete(upper_lefts, np.arange(xres - 1, num_tris_half + 1, xres), 0)
-    lower_rights = np.delete(lower_rights, np.arange(xres - 1, num_tris_half + 1, xres), 0)
+    upper_lefts = np.delete(upper_lefts, np.arange(xres - 1, num_tris_half, xres), 0)
+    lower_rights = np.delete(lower_rights, np.arange(xres - 1, num_tris_half, xres), 0)
 
     # Concatenate triangle arrays together
     tris = np.concatenate((upper_lefts, lower_rights), axis=0)
 
     # Convert geometry to a .ply file for Blender
-    convgeo2ply(verts=verts, tris=tris, output_path_ply=output_dir + "/body_axis" + str(axis) + "level" + str(level) + ".ply")
\ No newline at end of file
+    convgeo2ply(verts=verts, tris=tris, output_path_ply=output_dir + "/body_axis" + str(axis) + "level" + str(level) + ".ply")
+
+@timed()
+def extract_isosurf_curvilinear(data_file, tstep, field_name, level, slab_size=32):
+    """
+    Extracts an isosurface of a scalar field on the curvilinear grid of Abhiram's simulations, without resampling it to a
+    Cartesian grid (which loses resolution near the wall, where the grid is finest). Marching cubes is run in the
+    [k,j,i] index space of the grid, and the vertices are then mapped to cartesian positions by trilinear interpolation
+    of the grid coordinates. The grid is processed in slabs of k-layers that overlap by one layer, so that only one slab
+    is in memory at once; the vertices duplicated on the shared layers are merged afterwards.
+    :param data_file: .cgns file to extract the isosurface from
+    :param tstep: Timestep of the field
+    :param field_name: Name of the scalar field, e.g. "Lambda2"
+    :param level: Value of the field at which to draw the isosurface
+    :param slab_size: Number of cell layers along k in each slab
+    :return: vertices, triangles: Numpy arrays of geometry (vertices and triangles), in cartesian coordinates
+    """
+
+    # Open file
+    data = h5.File(data_file, "r")
+    field = data["Base"]["Zone1"]["FlowSolution_%04d" % tstep][field_name][" data"]
+    coordinates = [data["Base"]["Zone1"]["GridCoordinates"][coordinate_name][" data"]
+                   for coordinate_name in ("CoordinateX", "CoordinateY", "CoordinateZ")]
+    kres = field.shape[0]
+
+    verts_slabs = []
+    tris_slabs = []
+    num_verts = 0
+    for k_start in range(0, kres - 1, slab_size):
+        # Slab of cells between layers k_start and k_end, including both (k,j,i)
+        k_end = min(k_start + slab_size, kres - 1)
+        verts, tris = mcubes.marching_cubes(field[k_start:k_end + 1, :, :], level)
+        if len(tris) == 0:
+            continue
+
+        # Trilinear interpolation of the cartesian coordinates of the grid at the [k,j,i] position of each vertex
+        verts = np.stack([map_coordinates(coordinate[k_start:k_end + 1, :, :], verts.T, order=1, mode="nearest")
+                          for coordinate in coordinates], axis=1)
+
+        verts_slabs.append(verts)
+        tris_slabs.append(np.asarray(tris, dtype=np.int64) + num_verts)
+        num_verts += len(verts)
+
+    # close data file
+    data.close()
+
+    if num_verts == 0:
+        return np.zeros((0, 3)), np.zeros((0, 3), dtype=np.int64)
+
+    # Merge the vertices on the layers shared by neighbouring slabs
+    return weld_geo(np.concatenate(verts_slabs), np.concatenate(tris_slabs))
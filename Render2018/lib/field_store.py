@@ -0,0 +1,246 @@
+import os
+import sys
+import numpy as np
+import h5py as h5
+from shared_files import file_lock
+try:
+    # Registers the Blosc filter with HDF5, if installed. Without it, the store is compressed with LZF instead.
+    import hdf5plugin
+except ImportError:
+    hdf5plugin = None
+# Render-optimized store of an .h5dns file. The raw .h5dns layout is tuned for the solver: float64, contiguous fields.
+# Ingesting a case transcodes it once into a store with the same group layout, but with float32 fields split into 3D
+# chunks and compressed, which makes reads of whole fields much faster and the file much smaller. field4Dlow reads the
+# store instead of the .h5dns file whenever an up-to-date store exists, so the rest of the scripts are unaffected. A
+# store may hold only some of the fields (see ingest), in which case field4Dlow reads the others from the .h5dns file.
+#
+# Fields derived from the data, such as the vortex identification fields of vortex_fields, are cached in a separate file
+# with the same layout, and field4Dlow reads them like the fields of the .h5dns file.
+
+# Version of the store format, stored in the store. Stores of a different version are not used.
+STORE_VERSION = 2
+
+def get_store_path(h5dns_path):
+    """
+    :param h5dns_path: Path to .h5dns file
+    :return: Path to the render-optimized store of the file (next to the .h5dns file)
+    """
+    return os.path.splitext(h5dns_path)[0] + ".render.h5"
+
+def get_source_identity(h5dns_path):
+    """
+    :param h5dns_path: Path to .h5dns file
+    :return: Size and modification time of the file, which the store records to detect changes to the source
+    """
+    stat = os.stat(h5dns_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def is_store_valid(h5dns_path, store_path=None, complete=True, all_fields=False):
+    """
+    Checks whether the store of an .h5dns file was ingested from the current version of the file.
+    :param h5dns_path: Path to .h5dns file
+    :param store_path: (optional) Path to the store, defaults to get_store_path(h5dns_path)
+    :param complete: Also require that ingesting the store has finished
+    :param all_fields: Also require that all the fields of the file have been ingested, not only some of them
+    :return: True if the store can be used in place of the .h5dns file
+    """
+    store_path = store_path or get_store_path(h5dns_path)
+    if not os.path.isfile(store_path):
+        return False
+    try:
+        with h5.File(store_path, "r") as store:
+            source_size, source_mtime_ns = get_source_identity(h5dns_path)
+            return store.attrs.get("STORE_VERSION") == STORE_VERSION and \
+                   store.attrs.get("SOURCE_SIZE") == source_size and \
+                   store.attrs.get("SOURCE_MTIME_NS") == source_mtime_ns and \
+                   (store.attrs.get("INGEST_COMPLETE", False) or not complete) and \
+                   (store.attrs.get("ALL_FIELDS", False) or not all_fields)
+    except OSError:
+        # Unreadable store, e.g. left behind by a job killed while creating it
+        return False
+
+def get_read_path(h5dns_path):
+    """
+    Determines the file to read h5dns data from: the render-optimized store if an up-to-date one exists, otherwise the
+    .h5dns file itself.
+    :param h5dns_path: Path to .h5dns file
+    :return: Path to file to open
+    """
+    store_path = get_store_path(h5dns_path)
+    if is_store_valid(h5dns_path, store_path):
+        return store_path
+    return h5dns_path
+
+def get_compression():
+    """
+    :return: Keyword arguments for h5py.create_dataset that set the compression of store fields: Blosc with LZ4 and byte
+    shuffling if hdf5plugin is installed, otherwise LZF (which is built into h5py) with byte shuffling
+    """
+    if hdf5plugin is not None:
+        return dict(hdf5plugin.Blosc(cname="lz4", clevel=5, shuffle=hdf5plugin.Blosc.SHUFFLE))
+    return {"compression": "lzf", "shuffle": True}
+
+def ingest(h5dns_path, store_path=None, fields=None, chunk_size=32):
+    """
+    Transcodes an .h5dns file into a render-optimized store. Ingesting can be interrupted and resumed: timesteps that
+    have already been ingested are skipped. The fields ingested on each timestep are recorded, so that ingesting more
+    fields into a store later only adds the missing ones.
+    :param h5dns_path: Path to .h5dns file
+    :param store_path: (optional) Path to the store, defaults to get_store_path(h5dns_path). field4Dlow only finds the
+    store at the default path.
+    :param fields: (optional) List of fields to ingest, e.g. ["VOF", "YV", "Temperature"]. Defaults to all fields.
+    :param chunk_size: Edge length of the 3D chunks fields are split into
+    :return: Path to the store
+    """
+    store_path = store_path or get_store_path(h5dns_path)
+    compression = get_compression()
+
+    # Resume an earlier, interrupted ingest of the same source file, otherwise start over
+    mode = "a" if is_store_valid(h5dns_path, store_path, complete=False) else "w"
+    source = h5.File(h5dns_path, "r")
+    store = h5.File(store_path, mode)
+    all_fields = fields is None or (mode == "a" and store.attrs.get("ALL_FIELDS", False))
+    store.attrs["INGEST_COMPLETE"] = False
+    source_size, source_mtime_ns = get_source_identity(h5dns_path)
+    store.attrs["STORE_VERSION"] = STORE_VERSION
+    store.attrs["SOURCE_SIZE"] = source_size
+    store.attrs["SOURCE_MTIME_NS"] = source_mtime_ns
+
+    # Copy runtime parameters and timestep times
+    if "RUNTIME_PARAMETERS" not in store:
+        source.copy("RUNTIME_PARAMETERS", store)
+    source_sequence = source["FIELD_SEQUENCE_field3d"]
+    store_sequence = store.require_group("FIELD_SEQUENCE_field3d")
+    if "times" not in store_sequence:
+        source_sequence.copy("times", store_sequence)
+
+    # Transcode each timestep
+    tsteps = sorted(name for name in source_sequence if name.startswith("FIELD_DATA_"))
+    for tstep_name in tsteps:
+        source_tstep = source_sequence[tstep_name]
+        field_names = [field_name for field_name in source_tstep if fields is None or field_name in fields]
+
+        # Skip timesteps that already have all the fields, and remove a partially ingested timestep
+        ingested_fields = []
+        if tstep_name in store_sequence:
+            if store_sequence[tstep_name].attrs.get("INGESTED", False):
+                ingested_fields = list(store_sequence[tstep_name].attrs.get("INGESTED_FIELDS", []))
+                if all(field_name in ingested_fields for field_name in field_names):
+                    continue
+            else:
+                del store_sequence[tstep_name]
+        store_tstep = store_sequence.require_group(tstep_name)
+        store_tstep.attrs["INGESTED"] = False
+
+        for field_name in field_names:
+            if field_name in ingested_fields:
+                continue
+            if field_name in store_tstep:
+                del store_tstep[field_name]
+            source_field = source_tstep[field_name]
+
+            # Copy anything that is not a 3D field as is
+            if len(source_field.shape) != 3:
+                source_tstep.copy(field_name, store_tstep)
+                continue
+
+            # Convert to float32 in slabs of chunks, so that the full-precision field is never entirely in memory
+            chunks = tuple(min(chunk_size, dim) for dim in source_field.shape)
+            store_field = store_tstep.create_dataset(field_name, shape=source_field.shape, dtype="<f4", chunks=chunks,
+                                                     **compression)
+            for k_start in range(0, source_field.shape[0], chunks[0]):
+                k_end = min(k_start + chunks[0], source_field.shape[0])
+                store_field[k_start:k_end] = source_field[k_start:k_end].astype(np.float32)
+
+        store_tstep.attrs["INGESTED_FIELDS"] = ingested_fields + [field_name for field_name in field_names if field_name not in ingested_fields]
+        store_tstep.attrs["INGESTED"] = True
+        store.flush()
+        print("Ingested " + tstep_name)
+
+    store.attrs["ALL_FIELDS"] = all_fields
+    store.attrs["INGEST_COMPLETE"] = True
+    store.close()
+    source.close()
+    print("Saved render-optimized store: " + store_path + " (%.1f%% of .h5dns size)" % (100*os.path.getsize(store_path)/source_size))
+
+    return store_path
+
+def get_derived_path(h5dns_path):
+    """
+    :param h5dns_path: Path to .h5dns file
+    :return: Path to the cache of fields derived from the data of the file, e.g. vortex identification fields (next to
+    the .h5dns file)
+    """
+    return os.path.splitext(h5dns_path)[0] + ".derived.h5"
+
+def is_derived_valid(h5dns_path, derived):
+    """
+    :param h5dns_path: Path to .h5dns file
+    :param derived: Open h5py File of the derived field cache
+    :return: True if the cached fields were derived from the current data (read from the store, if there is one)
+    """
+    return derived.attrs.get("STORE_VERSION") == STORE_VERSION and \
+           (derived.attrs.get("SOURCE_SIZE"), derived.attrs.get("SOURCE_MTIME_NS")) == get_source_identity(get_read_path(h5dns_path))
+
+def read_derived_field(h5dns_path, tstep, field_name):
+    """
+    Reads a derived field from the derived field cache of an .h5dns file.
+    :param h5dns_path: Path to .h5dns file
+    :param tstep: Timestep
+    :param field_name: Name of the derived field, e.g. "Lambda2"
+    :return: 3D field indexed [k,j,i] like the fields of the .h5dns file, or None if it is not in the cache
+    """
+    derived_path = get_derived_path(h5dns_path)
+    if not os.path.isfile(derived_path):
+        return None
+    try:
+        # Locked while reading, so that several conversion processes can share the cache
+        with file_lock(derived_path + ".lock"):
+            with h5.File(derived_path, "r") as derived:
+                name = "FIELD_SEQUENCE_field3d/FIELD_DATA_%06d/%s" % (tstep, field_name)
+                if not is_derived_valid(h5dns_path, derived) or name not in derived:
+                    return None
+                return derived[name][()]
+    except OSError:
+        # Unreadable cache, e.g. left behind by a job killed while writing it
+        return None
+
+def write_derived_fields(h5dns_path, tstep, fields, chunk_size=32):
+    """
+    Adds derived fields of a timestep to the derived field cache of an .h5dns file, as compressed float32 fields in the
+    same layout as the store. The cache is started over if it was derived from other data. If the cache cannot be
+    written (e.g. the data directory is read-only), the fields are not stored.
+    :param h5dns_path: Path to .h5dns file
+    :param tstep: Timestep
+    :param fields: Dictionary of field name -> 3D field indexed [k,j,i]
+    :param chunk_size: Edge length of the 3D chunks fields are split into
+    """
+    derived_path = get_derived_path(h5dns_path)
+    compression = get_compression()
+    try:
+        with file_lock(derived_path + ".lock", exclusive=True):
+
+            # Start over if the cache is unreadable or was derived from other data
+            try:
+                derived = h5.File(derived_path, "a")
+                if not is_derived_valid(h5dns_path, derived):
+                    derived.close()
+                    derived = h5.File(derived_path, "w")
+            except OSError:
+                derived = h5.File(derived_path, "w")
+
+            with derived:
+                derived.attrs["STORE_VERSION"] = STORE_VERSION
+                derived.attrs["SOURCE_SIZE"], derived.attrs["SOURCE_MTIME_NS"] = get_source_identity(get_read_path(h5dns_path))
+                tstep_group = derived.require_group("FIELD_SEQUENCE_field3d/FIELD_DATA_%06d" % tstep)
+                for field_name, field in fields.items():
+                    if field_name in tstep_group:
+                        del tstep_group[field_name]
+                    chunks = tuple(min(chunk_size, dim) for dim in field.shape)
+                    tstep_group.create_dataset(field_name, data=field.astype(np.float32), chunks=chunks, **compression)
+    except OSError as error:
+        print("Could not update derived field cache " + derived_path + ": " + str(error))
+
+if __name__ == "__main__":
+    # Ingest the .h5dns file given as argument
+    ingest(sys.argv[1])
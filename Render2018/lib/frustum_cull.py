@@ -0,0 +1,106 @@
+import numpy as np
+from render_space import grid_to_blender, get_camera_angle, get_camera_frame, get_frustum_planes
+# Culling of exported geometry and fog to the view of the camera. Zoomed-in renders (small view fractions) only show a
+# small part of the domain, but the whole domain's geometry and voxel data would otherwise be exported and loaded into
+# Blender. Triangles and fog bricks entirely outside the view frustum (widened by a margin, so that geometry just out of
+# view still shows in reflections and refractions of the water material) are removed before writing. The camera is set
+# up the same way as by Blender/scene_config.configure_scene, and the camera settings are part of the keys of culled
+# outputs, so that they are re-exported when the camera changes. Multi-view renders are culled to the union of the views,
+# keeping everything that is visible in at least one of them.
+
+# Width/height ratio of rendered frames
+FRAME_ASPECT = 16/9
+
+def get_culling_params(rconfd, dim, view_fraction, render_scale=10, camera_distance=15, views=None):
+    """
+    View culling settings of a render, from the optional frustum_cull_enabled and frustum_margin render config settings.
+    :param rconfd: Render config dictionary
+    :param dim: (x,y,z) resolution of the domain
+    :param view_fraction: Portion of the domain shown in the frame width
+    :param render_scale: Scale the geometry is rendered at in Blender
+    :param camera_distance: Distance of the camera from the origin (as in the Blender scripts)
+    :param views: (optional) List of (camera_azimuth_angle, camera_elevation_angle, view_fraction) of a multi-view
+    render, instead of the camera angle settings and view_fraction
+    :return: Dictionary with the view option of the exported geometry (see convert_data.GEO_OPTIONS), which is also the
+    view argument of the fog converters: the domain resolution and camera settings to cull to (a list of them for
+    several views), or None to disable
+    """
+    if not rconfd.get("frustum_cull_enabled", False):
+        return {"view": None}
+    if views is None:
+        views = [(rconfd["camera_azimuth_angle"], rconfd["camera_elevation_angle"], view_fraction)]
+    view_list = [{"dim": [int(res) for res in dim], "camera_azimuth_angle": float(camera_azimuth_angle),
+                  "camera_elevation_angle": float(camera_elevation_angle), "view_fraction": float(view_fraction),
+                  "render_scale": float(render_scale), "camera_distance": float(camera_distance),
+                  "margin": float(rconfd.get("frustum_margin", 0.25))}
+                 for camera_azimuth_angle, camera_elevation_angle, view_fraction in views]
+    return {"view": view_list[0] if len(view_list) == 1 else view_list}
+
+def get_view_list(view):
+    """
+    :param view: Camera settings (see get_culling_params), or list of them
+    :return: List of camera settings
+    """
+    return view if isinstance(view, list) else [view]
+
+def get_view_planes(view):
+    """
+    :param view: Camera settings (see get_culling_params)
+    :return: Planes of the view frustum in Blender coordinates (see render_space.get_frustum_planes)
+    """
+    camera_frame = get_camera_frame(view["camera_azimuth_angle"], view["camera_elevation_angle"], view["camera_distance"])
+    camera_angle = get_camera_angle(view["render_scale"], view["view_fraction"], view["camera_distance"])
+    return get_frustum_planes(camera_frame, camera_angle, FRAME_ASPECT, view["margin"])
+
+def get_outside(points, view):
+    """
+    :param points: Array of points (one row per point) in grid coordinates
+    :param view: Camera settings (see get_culling_params)
+    :return: (N,4) boolean array of whether each point is outside each plane of the view frustum
+    """
+    planes = get_view_planes(view)
+    return grid_to_blender(points, view["dim"], view["render_scale"]) @ planes[:,:3].T + planes[:,3] < 0
+
+def cull_geo(verts, tris, view, vcolors=None):
+    """
+    Removes triangles outside the view frustum, and the vertices no longer used. A triangle is removed if its corners are
+    all outside the same plane of the frustum, so triangles that cross the view are kept however large they are.
+    :param verts: Vertices array, in grid coordinates
+    :param tris: Triangles array
+    :param view: Camera settings (see get_culling_params), or list of them to keep triangles visible in any view
+    :param vcolors: (optional) Array of vertex colors (one row per vertex)
+    :return: verts, tris, vcolors: Culled geometry (vcolors is None if not given)
+    """
+    verts = np.asarray(verts, dtype=float)
+    tris = np.asarray(tris, dtype=np.int64)
+    visible = np.zeros(len(tris), dtype=bool)
+    for single_view in get_view_list(view):
+        outside = get_outside(verts, single_view)
+        visible |= ~np.any(np.all(outside[tris], axis=1), axis=1)
+    tris = tris[visible]
+
+    # Remove vertices that are no longer part of any triangle
+    used = np.zeros(len(verts), dtype=bool)
+    used[tris.reshape(-1)] = True
+    new_ids = np.cumsum(used) - 1
+    if vcolors is not None:
+        vcolors = np.asarray(vcolors)[used]
+    return verts[used], new_ids[tris], vcolors
+
+def is_box_visible(box_min, box_max, view):
+    """
+    Checks whether axis-aligned boxes (e.g. bricks of voxels) are at least partly within the view frustum. A box is
+    outside if its corners are all outside the same plane of the frustum.
+    :param box_min: (N,3) array of the lowest corner of each box, in grid coordinates
+    :param box_max: (N,3) array of the highest corner of each box, in grid coordinates
+    :param view: Camera settings (see get_culling_params), or list of them to find boxes visible in any view
+    :return: Boolean array of whether each box is visible
+    """
+    box_min = np.asarray(box_min, dtype=float)
+    box_max = np.asarray(box_max, dtype=float)
+    corners = np.stack([np.where([(corner >> axis) & 1 for axis in range(3)], box_max, box_min) for corner in range(8)], axis=1)
+    visible = np.zeros(len(box_min), dtype=bool)
+    for single_view in get_view_list(view):
+        outside = get_outside(corners.reshape(-1, 3), single_view).reshape(len(box_min), 8, 4)
+        visible |= ~np.any(np.all(outside, axis=1), axis=1)
+    return visible
@@ -1,5 +1,8 @@
 import h5py as h5
 import numpy as np
+from stage_timer import timed
+from field_store import get_read_path, read_derived_field
+from cgns_load_data import map_dataset
 
 class field4Dlow:
     """
@@ -8,14 +11,17 @@ class field4Dlow:
     """
     def __init__(self, filename):
         """
-        Class initializer. Loads h5dns file and some useful data.
+        Class initializer. Loads h5dns file and some useful data. If the file has been ingested into a render-optimized
+        store (see field_store), the store is read instead, and fields that have not been ingested are read from the file.
         :param filename: Path to h5dns file
         """
 
         self.filename = filename
 
-        # Open file
-        self.f = h5.File(filename, 'r')
+        # Open file, or its render-optimized store. The file itself is only opened if a field is missing from the store.
+        self.read_path = get_read_path(filename)
+        self.f = h5.File(self.read_path, 'r')
+        self.source = None
 
         # Extract bounds
         self.tres = len(self.f['FIELD_SEQUENCE_field3d']['times'])
@@ -44,37 +50,75 @@ class field4Dlow:
                 str(self.ly) + ", " + str(self.lz) + ")\n" + "dt: " + str(self.dt) + "\n" +
                 "Droplet Diameter: " + str(self.dropd) + "\n" + "Gas temperature: " + str(self.tgas) + "\n\n")
 
+    def get_tstep_group(self, tstep, field):
+        """
+        :param tstep: Timestep
+        :param field: Field to take data from
+        :return: Group of the timestep that contains the field: in the file that is read, or in the .h5dns file for
+        fields missing from a render-optimized store. None if neither contains the field.
+        """
+        tstep_name = 'FIELD_DATA_%06d' % tstep
+        tstep_group = self.f['FIELD_SEQUENCE_field3d'][tstep_name]
+        if field in tstep_group:
+            return tstep_group
+        if self.read_path == self.filename:
+            return None
+        if self.source is None:
+            self.source = h5.File(self.filename, 'r')
+        tstep_group = self.source['FIELD_SEQUENCE_field3d'][tstep_name]
+        return tstep_group if field in tstep_group else None
+
+    @timed("h5dns_read")
     def obtain3Dtimestep(self, tstep, field):
         """
         Returns 3D data for a specific timestep on a specific scalar field in the h5dns data, indexed as [i,j,k]
         :param tstep: Timestep
-        :param field: Field to take data from. Examples: "VOF", "YV", "Temperature"
+        :param field: Field to take data from. Examples: "VOF", "YV", "Temperature", or a derived field that has been
+        cached, e.g. "Lambda2" (see vortex_fields)
         :return: 3D scalar field of data.
         """
-        datafield = np.swapaxes(self.f['FIELD_SEQUENCE_field3d']['FIELD_DATA_%06d' % tstep][field][:,:,:], 0, 2) # Swaps the axes such that it is returned in [i,j,k] format instead of [k,j,i]
-        return datafield
+        tstep_group = self.get_tstep_group(tstep, field)
+        if tstep_group is not None:
+            datafield = tstep_group[field][:,:,:]
+        else:
+            # Fields derived from the data are read from the derived field cache
+            datafield = read_derived_field(self.filename, tstep, field)
+            if datafield is None:
+                raise KeyError("Field " + field + " is neither in " + self.filename + " nor in its derived field cache")
+        return np.swapaxes(datafield, 0, 2) # Swaps the axes such that it is returned in [i,j,k] format instead of [k,j,i]
 
     def obtain2Dslice(self, tstep, field, slice_axis, slice_level):
         """
-        Returns a 2D slice of a 3D scalar field at a specific timestep.
+        Returns a 2D slice of a 3D scalar field at a specific timestep. Slices of contiguously stored fields are read
+        through a memory map of the file, since X and Y slices are strided through the whole dataset, which is slow to
+        read with h5py.
         :param tstep: Timestep
         :param field: Field to take data from
         :param slice_axis: Axis normal to which the slice is taken. Specify "0" for X, "1" for Y, "2" for Z
         :param slice_level: X, Y, or Z level at which to slice.
         :return: 2D scalar field - [X,Y], [X,Z], or [Y,Z] depending on axis
         """
+        tstep_group = self.get_tstep_group(tstep, field)
+        if tstep_group is None:
+            # Fields derived from the data are sliced from the whole field (see obtain3Dtimestep)
+            return np.take(self.obtain3Dtimestep(tstep, field), slice_level, axis=slice_axis)
+
+        dataset = map_dataset(tstep_group[field])
         if slice_axis == 0: # Cut at X = slice_level, YZ plane visualized
-            return np.swapaxes(self.f['FIELD_SEQUENCE_field3d']['FIELD_DATA_%06d' % tstep][field][:,:,slice_level], 0, 1)
+            plane = dataset[:,:,slice_level]
         elif slice_axis == 1: # Cut at Y = slice_level, XZ visualized
-            return np.swapaxes(self.f['FIELD_SEQUENCE_field3d']['FIELD_DATA_%06d' % tstep][field][:,slice_level,:], 0, 1)
+            plane = dataset[:,slice_level,:]
         else: # Cut at Z
-            return np.swapaxes(self.f['FIELD_SEQUENCE_field3d']['FIELD_DATA_%06d' % tstep][field][slice_level,:,:], 0, 1)
+            plane = dataset[slice_level,:,:]
+        return np.swapaxes(np.array(plane), 0, 1)
 
     def close(self):
         """
         Close h5dns file: should call this when done working with data.
         """
         self.f.close()
+        if self.source is not None:
+            self.source.close()
 
 def get_important_data(h5dns_path):
     """
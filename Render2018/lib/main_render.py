@@ -2,14 +2,28 @@ import dircheck
 import convert_data
 import load_config
 import blender_launcher
+import pipeline_render
 import imedit
+import preview_pyramid
+import mesh_decimate
+import mesh_archive
+import frustum_cull
+import render_space
+import convert_sweep
 import configparser
 
-def photorealistic(case_config_filepath, render_config_filepath):
+def photorealistic(case_config_filepath, render_config_filepath, stage="all", shard=0, num_shards=1, shard_mode="interleaved", preview=0, sweep=None):
     """
     Renders photorealistic images of a droplet interface in data from Michael or Pablo's simulations, given a case config file and render config file.
     :param case_config_filepath: Path to case configuration file, which contains information on the data file to render.
     :param render_config_filepath: Path to render configuration file, which contains information on how to render the data.
+    :param stage: Stage of the render to perform: "all", or "convert", "render" and "composite" when the render is split into several jobs (see create_jobscripts.create_mox_slurm_array)
+    :param shard: Index of the subset of frames to render in the "render" stage
+    :param num_shards: Number of subsets the frames are split into
+    :param shard_mode: How frames are split into subsets: "interleaved" or "contiguous"
+    :param preview: Downsampling factor of a quick-look preview render (see preview_pyramid), or 0 for a full render
+    :param sweep: (optional) convert_sweep to add the conversion of the render to, instead of converting the data now.
+    Only used in the convert stage (see convert_sweep_renders).
     """
 
     # Load config file with all common directory names
@@ -22,19 +36,39 @@ def photorealistic(case_config_filepath, render_config_filepath):
 
     # Main output directory
     case_output = dirname_config["DIRECTORIES"]["RenderOutput"] + cconfd["case_name"] + "/"
+
+    # In preview mode, render downsampled data at a lower resolution into a separate output tree
+    if preview:
+        cconfd, rconfd, case_output = preview_pyramid.setup_preview(cconfd, rconfd, case_output, preview,
+                                                                    fields=("VOF", "YV"))
+
+    # Blender config file. In the render stage, it has already been written by the convert stage.
+    blender_config_filedir = case_output + rconfd["render_name"] + "_blender.cfg"
+    if stage == "render":
+        render_shard(blender_config_filedir, shard, num_shards, shard_mode)
+        return
+    elif stage == "composite":
+        return
     
     # Determine interface geometry output dir
     geometry_output_dir = case_output + dirname_config["DIRECTORIES"]["ply"]
 
-    # Determine individual frame output dir
+    # If the droplet is split in half, Blender loads pre-cut geometry instead of cutting it on every frame
+    if rconfd["interface_half_enabled"]:
+        ply_input_dir = geometry_output_dir + "half/"
+        dircheck.check_make(ply_input_dir)
+    else:
+        ply_input_dir = geometry_output_dir
+
+    # Determine individual frame output dir, and the subdirectories of each camera view if there are several
     image_output_dir_spec = dircheck.count_png_dirs(case_output + dirname_config["DIRECTORIES"]["tstep_sequence_photorealistic"])
-    dircheck.check_make(image_output_dir_spec) # Make it if nonexistent
+    views = get_views(rconfd, view_fraction=cconfd["dropd"]/rconfd["droplet_scale"])
+    dircheck.check_make([image_output_dir_spec] + dircheck.get_view_dirs(image_output_dir_spec, len(views))) # Make them if nonexistent
     
     # Write Blender config file
-    blender_config_filedir = case_output + rconfd["render_name"] + "_blender.cfg"
     load_config.write_config_file(config_filedir=blender_config_filedir,
                                   config_dict={"image_output_dir_spec": image_output_dir_spec,
-                                               "ply_input_dir": geometry_output_dir,
+                                               "ply_input_dir": ply_input_dir,
                                                "interface_material_name": "WaterMaterial5",
                                                "bg_image_filepath": rconfd["bg_image_filepath"],
                                                "view_fraction": cconfd["dropd"]/rconfd["droplet_scale"],
@@ -42,36 +76,106 @@ def photorealistic(case_config_filepath, render_config_filepath):
                                                "resolution_percentage": rconfd["resolution_percentage"],
                                                "xres": cconfd["xres"], "yres": cconfd["yres"], "zres": cconfd["zres"],
                                                "tres": cconfd["tres"],
-                                               "interface_half_enabled": rconfd["interface_half_enabled"],
                                                "fog_enabled": rconfd["fog_enabled"],
                                                "camera_azimuth_angle": rconfd["camera_azimuth_angle"],
                                                "camera_elevation_angle": rconfd["camera_elevation_angle"],
+                                               "views": render_space.format_views(views),
                                                "bg_color_1": rconfd["bg_color_1"], "bg_color_2": rconfd["bg_color_2"]})
 
-    # Extract droplet interface geometry
-    convert_data.conv_ply(h5dns_path=cconfd["h5dns_path"], output_dir=geometry_output_dir, tres=int(cconfd["tres"]))
-
-    # Extract vapor fog (YV) if enabled
+    # Determine vapor fog (YV) output dir if enabled, and make it if necessary
     if rconfd["fog_enabled"]:
-        # Determine individual fog dir and make it if necessary
         fog_halved = rconfd["fog_half_enabled"]
         fog_dir_specifier = str(rconfd["fog_vapor_min"]) + "halved" + str(fog_halved) + "/"
         bvox_output_dir_spec = case_output + dirname_config["DIRECTORIES"]["bvox"] + fog_dir_specifier
         dircheck.check_make(bvox_output_dir_spec)
-        # Convert fog data
-        convert_data.conv_bvox(h5dns_path=cconfd["h5dns_path"], output_dir=bvox_output_dir_spec, tres=int(cconfd["tres"]), vapor_min=float(rconfd["fog_vapor_min"]), fog_halved=fog_halved)
         # Add fog dir to Blender config file
         load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"bvox_input_dir": bvox_output_dir_spec}, append_config=True)
- 
+
+    # Decimation of the interface geometry to the detail the render can resolve (in the closest view), if enabled
+    decimation = mesh_decimate.get_decimation_params(rconfd, dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]),
+                                                     view_fraction=min(view[2] for view in views))
+
+    # Culling of the geometry and fog outside the views of the camera, if enabled
+    culling = frustum_cull.get_culling_params(rconfd, dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]),
+                                              view_fraction=cconfd["dropd"]/rconfd["droplet_scale"], views=views)
+
+    # Store the geometry of all timesteps in one mesh archive per directory instead of one .ply file per timestep
+    archiving = mesh_archive.get_archive_params(rconfd)
+    if archiving["use_archive"]:
+        load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"mesh_archive_path": mesh_archive.get_archive_path(ply_input_dir)}, append_config=True)
+
+    # Options of the exported geometry (see convert_data.GEO_OPTIONS)
+    geo_options = {**archiving, **decimation, **culling}
+
+    # Reuse the geometry of frames in which the interface has barely changed since an earlier frame, and without fog
+    # (which changes on every frame) let Blender copy the earlier frame's image
+    static_frames = None
+    if rconfd.get("static_threshold", 0) > 0:
+        static_frames = convert_data.get_static_frames(h5dns_path=cconfd["h5dns_path"], output_dir=geometry_output_dir,
+                                                       tres=int(cconfd["tres"]), threshold=rconfd["static_threshold"])
+        load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"static_frames_path": geometry_output_dir + "static_frames.json"}, append_config=True)
+
+    # In pipeline mode, timesteps are converted in worker processes while Blender renders the ones already converted. In
+    # a sweep over several renders, timesteps are converted together with those of the other renders.
+    if (rconfd.get("pipeline_enabled", False) and stage == "all") or sweep is not None:
+        convert_kwargs = {"h5dns_path": cconfd["h5dns_path"], "geometry_output_dir": geometry_output_dir,
+                          "static_frames": static_frames, "geo_options": geo_options}
+        if rconfd["interface_half_enabled"]:
+            convert_kwargs["half_output_dir"] = ply_input_dir
+            convert_kwargs["half_plane"] = convert_data.get_half_plane(dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]), render_scale=10)
+        if rconfd["fog_enabled"]:
+            convert_kwargs["bvox_output_dir"] = bvox_output_dir_spec
+            convert_kwargs["vapor_min"] = float(rconfd["fog_vapor_min"])
+            convert_kwargs["vapor_max"] = convert_data.get_vapor_max(h5dns_path=cconfd["h5dns_path"], output_dir=bvox_output_dir_spec, sweep=sweep)
+            convert_kwargs["fog_halved"] = fog_halved
+        # Output directories of the conversion, whose artifact caches are created once rather than on every timestep
+        cache_dirs = [convert_kwargs[name] for name in ("geometry_output_dir", "half_output_dir", "bvox_output_dir") if name in convert_kwargs]
+        if sweep is not None:
+            sweep.add(convert_tstep=convert_data.conv_photorealistic_tstep, convert_kwargs=convert_kwargs, tres=cconfd["tres"],
+                      cache_dirs=cache_dirs)
+            return
+        load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"pipeline_enabled": True}, append_config=True)
+        pipeline_render.render_pipelined(convert_tstep=convert_data.conv_photorealistic_tstep, convert_kwargs=convert_kwargs,
+                                         tres=int(cconfd["tres"]), blend_name="droplet_render.blend",
+                                         python_name="droplet_render.py", blender_config_filedir=blender_config_filedir,
+                                         num_workers=rconfd.get("pipeline_workers", 1), cache_dirs=cache_dirs)
+        return
+
+    # Extract droplet interface geometry. If it is cut in half, only the cut geometry is culled.
+    convert_data.conv_ply(h5dns_path=cconfd["h5dns_path"], output_dir=geometry_output_dir, tres=int(cconfd["tres"]),
+                          static_frames=static_frames,
+                          geo_options=dict(geo_options, view=None) if rconfd["interface_half_enabled"] else geo_options)
+
+    # Cut droplet interface geometry in half if enabled
+    if rconfd["interface_half_enabled"]:
+        convert_data.conv_half_ply(input_dir=geometry_output_dir, output_dir=ply_input_dir, tres=int(cconfd["tres"]),
+                                   dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]), render_scale=10,
+                                   geo_options=geo_options)
+
+    # Convert vapor fog data if enabled
+    if rconfd["fog_enabled"]:
+        convert_data.conv_bvox(h5dns_path=cconfd["h5dns_path"], output_dir=bvox_output_dir_spec, tres=int(cconfd["tres"]), vapor_min=float(rconfd["fog_vapor_min"]), fog_halved=fog_halved,
+                               **culling)
+
+    # Leave rendering to the render stage jobs
+    if stage == "convert":
+        return
+
     # Launch Blender to perform rendering
     blender_launcher.launch_blender_new(blender_config_filedir=blender_config_filedir, python_name="droplet_render.py", blend_name="droplet_render.blend")
 
-
-def surf_tempmap(case_config_filepath, render_config_filepath):
+def surf_tempmap(case_config_filepath, render_config_filepath, stage="all", shard=0, num_shards=1, shard_mode="interleaved", preview=0, sweep=None):
     """
     Renders surface temperature images of a droplet interface in data from Michael or Pablo's simulations, given a case config file and render config file.
     :param case_config_filepath: Path to case configuration file, which contains information on the data file to render.
     :param render_config_filepath: Path to render configuration file, which contains information on how to render the data.
+    :param stage: Stage of the render to perform: "all", or "convert", "render" and "composite" when the render is split into several jobs (see create_jobscripts.create_mox_slurm_array)
+    :param shard: Index of the subset of frames to render in the "render" stage
+    :param num_shards: Number of subsets the frames are split into
+    :param shard_mode: How frames are split into subsets: "interleaved" or "contiguous"
+    :param preview: Downsampling factor of a quick-look preview render (see preview_pyramid), or 0 for a full render
+    :param sweep: (optional) convert_sweep to add the conversion of the render to, instead of converting the data now.
+    Only used in the convert stage (see convert_sweep_renders).
     """
 
     # Load config file with all common directory names
@@ -84,6 +188,17 @@ def surf_tempmap(case_config_filepath, render_config_filepath):
 
     # Main output directory
     case_output = dirname_config["DIRECTORIES"]["RenderOutput"] + cconfd["case_name"] + "/"
+
+    # In preview mode, render downsampled data at a lower resolution into a separate output tree
+    if preview:
+        cconfd, rconfd, case_output = preview_pyramid.setup_preview(cconfd, rconfd, case_output, preview,
+                                                                    fields=("VOF", "Temperature"))
+
+    # Blender config file. In the render stage, it has already been written by the convert stage.
+    blender_config_filedir = case_output + rconfd["render_name"] + "_blender.cfg"
+    if stage == "render":
+        render_shard(blender_config_filedir, shard, num_shards, shard_mode)
+        return
     
     # Determine surface temperature geometry output dir
     ply_temp_output_dir = case_output + dirname_config["DIRECTORIES"]["ply_temp"]
@@ -93,53 +208,98 @@ def surf_tempmap(case_config_filepath, render_config_filepath):
         temp_min, temp_max = convert_data.temp_bounds(h5dns_path=cconfd["h5dns_path"],
                                                       ply_temp_output_dir=ply_temp_output_dir,
                                                       prc_min=rconfd["temp_min_percentile"],
-                                                      prc_max=rconfd["temp_max_percentile"])
+                                                      prc_max=rconfd["temp_max_percentile"], sweep=sweep)
     else:
         temp_min = rconfd["temp_min"]
         temp_max = rconfd["temp_max"]
 
-    # Determine specific output dirs and make them if necessary
-    image_output_dir_spec = dircheck.count_png_dirs(case_output + dirname_config["DIRECTORIES"]["tstep_sequence_surftempmap"])
-    ply_temp_output_dir_spec = ply_temp_output_dir + str(temp_min) + "to" + str(temp_max)
-    dircheck.check_make([ply_temp_output_dir_spec, image_output_dir_spec])
+    # The composite stage only adds to the images of the last render, whose directory and views are in the Blender
+    # config file
+    if stage == "composite":
+        blender_config = load_config.get_config_params(blender_config_filedir)
+        image_output_dir_spec = blender_config["image_output_dir_spec"]
+        views = render_space.parse_views(blender_config.get("views", "")) or [None]
+    else:
+        # Determine specific output dirs (with a subdirectory per camera view if there are several) and make them if necessary
+        image_output_dir_spec = dircheck.count_png_dirs(case_output + dirname_config["DIRECTORIES"]["tstep_sequence_surftempmap"])
+        ply_temp_output_dir_spec = ply_temp_output_dir + str(temp_min) + "to" + str(temp_max)
+        views = get_views(rconfd, view_fraction=cconfd["dropd"]/rconfd["droplet_scale"])
+        dircheck.check_make([ply_temp_output_dir_spec, image_output_dir_spec] + dircheck.get_view_dirs(image_output_dir_spec, len(views)))
 
-    # Write Blender config file
-    blender_config_filedir = case_output + rconfd["render_name"] + "_blender.cfg"
-    load_config.write_config_file(config_filedir=blender_config_filedir,
-                                  config_dict={"image_output_dir_spec": image_output_dir_spec,
-                                               "ply_input_dir": ply_temp_output_dir_spec,
-                                               "interface_material_name": "heatmapMaterial",
-                                               "bg_image_filepath": rconfd["bg_image_filepath"],
-                                               "view_fraction": cconfd["dropd"]/rconfd["droplet_scale"],
-                                               "render_scale": 10,
-                                               "resolution_percentage": rconfd["resolution_percentage"],
-                                               "xres": cconfd["xres"], "yres": cconfd["yres"], "zres": cconfd["zres"],
-                                               "tres": cconfd["tres"],
-                                               "interface_half_enabled": False,
-                                               "fog_enabled": False,
-                                               "camera_azimuth_angle": rconfd["camera_azimuth_angle"],
-                                               "camera_elevation_angle": rconfd["camera_elevation_angle"],
-                                               "bg_color_1": rconfd["bg_color_1"], "bg_color_2": rconfd["bg_color_2"]})
+        # Write Blender config file
+        load_config.write_config_file(config_filedir=blender_config_filedir,
+                                      config_dict={"image_output_dir_spec": image_output_dir_spec,
+                                                   "ply_input_dir": ply_temp_output_dir_spec,
+                                                   "interface_material_name": "heatmapMaterial",
+                                                   "bg_image_filepath": rconfd["bg_image_filepath"],
+                                                   "view_fraction": cconfd["dropd"]/rconfd["droplet_scale"],
+                                                   "render_scale": 10,
+                                                   "resolution_percentage": rconfd["resolution_percentage"],
+                                                   "xres": cconfd["xres"], "yres": cconfd["yres"], "zres": cconfd["zres"],
+                                                   "tres": cconfd["tres"],
+                                                   "fog_enabled": False,
+                                                   "camera_azimuth_angle": rconfd["camera_azimuth_angle"],
+                                                   "camera_elevation_angle": rconfd["camera_elevation_angle"],
+                                                   "views": render_space.format_views(views),
+                                                   "bg_color_1": rconfd["bg_color_1"], "bg_color_2": rconfd["bg_color_2"]})
 
-    # Extract droplet interface geometry
-    ply_output_dir_uncolored = case_output + dirname_config["DIRECTORIES"]["ply"]
-    convert_data.conv_ply(h5dns_path=cconfd["h5dns_path"], output_dir=ply_output_dir_uncolored, tres=cconfd["tres"])
+        # Store the geometry of all timesteps in one mesh archive per directory instead of one .ply file per timestep
+        archiving = mesh_archive.get_archive_params(rconfd)
+        if archiving["use_archive"]:
+            load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"mesh_archive_path": mesh_archive.get_archive_path(ply_temp_output_dir_spec)}, append_config=True)
 
-    # Add surface temperature color to droplet interface
-    convert_data.conv_color_ply(h5dns_path=cconfd["h5dns_path"], output_dir=ply_temp_output_dir_spec, uncolored_ply_dir=ply_output_dir_uncolored, tres=cconfd["tres"], temp_min=temp_min, temp_max=temp_max)
+        # Reuse the colored geometry and images of frames in which both the interface and the surface temperature have
+        # barely changed since an earlier frame
+        static_color_frames = None
+        if rconfd.get("static_threshold", 0) > 0:
+            static_color_frames = convert_data.get_static_frames(h5dns_path=cconfd["h5dns_path"], output_dir=ply_temp_output_dir_spec + "/",
+                                                                 tres=cconfd["tres"], threshold=rconfd["static_threshold"],
+                                                                 fields=("VOF", "Temperature"))
+            load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"static_frames_path": ply_temp_output_dir_spec + "/static_frames.json"}, append_config=True)
 
-    # Launch Blender to perform rendering
-    blender_launcher.launch_blender_new(blender_config_filedir=blender_config_filedir, python_name="droplet_render.py", blend_name="droplet_render.blend")
+        # Extract droplet interface geometry colored by surface temperature in one pass, decimated to the detail the
+        # render can resolve and culled to the view of the camera if enabled. Colors are sampled at the vertices of the
+        # final geometry.
+        decimation = mesh_decimate.get_decimation_params(rconfd, dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]),
+                                                         view_fraction=min(view[2] for view in views))
+        culling = frustum_cull.get_culling_params(rconfd, dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]),
+                                                  view_fraction=cconfd["dropd"]/rconfd["droplet_scale"], views=views)
+        geo_options = {**archiving, **decimation, **culling}
+        if sweep is not None:
+            sweep.add(convert_tstep=convert_data.conv_surf_tempmap_tstep,
+                      convert_kwargs={"h5dns_path": cconfd["h5dns_path"], "output_dir": ply_temp_output_dir_spec,
+                                      "temp_min": temp_min, "temp_max": temp_max, "static_frames": static_color_frames,
+                                      "geo_options": geo_options},
+                      tres=cconfd["tres"], cache_dirs=[ply_temp_output_dir_spec])
+            return
+        convert_data.conv_color_geo(h5dns_path=cconfd["h5dns_path"], output_dir=ply_temp_output_dir_spec, tres=cconfd["tres"],
+                                    color_min=temp_min, color_max=temp_max, static_frames=static_color_frames,
+                                    geo_options=geo_options)
 
-    # Add temperature legend colorbar to images
+        # Leave rendering to the render stage jobs
+        if stage == "convert":
+            return
+
+        # Launch Blender to perform rendering
+        blender_launcher.launch_blender_new(blender_config_filedir=blender_config_filedir, python_name="droplet_render.py", blend_name="droplet_render.blend")
+
+    # Add temperature legend colorbar to the images of each view
     if rconfd["add_temp_bar"]:
-        imedit.add_tempmap(bound_min=temp_min*cconfd["tgas"], bound_max=temp_max*cconfd["tgas"], image_dir=image_output_dir_spec, tres=cconfd["tres"])
+        for image_dir in dircheck.get_view_dirs(image_output_dir_spec, len(views)):
+            imedit.add_tempmap(bound_min=temp_min*cconfd["tgas"], bound_max=temp_max*cconfd["tgas"], image_dir=image_dir, tres=cconfd["tres"])
 
-def lambda2(case_config_filepath, render_config_filepath):
+def lambda2(case_config_filepath, render_config_filepath, stage="all", shard=0, num_shards=1, shard_mode="interleaved", preview=0, sweep=None):
     """
     Renders lambda2 contours of droplet data from Michael or Pablo's simulations, given a case config file and render config file.
     :param case_config_filepath: Path to case configuration file, which contains information on the data file to render.
     :param render_config_filepath: Path to render configuration file, which contains information on how to render the data.
+    :param stage: Stage of the render to perform: "all", or "convert", "render" and "composite" when the render is split into several jobs (see create_jobscripts.create_mox_slurm_array)
+    :param shard: Index of the subset of frames to render in the "render" stage
+    :param num_shards: Number of subsets the frames are split into
+    :param shard_mode: How frames are split into subsets: "interleaved" or "contiguous"
+    :param preview: Downsampling factor of a quick-look preview render (see preview_pyramid), or 0 for a full render
+    :param sweep: (optional) convert_sweep to add the conversion of the render to, instead of converting the data now.
+    Only used in the convert stage (see convert_sweep_renders).
     """
 
     # Load config file with all common directory names
@@ -153,17 +313,32 @@ def lambda2(case_config_filepath, render_config_filepath):
     # Main output directory
     case_output = dirname_config["DIRECTORIES"]["RenderOutput"] + cconfd["case_name"] + "/"
 
-    # Determine lambda2 output directories and make them if necessary
+    # In preview mode, render downsampled data at a lower resolution into a separate output tree
+    if preview:
+        cconfd, rconfd, case_output = preview_pyramid.setup_preview(cconfd, rconfd, case_output, preview,
+                                                                    fields=("XVelocity", "YVelocity", "ZVelocity"))
+
+    # Blender config file. In the render stage, it has already been written by the convert stage.
+    blender_config_filedir = case_output + rconfd["render_name"] + "_blender.cfg"
+    if stage == "render":
+        render_shard(blender_config_filedir, shard, num_shards, shard_mode)
+        return
+    elif stage == "composite":
+        return
+
+    # Determine lambda2 output directories and make them if necessary. Contours of other vortex identification fields
+    # (see vortex_fields) are named after the field.
     lambda2_level = rconfd["lambda2_level"]
-    lambda2_specifier = "l2" + str(lambda2_level) + "/"
+    vortex_field = rconfd.get("vortex_field", "Lambda2")
+    lambda2_specifier = ("l2" if vortex_field == "Lambda2" else vortex_field) + str(lambda2_level) + "/"
     geometry_output_dir = case_output + dirname_config["DIRECTORIES"]["ply"]
     ply_lambda2_output_dir = case_output + dirname_config["DIRECTORIES"]["ply_lambda2"] + lambda2_specifier
     image_lambda2_output_dir = case_output + dirname_config["DIRECTORIES"]["tstep_lambda2"] + lambda2_specifier
     image_lambda2_output_dir_spec = dircheck.count_png_dirs(image_lambda2_output_dir)
-    dircheck.check_make([ply_lambda2_output_dir, image_lambda2_output_dir_spec])
+    views = get_views(rconfd, view_fraction=rconfd["view_fraction"])
+    dircheck.check_make([ply_lambda2_output_dir, image_lambda2_output_dir_spec] + dircheck.get_view_dirs(image_lambda2_output_dir_spec, len(views)))
 
     # Write Blender config file
-    blender_config_filedir = case_output + rconfd["render_name"] + "_blender.cfg"
     load_config.write_config_file(config_filedir=blender_config_filedir,
                                   config_dict={"image_output_dir_spec": image_lambda2_output_dir_spec,
                                                "ply_input_dir": ply_lambda2_output_dir,
@@ -172,17 +347,126 @@ def lambda2(case_config_filepath, render_config_filepath):
                                                "view_fraction": rconfd["view_fraction"], "render_scale": 10,
                                                "resolution_percentage": rconfd["resolution_percentage"],
                                                "xres": cconfd["xres"], "yres": cconfd["yres"], "zres": cconfd["zres"],
-                                               "tres": cconfd["tres"], "interface_half_enabled": False,
+                                               "tres": cconfd["tres"],
                                                "fog_enabled": False,
                                                "camera_azimuth_angle": rconfd["camera_azimuth_angle"],
                                                "camera_elevation_angle": rconfd["camera_elevation_angle"],
+                                               "views": render_space.format_views(views),
                                                "bg_color_1": rconfd["bg_color_1"], "bg_color_2": rconfd["bg_color_2"]})
 
     # Extract droplet geometry
     # convert_data.conv_ply(h5dns_path=cconfd["h5dns_path"], output_dir=geometry_output_dir, tres=int(cconfd["tres"]))
 
-    # Extract lambda2 contour geometry
-    convert_data.conv_lambda2_ply(h5dns_path=cconfd["h5dns_path"], output_dir=ply_lambda2_output_dir, tres=cconfd["tres"], contour_level=lambda2_level)
+    # Store the geometry of all timesteps in one mesh archive instead of one .ply file per timestep
+    archiving = mesh_archive.get_archive_params(rconfd)
+    if archiving["use_archive"]:
+        load_config.write_config_file(config_filedir=blender_config_filedir, config_dict={"mesh_archive_path": mesh_archive.get_archive_path(ply_lambda2_output_dir)}, append_config=True)
+
+    # Extract lambda2 contour geometry, decimated to the detail the render can resolve if enabled
+    decimation = mesh_decimate.get_decimation_params(rconfd, dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]),
+                                                     view_fraction=min(view[2] for view in views))
+    culling = frustum_cull.get_culling_params(rconfd, dim=(cconfd["xres"], cconfd["yres"], cconfd["zres"]),
+                                              view_fraction=rconfd["view_fraction"], views=views)
+    geo_options = {**archiving, **decimation, **culling}
+    cached_fields = [field_name.strip() for field_name in rconfd.get("vortex_cache_fields", "").split(",") if field_name.strip()]
+    if sweep is not None:
+        sweep.add(convert_tstep=convert_data.conv_lambda2_tstep,
+                  convert_kwargs={"h5dns_path": cconfd["h5dns_path"], "output_dir": ply_lambda2_output_dir,
+                                  "contour_level": lambda2_level, "field_name": vortex_field, "cached_fields": cached_fields,
+                                  "geo_options": geo_options},
+                  tres=cconfd["tres"], cache_dirs=[ply_lambda2_output_dir])
+        return
+    convert_data.conv_lambda2_ply(h5dns_path=cconfd["h5dns_path"], output_dir=ply_lambda2_output_dir, tres=cconfd["tres"], contour_level=lambda2_level,
+                                  field_name=vortex_field, cached_fields=cached_fields, geo_options=geo_options)
+
+    # Leave rendering to the render stage jobs
+    if stage == "convert":
+        return
 
     # Launch Blender to perform rendering
     blender_launcher.launch_blender_new(blender_config_filedir=blender_config_filedir, python_name="droplet_render.py", blend_name="droplet_render.blend")
+
+def get_render_function(render_config_filepath):
+    """
+    :param render_config_filepath: Path to render configuration file of droplet data, whose filename ends with the type
+    of render, e.g. "render-photorealistic.cfg"
+    :return: Function that performs the render (photorealistic, surf_tempmap or lambda2), or None
+    """
+    rcfg_filename = render_config_filepath.split(".")[-2]
+    if rcfg_filename.endswith("photorealistic"):
+        return photorealistic
+    elif rcfg_filename.endswith("surf_temp"):
+        return surf_tempmap
+    elif rcfg_filename.endswith("lambda2"):
+        return lambda2
+    return None
+
+def get_render_stats(render_config_filepath):
+    """
+    :param render_config_filepath: Path to render configuration file of droplet data
+    :return: Names of the statistics across all timesteps that the render needs (see converters.CASE_STATS)
+    """
+    rconfd = load_config.get_config_params(render_config_filepath)
+    render_function = get_render_function(render_config_filepath)
+    if render_function is photorealistic and rconfd["fog_enabled"]:
+        return ["vapor_max"]
+    elif render_function is surf_tempmap and rconfd["temp_bounds_auto"]:
+        return ["temp_prctiles"]
+    return []
+
+def convert_sweep_renders(case_config_filepath, render_config_filepaths, stage="all", preview=0):
+    """
+    Performs several renders of the same case, converting their data in a single sweep over the timesteps (see
+    convert_sweep): each timestep is read once and converted for all renders. Output directories are the same as those
+    of the separate renders, and each render is then rendered by Blender as in its render stage.
+    :param case_config_filepath: Path to case configuration file, which contains information on the data file to render.
+    :param render_config_filepaths: Paths to the render configuration files of the renders
+    :param stage: "all", or "convert" to only convert the data of the renders
+    :param preview: Downsampling factor of a quick-look preview render (see preview_pyramid), or 0 for a full render
+    """
+
+    # Statistics needed by any of the renders are computed together, if any of them has not been saved yet
+    stats = []
+    for render_config_filepath in render_config_filepaths:
+        stats += [stat for stat in get_render_stats(render_config_filepath) if stat not in stats]
+    sweep = convert_sweep.convert_sweep(stats=stats)
+
+    # Set up each render and add its conversion to the sweep, then convert all of them
+    for render_config_filepath in render_config_filepaths:
+        get_render_function(render_config_filepath)(case_config_filepath, render_config_filepath, stage="convert",
+                                                    preview=preview, sweep=sweep)
+    sweep.run()
+
+    # Leave rendering to the render stage jobs
+    if stage == "convert":
+        return
+
+    # Render the frames of each render with Blender, then add composited overlays
+    for render_config_filepath in render_config_filepaths:
+        render_function = get_render_function(render_config_filepath)
+        render_function(case_config_filepath, render_config_filepath, stage="render", preview=preview)
+        render_function(case_config_filepath, render_config_filepath, stage="composite", preview=preview)
+
+def get_views(rconfd, view_fraction):
+    """
+    Camera views of a render: the views listed in the optional "views" render config setting (see
+    render_space.parse_views), or the single view of the camera angle settings. Each frame is loaded once in Blender and
+    rendered from every view, into a subdirectory of the image output directory per view (see dircheck.get_view_dirs).
+    :param rconfd: Render config dictionary
+    :param view_fraction: View fraction of the single view
+    :return: List of (camera_azimuth_angle, camera_elevation_angle, view_fraction)
+    """
+    return render_space.parse_views(rconfd.get("views", "")) or \
+           [(rconfd["camera_azimuth_angle"], rconfd["camera_elevation_angle"], view_fraction)]
+
+def render_shard(blender_config_filedir, shard, num_shards, shard_mode):
+    """
+    Launches Blender to render one subset (shard) of the frames of a render whose data has already been converted and
+    whose Blender config file has already been written. Used by the render stage of multi-job renders.
+    :param blender_config_filedir: Path to the Blender config file written by the convert stage
+    :param shard: Index of the subset of frames to render
+    :param num_shards: Number of subsets the frames are split into
+    :param shard_mode: How frames are split into subsets: "interleaved" or "contiguous" (see create_jobscripts.get_shard_frames)
+    """
+    blender_launcher.launch_blender_new(blender_config_filedir=blender_config_filedir, python_name="droplet_render.py",
+                                        blend_name="droplet_render.blend", script_args=[shard, num_shards, shard_mode])
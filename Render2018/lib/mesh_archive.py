@@ -0,0 +1,480 @@
+import os
+import sys
+import json
+import struct
+import numpy as np
+from shared_files import file_lock
+# Single-file archive of the geometry of a whole sequence of timesteps, used instead of one .ply file per timestep so
+# that a case does not create thousands of small files (which loads the metadata servers of Lustre scratch filesystems).
+# The archive is append-only: each timestep's geometry is appended as one binary record (float32 vertices, uint32
+# triangles, optional uint8 vertex colors), followed by a footer holding the offset table entries of the new record and
+# the position of the previous footer. Readers only read the last few footers, then seek to the records they need.
+# Archives are read by Blender/droplet_render.py, so the converter modules needed to pack and export .ply files are only
+# imported by the functions that use them.
+#
+# Records are either raw or quantized. Quantized records store each vertex coordinate as a 16-bit step across the
+# bounding box of the frame (which lies within the domain, so the error is at most 1/65535 of the domain size, far below
+# a grid cell) and the triangle indices as varints of the difference to the previous index (which are small, since
+# marching cubes numbers the vertices of neighbouring triangles consecutively), taking around a third of the space.
+#
+# File layout: HEADER_MAGIC, then any number of [record][footer: JSON offset table][uint64 footer length][FOOTER_MAGIC]
+
+# Magic bytes at the start of the file and at the end of each footer
+HEADER_MAGIC = b"MESHSEQ1"
+FOOTER_MAGIC = b"MSEQIDX1"
+
+# Format of the footer length and magic that end the file
+TRAILER_FORMAT = "<Q8s"
+TRAILER_SIZE = struct.calcsize(TRAILER_FORMAT)
+
+# Number of appends after which a footer holds the full offset table again, instead of only the new entries
+FULL_FOOTER_INTERVAL = 64
+
+# Encodings of geometry records (see encode_record)
+ENCODINGS = ("raw", "quantized")
+
+# Number of steps across the bounding box of quantized vertices
+QUANTIZED_MAX = 2**16 - 1
+
+# Filename of the archive within an output directory
+ARCHIVE_NAME = "frames.meshseq"
+
+def get_archive_path(output_dir):
+    """
+    :param output_dir: Geometry output directory
+    :return: Path to the mesh archive of the directory
+    """
+    return os.path.join(output_dir, ARCHIVE_NAME)
+
+class mesh_archive:
+    """
+    Reads and appends the geometry of timesteps in a mesh archive file. Appending a timestep that is already in the
+    archive replaces it (the old record stays in the file until compact is called). Records of any encoding are read,
+    so an archive can hold a mix of encodings.
+    """
+    def __init__(self, archive_path, mode="r", encoding="raw"):
+        """
+        Class initializer. Opens the archive and loads its offset table.
+        :param archive_path: Path to the archive file
+        :param mode: "r" to read, or "a" to read and append (creates the archive if it does not exist)
+        :param encoding: Encoding of appended records, one of ENCODINGS
+        """
+        if encoding not in ENCODINGS:
+            raise ValueError("Unknown mesh archive encoding: " + str(encoding))
+        self.archive_path = archive_path
+        self.mode = mode
+        self.encoding = encoding
+        if mode == "a" and not os.path.isfile(archive_path):
+            # Exclusive creation, in case another process creates the archive at the same time
+            try:
+                with open(archive_path, "xb") as archive_file:
+                    archive_file.write(HEADER_MAGIC)
+            except FileExistsError:
+                pass
+        self.archive_file = open(archive_path, "r+b" if mode == "a" else "rb")
+        if self.archive_file.read(len(HEADER_MAGIC)) != HEADER_MAGIC:
+            raise ValueError("Not a mesh archive: " + archive_path)
+
+        # Timestep -> entry of the offset table
+        self.frames = {}
+        self.load_index()
+
+    def load_index(self):
+        """
+        Loads the offset table from the footers of the archive, starting from the last complete footer. Footers that were
+        only partially written (by a process killed while appending, or still being written by another process) are
+        skipped.
+        """
+
+        # Find the last complete footer
+        self.archive_file.seek(0, os.SEEK_END)
+        end = self.archive_file.tell()
+        footer = self.read_footer(end)
+        while footer is None and end > 0:
+            end = self.find_footer_end(end - 1)
+            footer = self.read_footer(end)
+        self.footer_end = end if footer is not None else 0
+
+        # Each footer only holds the entries appended since the previous one, up to a footer with the full table
+        footers = []
+        while footer is not None:
+            footers.append(footer)
+            if footer["full"]:
+                break
+            footer = self.read_footer(footer["previous"])
+            if footer is None:
+                raise ValueError("Corrupt mesh archive: " + self.archive_path)
+        self.chain_length = len(footers)
+        self.frames = {}
+        for footer in reversed(footers):
+            self.frames.update((int(tstep), entry) for tstep, entry in footer["frames"].items())
+
+    def read_footer(self, end):
+        """
+        Reads the footer that ends at a position of the archive.
+        :param end: Position right after the footer's FOOTER_MAGIC
+        :return: Footer dictionary, or None if there is no complete footer there
+        """
+        if end < len(HEADER_MAGIC) + TRAILER_SIZE:
+            return None
+        self.archive_file.seek(end - TRAILER_SIZE)
+        footer_length, magic = struct.unpack(TRAILER_FORMAT, self.archive_file.read(TRAILER_SIZE))
+        if magic != FOOTER_MAGIC or footer_length > end - TRAILER_SIZE - len(HEADER_MAGIC):
+            return None
+        self.archive_file.seek(end - TRAILER_SIZE - footer_length)
+        try:
+            return json.loads(self.archive_file.read(footer_length).decode())
+        except ValueError:
+            return None
+
+    def find_footer_end(self, end, chunk_size=2**20):
+        """
+        Searches backward through the archive for the end of an earlier footer.
+        :param end: Position before which to search
+        :param chunk_size: Number of bytes read at once
+        :return: Position right after the last FOOTER_MAGIC that ends before end, or 0 if there is none
+        """
+        while end > len(HEADER_MAGIC):
+            start = max(end - chunk_size, len(HEADER_MAGIC))
+            self.archive_file.seek(start)
+            position = self.archive_file.read(end - start).rfind(FOOTER_MAGIC)
+            if position >= 0:
+                return start + position + len(FOOTER_MAGIC)
+            # Overlap chunks so that a magic spanning two chunks is found
+            end = start + len(FOOTER_MAGIC) - 1 if start > len(HEADER_MAGIC) else start
+        return 0
+
+    def tsteps(self):
+        """
+        :return: Sorted list of the timesteps in the archive
+        """
+        return sorted(self.frames.keys())
+
+    def get_key(self, tstep):
+        """
+        :param tstep: Timestep
+        :return: Key the timestep's geometry was appended with (see artifact_cache.get_key), or None if not in the archive
+        """
+        entry = self.frames.get(tstep)
+        return entry["key"] if entry is not None else None
+
+    def is_done(self, tstep, key):
+        """
+        Checks whether the geometry of a timestep is in the archive with the same key and the archive's encoding.
+        :param tstep: Timestep
+        :param key: Key of the geometry (see artifact_cache.get_key)
+        :return: True if the geometry is up to date
+        """
+        entry = self.frames.get(tstep)
+        return entry is not None and entry["key"] == key and entry.get("encoding", "raw") == self.encoding
+
+    def read(self, tstep, load_colors=False):
+        """
+        Reads the geometry of one timestep. If it is not in the archive, the offset table is reloaded first, in case
+        another process has appended it since the archive was opened.
+        :param tstep: Timestep
+        :param load_colors: Whether to also return the vertex colors
+        :return: verts, tris, (vcolors if load_colors): Vertices, triangles, and vertex colors (None if there are none)
+        """
+        if tstep not in self.frames:
+            self.load_index()
+        entry = self.frames[tstep]
+
+        # Read the whole record at once
+        verts, tris, vcolors = decode_record(self.read_record(entry), entry)
+
+        if load_colors:
+            return verts, tris, vcolors
+        return verts, tris
+
+    def append(self, tstep, verts, tris, vcolors=None, key=None):
+        """
+        Appends the geometry of one timestep, replacing any earlier geometry of the timestep.
+        :param tstep: Timestep
+        :param verts: Vertices array
+        :param tris: Triangles array
+        :param vcolors: (optional) Vertex colors array ([R,G,B] ints from 0 to 255, one row per vertex)
+        :param key: (optional) Key of the geometry (see artifact_cache.get_key)
+        """
+        record, entry = encode_record(verts, tris, vcolors, self.encoding)
+        entry["key"] = key
+        self.write_entries({tstep: entry}, record)
+
+    def link(self, source_tstep, tstep, key=None):
+        """
+        Adds a timestep that has the same geometry as another timestep already in the archive, without copying it.
+        :param source_tstep: Timestep whose geometry to reuse
+        :param tstep: Timestep to add
+        :param key: (optional) Key of the geometry (see artifact_cache.get_key)
+        """
+        entry = dict(self.frames[source_tstep], key=key)
+        self.write_entries({tstep: entry})
+
+    def read_record(self, entry):
+        """
+        :param entry: Offset table entry
+        :return: Bytes of the record of the entry
+        """
+        self.archive_file.seek(entry["offset"])
+        return self.archive_file.read(get_record_size(entry))
+
+    def write_entries(self, entries, record=b""):
+        """
+        Appends a record (if any) and a footer with new offset table entries. The archive is locked meanwhile, and the
+        offset table reloaded, so that entries appended by other processes are kept. Every FULL_FOOTER_INTERVAL appends,
+        the footer holds the full offset table, so that readers never follow long chains of footers.
+        :param entries: Dictionary of timestep -> offset table entry. Entries without an offset refer to the record.
+        :param record: Bytes of the record to append
+        """
+        if self.mode != "a":
+            raise ValueError("Mesh archive opened read-only: " + self.archive_path)
+        with file_lock(self.archive_path, exclusive=True):
+            self.load_index()
+            self.archive_file.seek(0, os.SEEK_END)
+            offset = self.archive_file.tell()
+            entries = {tstep: dict(entry, offset=entry.get("offset", offset)) for tstep, entry in entries.items()}
+            self.frames.update(entries)
+            if self.chain_length == 0 or self.chain_length >= FULL_FOOTER_INTERVAL:
+                footer = {"frames": self.frames, "full": True}
+            else:
+                footer = {"frames": entries, "full": False, "previous": self.footer_end}
+            footer = json.dumps(footer).encode()
+            self.archive_file.write(record + footer + struct.pack(TRAILER_FORMAT, len(footer), FOOTER_MAGIC))
+            self.archive_file.flush()
+
+    def compact(self, encoding=None):
+        """
+        Rewrites the archive without the records and footers that are no longer referenced (replaced timesteps and old
+        offset tables). Timesteps that share a record keep sharing it. No other process may be appending meanwhile.
+        :param encoding: (optional) Encoding to convert all records to, one of ENCODINGS
+        """
+        tmp_path = self.archive_path + ".tmp" + str(os.getpid())
+        frames = {}
+        offsets = {}
+        with open(tmp_path, "wb") as tmp_file:
+            tmp_file.write(HEADER_MAGIC)
+            for tstep in self.tsteps():
+                entry = self.frames[tstep]
+                if entry["offset"] not in offsets:
+                    record = self.read_record(entry)
+                    record_entry = entry
+                    if encoding is not None and entry.get("encoding", "raw") != encoding:
+                        record, record_entry = encode_record(*decode_record(record, entry), encoding=encoding)
+                    offsets[entry["offset"]] = (tmp_file.tell(), record_entry)
+                    tmp_file.write(record)
+                offset, record_entry = offsets[entry["offset"]]
+                frames[tstep] = dict(record_entry, key=entry["key"], offset=offset)
+            footer = json.dumps({"frames": frames, "full": True}).encode()
+            tmp_file.write(footer + struct.pack(TRAILER_FORMAT, len(footer), FOOTER_MAGIC))
+        os.replace(tmp_path, self.archive_path)
+
+        # Continue with the compacted archive
+        self.archive_file.close()
+        self.archive_file = open(self.archive_path, "r+b" if self.mode == "a" else "rb")
+        self.frames = frames
+
+    def export_ply(self, tstep, ply_path):
+        """
+        Exports the geometry of one timestep to a .ply file, in the same format as converters.convgeo2ply, for tools
+        that need individual .ply files.
+        :param tstep: Timestep
+        :param ply_path: Path at which to save .ply file
+        """
+        verts, tris, vcolors = self.read(tstep, load_colors=True)
+        with open(ply_path, "w") as ply:
+            ply.write("ply\nformat ascii 1.0\n")
+            ply.write("element vertex " + str(len(verts)) + "\n")
+            ply.write("property float x\nproperty float y\nproperty float z\n")
+            if vcolors is not None:
+                ply.write("property uchar red\nproperty uchar green\nproperty uchar blue\n")
+            ply.write("element face " + str(len(tris)) + "\n")
+            ply.write("property list uchar uint vertex_indices\nend_header\n")
+            if vcolors is not None:
+                np.savetxt(ply, np.hstack((verts, vcolors)), fmt=["%.8g"]*3 + ["%d"]*3)
+            else:
+                np.savetxt(ply, verts, fmt="%.8g")
+            np.savetxt(ply, np.hstack((np.full((len(tris), 1), 3), tris)), fmt="%d")
+        print("Saved PLY file: " + ply_path)
+
+    def close(self):
+        """
+        Closes the archive file.
+        """
+        self.archive_file.close()
+
+    def __enter__(self):
+        """
+        Allows the archive to be used in a with block, which closes it at the end of the block.
+        """
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """
+        Closes the archive at the end of a with block.
+        """
+        self.close()
+
+def get_record_size(entry):
+    """
+    :param entry: Offset table entry
+    :return: Size of the geometry record of the entry in bytes
+    """
+    if "size" in entry:
+        return entry["size"]
+    # Raw records of archives written before records had a size
+    return 12*entry["num_verts"] + 12*entry["num_tris"] + (3*entry["num_verts"] if entry["colors"] else 0)
+
+def encode_record(verts, tris, vcolors=None, encoding="raw"):
+    """
+    Encodes the geometry of one timestep as a record. Raw records hold float32 vertices, uint32 triangles and uint8
+    vertex colors. Quantized records hold uint16 vertices (steps across the bounding box of the vertices), uint8 vertex
+    colors, then the triangles as varints (see encode_indices).
+    :param verts: Vertices array
+    :param tris: Triangles array
+    :param vcolors: (optional) Vertex colors array ([R,G,B] ints from 0 to 255, one row per vertex)
+    :param encoding: Encoding of the record, one of ENCODINGS
+    :return: record, entry: Bytes of the record, and its offset table entry (without offset and key)
+    """
+    entry = {"num_verts": len(verts), "num_tris": len(tris), "colors": vcolors is not None, "encoding": encoding}
+    colors = np.ascontiguousarray(vcolors, dtype=np.uint8).tobytes() if vcolors is not None else b""
+    if encoding == "quantized":
+        verts = np.asarray(verts, dtype=float).reshape(-1, 3)
+        box_min = verts.min(axis=0) if len(verts) else np.zeros(3)
+        box_max = verts.max(axis=0) if len(verts) else np.zeros(3)
+        step = np.where(box_max > box_min, (box_max - box_min)/QUANTIZED_MAX, 1)
+        quantized = np.round((verts - box_min)/step).astype("<u2")
+        record = quantized.tobytes() + colors + encode_indices(tris)
+        entry["box"] = box_min.tolist() + box_max.tolist()
+    else:
+        record = np.ascontiguousarray(verts, dtype="<f4").tobytes() + np.ascontiguousarray(tris, dtype="<u4").tobytes() + colors
+    entry["size"] = len(record)
+    return record, entry
+
+def decode_record(record, entry):
+    """
+    Decodes the geometry of one timestep from its record (see encode_record).
+    :param record: Bytes of the record
+    :param entry: Offset table entry of the record
+    :return: verts, tris, vcolors: Vertices, triangles, and vertex colors (None if there are none)
+    """
+    num_verts = entry["num_verts"]
+    num_tris = entry["num_tris"]
+    if entry.get("encoding", "raw") == "quantized":
+        box_min = np.array(entry["box"][:3])
+        box_max = np.array(entry["box"][3:])
+        step = np.where(box_max > box_min, (box_max - box_min)/QUANTIZED_MAX, 1)
+        quantized = np.frombuffer(record, dtype="<u2", count=3*num_verts).reshape(num_verts, 3)
+        verts = (box_min + quantized*step).astype(np.float32)
+        colors_offset = 6*num_verts
+        tris_offset = colors_offset + (3*num_verts if entry["colors"] else 0)
+        tris = decode_indices(record[tris_offset:], num_tris)
+    else:
+        verts = np.frombuffer(record, dtype="<f4", count=3*num_verts).reshape(num_verts, 3)
+        tris = np.frombuffer(record, dtype="<u4", count=3*num_tris, offset=12*num_verts).reshape(num_tris, 3)
+        colors_offset = 12*(num_verts + num_tris)
+    vcolors = None
+    if entry["colors"]:
+        vcolors = np.frombuffer(record, dtype=np.uint8, count=3*num_verts, offset=colors_offset).reshape(num_verts, 3)
+    return verts, tris, vcolors
+
+def encode_indices(tris):
+    """
+    Encodes triangle indices as LEB128 varints (7 bits per byte, high bit set on all but the last byte of a value) of the
+    zigzag-coded difference of each index to the previous one.
+    :param tris: Triangles array
+    :return: Bytes of the encoded indices
+    """
+
+    # Differences to the previous index, mapped to unsigned ints (0, -1, 1, -2, ... -> 0, 1, 2, 3, ...)
+    deltas = np.diff(np.asarray(tris, dtype=np.int64).reshape(-1), prepend=0)
+    values = ((deltas << 1) ^ (deltas >> 63)).astype(np.uint64)
+
+    # Number of bytes of each value, and the value and position within it of each byte
+    num_bytes = np.ones(len(values), dtype=np.int64)
+    for byte_n in range(1, 10):
+        num_bytes += values >= np.uint64(1 << 7*byte_n)
+    value_ids = np.repeat(np.arange(len(values)), num_bytes)
+    positions = np.arange(len(value_ids)) - np.repeat(np.cumsum(num_bytes) - num_bytes, num_bytes)
+
+    # 7 bits of the value per byte, with the high bit set on all but the last byte
+    encoded = (values[value_ids] >> (7*positions).astype(np.uint64)) & np.uint64(0x7f)
+    encoded |= (positions < num_bytes[value_ids] - 1).astype(np.uint64) << np.uint64(7)
+    return encoded.astype(np.uint8).tobytes()
+
+def decode_indices(data, num_tris):
+    """
+    Decodes triangle indices encoded with encode_indices.
+    :param data: Bytes of the encoded indices
+    :param num_tris: Number of triangles
+    :return: Triangles array
+    """
+
+    if num_tris == 0:
+        return np.zeros((0, 3), dtype=np.uint32)
+
+    # Each value ends at a byte without the high bit
+    encoded = np.frombuffer(data, dtype=np.uint8)
+    ends = np.flatnonzero(encoded < 0x80)[:3*num_tris]
+    encoded = encoded[:ends[-1] + 1]
+    starts = np.concatenate(([0], ends[:-1] + 1))
+    positions = np.arange(len(encoded)) - np.repeat(starts, ends - starts + 1)
+
+    # Sum the 7-bit groups of each value, then undo the zigzag coding and differences
+    groups = (encoded & 0x7f).astype(np.uint64) << (7*positions).astype(np.uint64)
+    values = np.add.reduceat(groups, starts)
+    deltas = (values >> np.uint64(1)).astype(np.int64) ^ -(values & np.uint64(1)).astype(np.int64)
+    return np.cumsum(deltas).astype(np.uint32).reshape(num_tris, 3)
+
+def get_archive_params(rconfd):
+    """
+    Mesh archive settings of a render, from the optional mesh_archive_enabled and mesh_archive_quantized render config
+    settings.
+    :param rconfd: Render config dictionary
+    :return: Dictionary with the use_archive and archive_encoding options of the exported geometry (see
+    convert_data.GEO_OPTIONS)
+    """
+    return {"use_archive": rconfd.get("mesh_archive_enabled", False),
+            "archive_encoding": "quantized" if rconfd.get("mesh_archive_quantized", False) else "raw"}
+
+def pack_ply_dir(ply_dir, tres, archive_path=None, encoding="raw"):
+    """
+    Packs the .ply files of a geometry output directory into a mesh archive, e.g. to convert the output of earlier
+    renders. The .ply files are left in place.
+    :param ply_dir: Directory of frame_N.ply files
+    :param tres: Number of timesteps
+    :param archive_path: (optional) Path to the archive, defaults to get_archive_path(ply_dir)
+    :param encoding: Encoding of the records, one of ENCODINGS
+    :return: Path to the archive
+    """
+    from converters import convply2geo
+    from dircheck import get_output_filepath
+    archive_path = archive_path or get_archive_path(ply_dir)
+    with mesh_archive(archive_path, "a", encoding) as archive:
+        for tstep in range(tres):
+            ply_path = get_output_filepath(ply_dir, tstep, ".ply")
+            if os.path.isfile(ply_path):
+                verts, tris, vcolors = convply2geo(ply_path, load_colors=True)
+                archive.append(tstep, verts, tris, vcolors)
+    print("Saved mesh archive: " + archive_path)
+    return archive_path
+
+def export_ply_dir(archive_path, output_dir):
+    """
+    Exports all timesteps of a mesh archive to frame_N.ply files.
+    :param archive_path: Path to the archive
+    :param output_dir: Directory to export .ply files to
+    """
+    from dircheck import get_output_filepath
+    with mesh_archive(archive_path) as archive:
+        for tstep in archive.tsteps():
+            archive.export_ply(tstep, get_output_filepath(output_dir, tstep, ".ply"))
+
+if __name__ == "__main__":
+    # Commands: pack <ply_dir> <tres> [encoding], export <archive_path> <output_dir>, compact <archive_path> [encoding]
+    if sys.argv[1] == "pack":
+        pack_ply_dir(sys.argv[2], int(sys.argv[3]), encoding=sys.argv[4] if len(sys.argv) > 4 else "raw")
+    elif sys.argv[1] == "export":
+        export_ply_dir(sys.argv[2], sys.argv[3])
+    elif sys.argv[1] == "compact":
+        with mesh_archive(sys.argv[2], "a") as archive:
+            archive.compact(sys.argv[3] if len(sys.argv) > 3 else None)
@@ -0,0 +1,315 @@
+import numpy as np
+# Numpy implementation of the half-cut performed by Blender/split_half.cut_mesh, operating directly on vertex and triangle
+# arrays. Used by convert_data.conv_half_ply to cut the geometry once in the converter stage, instead of in Blender on
+# every frame.
+
+def clip_geo(verts, tris, plane_point=(0,0,0), plane_normal=(1,0,0), vcolors=None, cap=True):
+    """
+    Cuts geometry at a plane, deleting everything in front of the plane (in the direction of the normal vector) and
+    filling the cut with a flat cross-sectional surface. Vertices are classified in one pass, triangles that cross the
+    plane are split along it, and the loops of cut edges are triangulated to form the cap (see triangulate_cap). Cut
+    edges that end on a vertex lying on the plane reuse that vertex, and triangles of zero area are removed.
+    :param verts: Vertices array
+    :param tris: Triangles array. Should be welded (see converters.weld_geo) so that the cut edges form closed loops
+    :param plane_point: Any point on the cut plane
+    :param plane_normal: Vector normal to the cut plane, pointing toward the side to delete
+    :param vcolors: (optional) vertex colors associated with each vert, interpolated onto new vertices
+    :param cap: Whether to fill the cross-section at the cut plane
+    :return: verts, tris, (vcolors if given): Geometry on the kept side of the plane
+    """
+
+    verts = np.asarray(verts, dtype=float)
+    tris = np.asarray(tris, dtype=np.int64)
+    n = np.array(plane_normal, dtype=float)
+    n = n/np.linalg.norm(n)
+    num_verts = len(verts)
+
+    # Signed distance of each vertex from the plane; vertices on the plane are kept. Vertices within rounding error of
+    # the plane are taken to be on it, so that cutting next to them does not create sliver triangles.
+    dist = (verts - np.array(plane_point, dtype=float)) @ n
+    if num_verts > 0:
+        dist[np.abs(dist) <= 1E-9*np.max(np.ptp(verts, axis=0))] = 0
+    inside = dist <= 0
+
+    # Count kept corners of each triangle
+    tri_inside = inside[tris]
+    num_inside = np.sum(tri_inside, axis=1)
+    kept_tris = tris[num_inside == 3]
+
+    # Rotate crossing triangles (preserving winding) so that the lone vertex - the only kept one, or the only deleted
+    # one - comes first. Each crossing triangle is then (a, b, c) with the cut going through edges ab and ac.
+    crossing = (num_inside == 1) | (num_inside == 2)
+    cross_tris = tris[crossing]
+    cross_num_inside = num_inside[crossing]
+    lone_mask = tri_inside[crossing] == (cross_num_inside == 1)[:,None]
+    first = np.argmax(lone_mask, axis=1)
+    order = (first[:,None] + np.arange(3)[None,:]) % 3
+    cross_tris = np.take_along_axis(cross_tris, order, axis=1)
+    a, b, c = cross_tris[:,0], cross_tris[:,1], cross_tris[:,2]
+
+    # Create one new vertex per cut edge. Edges are shared between neighboring triangles, so identify them by their
+    # sorted vertex pair to keep the cut mesh connected.
+    edges = np.concatenate((np.stack((a, b), axis=1), np.stack((a, c), axis=1)))
+    edge_keys = np.min(edges, axis=1)*num_verts + np.max(edges, axis=1)
+    unique_keys, unique_ids, edge_new = np.unique(edge_keys, return_index=True, return_inverse=True)
+    edge_new = edge_new.reshape(-1) + num_verts
+    unique_edges = edges[unique_ids]
+    d0 = dist[unique_edges[:,0]]
+    d1 = dist[unique_edges[:,1]]
+    t = (d0/(d0 - d1))[:,None]
+    new_verts = verts[unique_edges[:,0]] + t*(verts[unique_edges[:,1]] - verts[unique_edges[:,0]])
+
+    # Cut edges that end on the plane are cut at their end vertex, which is used instead of a duplicate of it
+    new_ids = np.arange(len(unique_edges)) + num_verts
+    new_ids[d0 == 0] = unique_edges[d0 == 0, 0]
+    new_ids[d1 == 0] = unique_edges[d1 == 0, 1]
+    edge_new = new_ids[edge_new - num_verts]
+    ab = edge_new[:len(a)]
+    ac = edge_new[len(a):]
+
+    # One kept corner: keep the triangle (a, ab, ac). Its cut edge runs from ab to ac.
+    one = cross_num_inside == 1
+    one_tris = np.stack((a[one], ab[one], ac[one]), axis=1)
+
+    # Two kept corners: keep the quadrilateral (ab, b, c, ac) as two triangles. Its cut edge runs from ac to ab.
+    two = ~one
+    two_tris = np.concatenate((np.stack((ab[two], b[two], c[two]), axis=1),
+                               np.stack((ab[two], c[two], ac[two]), axis=1)))
+
+    # Directed cut edges, oriented consistently with the winding of the kept triangles
+    cut_edges = np.concatenate((np.stack((ab[one], ac[one]), axis=1), np.stack((ac[two], ab[two]), axis=1)))
+    cut_edges = cut_edges[cut_edges[:,0] != cut_edges[:,1]]
+
+    out_verts = np.concatenate((verts, new_verts))
+    out_tris = np.concatenate((kept_tris, one_tris, two_tris))
+    if vcolors is not None:
+        vcolors = np.asarray(vcolors)
+        new_colors = vcolors[unique_edges[:,0]] + t*(vcolors[unique_edges[:,1]] - vcolors[unique_edges[:,0]])
+        out_colors = np.concatenate((vcolors, new_colors)).astype(vcolors.dtype)
+
+    # Fill the cross-section
+    if cap and len(cut_edges) > 0:
+        out_tris = np.concatenate((out_tris, triangulate_cap(out_verts, get_edge_loops(cut_edges), n)))
+
+    # Remove triangles of zero area, left where the plane passes through vertices or along edges
+    out_tris = out_tris[get_tri_areas(out_verts, out_tris) > 0]
+
+    # Remove vertices that are no longer used by any triangle
+    used = np.zeros(len(out_verts), dtype=bool)
+    used[out_tris.flatten()] = True
+    new_ids = np.cumsum(used) - 1
+    out_tris = new_ids[out_tris]
+    out_verts = out_verts[used]
+
+    if vcolors is not None:
+        return out_verts, out_tris, out_colors[used]
+    return out_verts, out_tris
+
+def get_edge_loops(edges):
+    """
+    Chains directed edges into closed loops. Open chains (from geometry that was not closed) are also returned.
+    :param edges: Array of directed edges, each row is (start vertex, end vertex)
+    :return: List of loops, each an array of vertex indices in order
+    """
+
+    # Map each start vertex to the end of its edge
+    next_vert = dict(zip(edges[:,0].tolist(), edges[:,1].tolist()))
+    is_end = set(edges[:,1].tolist())
+
+    # Start open chains from their first vertex, then walk the remaining closed loops
+    starts = [vert for vert in next_vert if vert not in is_end] + list(next_vert.keys())
+    loops = []
+    for start in starts:
+        if start not in next_vert:
+            continue
+        loop = []
+        vert = start
+        while vert in next_vert:
+            loop.append(vert)
+            vert = next_vert.pop(vert)
+        if len(loop) >= 3:
+            loops.append(np.array(loop))
+
+    return loops
+
+def get_tri_areas(verts, tris):
+    """
+    :param verts: Vertices array
+    :param tris: Triangles array
+    :return: Area of each triangle
+    """
+    return np.linalg.norm(np.cross(verts[tris[:,1]] - verts[tris[:,0]], verts[tris[:,2]] - verts[tris[:,0]]), axis=1)/2
+
+def get_plane_axes(normal):
+    """
+    :param normal: Normal of a plane
+    :return: u, w: Unit vectors spanning the plane, chosen such that u x w = normal
+    """
+    helper = np.array([0,0,1.0]) if abs(normal[2]) < 0.9 else np.array([1.0,0,0])
+    u = np.cross(helper, normal)
+    u = u/np.linalg.norm(u)
+    return u, np.cross(normal, u)
+
+def get_signed_area(pts):
+    """
+    :param pts: 2D polygon vertices, in order
+    :return: Area of the polygon, positive if it is counterclockwise
+    """
+    return np.sum(pts[:,0]*np.roll(pts[:,1], -1) - np.roll(pts[:,0], -1)*pts[:,1])/2
+
+def triangulate_cap(verts, loops, normal):
+    """
+    Triangulates the cross-section bounded by the loops of cut edges, with triangles that face along the normal (away
+    from the kept geometry). The cut edges are oriented by the winding of the kept triangles, so in the plane, the outer
+    boundaries of the cross-section run clockwise around the normal and the boundaries of holes in it (e.g. where a hollow
+    or ring-shaped interface is cut) run counterclockwise. Each hole is bridged to the outer boundary that contains it,
+    so that it is left open, and each outer boundary is then triangulated by ear clipping. Ear clipping runs in Python
+    over the vertices of the cut loops only, which are few compared to the vertices of the mesh.
+    :param verts: Vertices array
+    :param loops: Loops of cut edges (see get_edge_loops)
+    :param normal: Unit normal of the cut plane
+    :return: Triangles array of the cap
+    """
+
+    # Project the loops onto the plane. Reverse them, so that outer boundaries are counterclockwise and holes clockwise.
+    u, w = get_plane_axes(normal)
+    loops = [loop[::-1] for loop in loops]
+    loop_pts = [np.stack((verts[loop] @ u, verts[loop] @ w), axis=1) for loop in loops]
+    areas = [get_signed_area(pts) for pts in loop_pts]
+    outers = [[loop, pts] for loop, pts, area in zip(loops, loop_pts, areas) if area > 0]
+    holes = [(loop, pts) for loop, pts, area in zip(loops, loop_pts, areas) if area < 0]
+
+    # Bridge each hole to the smallest outer boundary that contains it, holes furthest along u first (so that bridges
+    # from later holes can pass over the ones already bridged)
+    for hole, hole_pts in sorted(holes, key=lambda hole: -np.max(hole[1][:,0])):
+        containing = [outer for outer in outers if is_point_in_polygon(hole_pts[0], outer[1])]
+        if len(containing) == 0:
+            continue
+        outer = min(containing, key=lambda outer: get_signed_area(outer[1]))
+        outer[0], outer[1] = bridge_hole(outer[0], outer[1], hole, hole_pts)
+
+    tris = [triangulate_polygon(pts, loop) for loop, pts in outers]
+    return np.concatenate(tris) if len(tris) > 0 else np.zeros((0, 3), dtype=np.int64)
+
+def is_point_in_polygon(point, pts):
+    """
+    :param point: 2D point
+    :param pts: 2D polygon vertices, in order
+    :return: True if the point lies inside the polygon (even-odd rule)
+    """
+    next_pts = np.roll(pts, -1, axis=0)
+    straddles = (pts[:,1] > point[1]) != (next_pts[:,1] > point[1])
+    with np.errstate(divide="ignore", invalid="ignore"):
+        x_cross = pts[:,0] + (point[1] - pts[:,1])*(next_pts[:,0] - pts[:,0])/(next_pts[:,1] - pts[:,1])
+    return bool(np.sum(straddles & (x_cross > point[0])) % 2)
+
+def bridge_hole(outer, outer_pts, hole, hole_pts):
+    """
+    Joins a hole to the polygon that contains it with a pair of coincident edges (a bridge), so that the polygon and
+    hole form a single polygon. The bridge joins the vertex of the hole furthest along u to the closest polygon vertex
+    that it can reach without crossing an edge.
+    :param outer: Vertex indices of the counterclockwise polygon
+    :param outer_pts: 2D vertices of the polygon
+    :param hole: Vertex indices of the clockwise hole
+    :param hole_pts: 2D vertices of the hole
+    :return: Vertex indices and 2D vertices of the joined polygon
+    """
+    j = int(np.argmax(hole_pts[:,0]))
+    start = hole_pts[j]
+
+    # Edges the bridge must not cross: those of the polygon and of the hole
+    edge_starts = np.concatenate((outer_pts, hole_pts))
+    edge_ends = np.concatenate((np.roll(outer_pts, -1, axis=0), np.roll(hole_pts, -1, axis=0)))
+
+    # Try the polygon vertices from the closest one
+    i = None
+    for candidate in np.argsort(np.sum((outer_pts - start)**2, axis=1)):
+        if not any_segment_crossing(start, outer_pts[candidate], edge_starts, edge_ends):
+            i = int(candidate)
+            break
+    if i is None:
+        i = int(np.argmin(np.sum((outer_pts - start)**2, axis=1)))
+
+    # Walk the polygon to the bridge, around the hole and back across the bridge
+    hole_order = np.concatenate((np.arange(j, len(hole)), np.arange(0, j + 1)))
+    order_ids = np.concatenate((outer[:i + 1], hole[hole_order], outer[i:]))
+    order_pts = np.concatenate((outer_pts[:i + 1], hole_pts[hole_order], outer_pts[i:]))
+    return order_ids, order_pts
+
+def any_segment_crossing(p0, p1, edge_starts, edge_ends, eps=1E-12):
+    """
+    Checks whether a 2D segment properly crosses any of the given edges. Edges that share an end point with the segment
+    do not count as crossing.
+    :param p0, p1: End points of the segment
+    :param edge_starts, edge_ends: Arrays of the end points of the edges
+    :return: True if the segment crosses an edge
+    """
+    def orient(a, b, c):
+        return (b[...,0] - a[...,0])*(c[...,1] - a[...,1]) - (b[...,1] - a[...,1])*(c[...,0] - a[...,0])
+    d0 = orient(p0, p1, edge_starts)
+    d1 = orient(p0, p1, edge_ends)
+    d2 = orient(edge_starts, edge_ends, p0)
+    d3 = orient(edge_starts, edge_ends, p1)
+    crossing = (d0*d1 < -eps) & (d2*d3 < -eps)
+    return bool(np.any(crossing))
+
+def triangulate_polygon(pts, ids):
+    """
+    Triangulates a counterclockwise 2D polygon by ear clipping. Works for concave polygons, and for polygons joined to
+    their holes by bridges (see bridge_hole).
+    :param pts: 2D polygon vertices, in order
+    :param ids: Vertex indices that correspond to each polygon vertex
+    :return: Triangles array (vertex indices), counterclockwise in the plane of the polygon
+    """
+    idx = list(range(len(pts)))
+    tris = []
+    k = 0
+    while len(idx) > 3:
+        m = len(idx)
+        remaining = pts[idx]
+
+        # Convexity of every corner of the remaining polygon
+        prev_pts = np.roll(remaining, 1, axis=0)
+        next_pts = np.roll(remaining, -1, axis=0)
+        cross = (remaining[:,0] - prev_pts[:,0])*(next_pts[:,1] - remaining[:,1]) - \
+                (remaining[:,1] - prev_pts[:,1])*(next_pts[:,0] - remaining[:,0])
+
+        # Corners on a straight stretch of the boundary would give triangles of zero area, so they are not clipped as
+        # ears; they end up in the triangles of their neighbors instead
+        convex = cross > 1E-9*np.linalg.norm(remaining - prev_pts, axis=1)*np.linalg.norm(next_pts - remaining, axis=1)
+
+        # Search for an ear, starting from where the last one was clipped
+        ear = None
+        for offset in range(m):
+            j = (k + offset) % m
+            if not convex[j]:
+                continue
+            if not any_point_in_triangle(remaining, prev_pts[j], remaining[j], next_pts[j]):
+                ear = j
+                break
+
+        # No ear found (degenerate polygon): clip the most convex corner anyway
+        if ear is None:
+            ear = int(np.argmax(cross))
+
+        tris.append([ids[idx[ear - 1]], ids[idx[ear]], ids[idx[(ear + 1) % m]]])
+        del idx[ear]
+        k = ear
+
+    tris.append([ids[idx[0]], ids[idx[1]], ids[idx[2]]])
+
+    return np.array(tris, dtype=np.int64)
+
+def any_point_in_triangle(pts, p0, p1, p2, eps=1E-12):
+    """
+    Checks whether any of the given 2D points lie strictly inside a counterclockwise triangle. Points that coincide with
+    a corner of the triangle are ignored.
+    :param pts: Array of 2D points
+    :param p0, p1, p2: Triangle corners
+    :return: True if a point lies inside the triangle
+    """
+    d0 = (p1[0] - p0[0])*(pts[:,1] - p0[1]) - (p1[1] - p0[1])*(pts[:,0] - p0[0])
+    d1 = (p2[0] - p1[0])*(pts[:,1] - p1[1]) - (p2[1] - p1[1])*(pts[:,0] - p1[0])
+    d2 = (p0[0] - p2[0])*(pts[:,1] - p2[1]) - (p0[1] - p2[1])*(pts[:,0] - p2[0])
+    inside = (d0 > eps) & (d1 > eps) & (d2 > eps)
+    return bool(np.any(inside))
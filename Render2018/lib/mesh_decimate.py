@@ -0,0 +1,108 @@
+import numpy as np
+from stage_timer import timed
+# Decimation of exported geometry by vertex clustering. Marching cubes on fine grids produces many more triangles than
+# a rendered frame can resolve, which bloats the .ply files and Blender's memory use and import time. Vertices are
+# grouped into the cells of a uniform grid, each group is merged into one vertex at its mean position (with its mean
+# color), and triangles that collapse are removed. With cells smaller than a pixel, the decimated mesh renders the same.
+
+# Width of a frame rendered at 100% resolution (4K), in pixels
+FULL_RESOLUTION_WIDTH = 3840
+
+def get_cell_size(dim, view_fraction, resolution_percentage, pixel_error=1.0):
+    """
+    Clustering cell size from a screen-space error: the size (in grid units) that spans pixel_error pixels at the
+    center of the view, where the camera is focused.
+    :param dim: (x,y,z) resolution of the domain
+    :param view_fraction: Portion of the domain shown in the frame width (see render_space.get_camera_angle)
+    :param resolution_percentage: Render resolution percentage, as a percentage of 4K
+    :param pixel_error: Largest allowed displacement of the surface, in pixels
+    :return: Clustering cell size, in grid units
+    """
+    width = FULL_RESOLUTION_WIDTH*resolution_percentage/100
+    return pixel_error*view_fraction*dim[1]/width
+
+def cluster_vertices(verts, tris, cell_size, vcolors=None):
+    """
+    Decimates geometry by merging all vertices within each cell of a uniform grid.
+    :param verts: Vertices array
+    :param tris: Triangles array
+    :param cell_size: Edge length of the grid cells, in the units of verts
+    :param vcolors: (optional) Array of vertex colors (one row per vertex), averaged over merged vertices
+    :return: verts, tris, vcolors: Decimated geometry (vcolors is None if not given)
+    """
+
+    # Find the cell of every vertex, and the new index of every original vertex
+    verts = np.asarray(verts, dtype=float)
+    keys = np.floor(verts/cell_size).astype(np.int64)
+    _, inverse, counts = np.unique(keys, axis=0, return_inverse=True, return_counts=True)
+    inverse = inverse.reshape(-1)
+
+    # Merge the vertices of each cell into their mean position and color
+    new_verts = np.zeros((len(counts), 3))
+    np.add.at(new_verts, inverse, verts)
+    new_verts /= counts[:,np.newaxis]
+    if vcolors is not None:
+        vcolors = np.asarray(vcolors)
+        new_colors = np.zeros((len(counts), vcolors.shape[1]))
+        np.add.at(new_colors, inverse, vcolors)
+        new_colors /= counts[:,np.newaxis]
+        if np.issubdtype(vcolors.dtype, np.integer):
+            new_colors = np.round(new_colors)
+        vcolors = new_colors.astype(vcolors.dtype)
+
+    # Remove triangles that collapsed, and duplicates of triangles that remain
+    tris = inverse[np.asarray(tris, dtype=np.int64)]
+    valid = (tris[:,0] != tris[:,1]) & (tris[:,1] != tris[:,2]) & (tris[:,2] != tris[:,0])
+    tris = tris[valid]
+    _, unique_ids = np.unique(np.sort(tris, axis=1), axis=0, return_index=True)
+    tris = tris[np.sort(unique_ids)]
+
+    # Remove vertices that are no longer part of any triangle
+    used = np.zeros(len(new_verts), dtype=bool)
+    used[tris] = True
+    new_ids = np.cumsum(used) - 1
+    return new_verts[used], new_ids[tris], vcolors[used] if vcolors is not None else None
+
+@timed()
+def decimate_geo(verts, tris, cell_size=0, max_tris=0, vcolors=None, growth=1.25):
+    """
+    Decimates geometry to a screen-space error and/or a triangle budget. The mesh is first clustered with the given cell
+    size, then, if it still has more triangles than the budget, clustered with cells growing by a constant factor until
+    it fits. Meshes that are already within the budget are left unchanged.
+    :param verts: Vertices array
+    :param tris: Triangles array
+    :param cell_size: Clustering cell size, in the units of verts (see get_cell_size), or 0 for none
+    :param max_tris: Largest number of triangles to keep, or 0 for no budget
+    :param vcolors: (optional) Array of vertex colors (one row per vertex), preserved by averaging
+    :param growth: Factor by which the cell size grows on each attempt to meet the triangle budget
+    :return: verts, tris, vcolors: Decimated geometry (vcolors is None if not given)
+    """
+    tris = np.asarray(tris)
+    num_tris = len(tris)
+    if cell_size > 0:
+        verts, tris, vcolors = cluster_vertices(verts, tris, cell_size, vcolors)
+
+    # Start the budget search from the mean edge length, below which clustering barely reduces the mesh
+    if max_tris > 0 and len(tris) > max_tris:
+        original = (verts, tris, vcolors)
+        edges = np.asarray(verts)[tris[:,[1, 2, 0]]] - np.asarray(verts)[tris]
+        budget_cell_size = max(cell_size, np.mean(np.linalg.norm(edges, axis=2)))
+        while len(tris) > max_tris:
+            verts, tris, vcolors = cluster_vertices(*original[:2], budget_cell_size, original[2])
+            budget_cell_size *= growth
+
+    print("Decimated geometry from " + str(num_tris) + " to " + str(len(tris)) + " triangles")
+    return verts, tris, vcolors
+
+def get_decimation_params(rconfd, dim, view_fraction):
+    """
+    Decimation settings of a render, from the optional decimate_pixel_error and max_triangles render config settings.
+    :param rconfd: Render config dictionary
+    :param dim: (x,y,z) resolution of the domain
+    :param view_fraction: Portion of the domain shown in the frame width
+    :return: Dictionary with the decimate_cell_size and max_tris options of the exported geometry (0 to disable, see
+    convert_data.GEO_OPTIONS)
+    """
+    pixel_error = rconfd.get("decimate_pixel_error", 0)
+    cell_size = get_cell_size(dim, view_fraction, rconfd["resolution_percentage"], pixel_error) if pixel_error > 0 else 0
+    return {"decimate_cell_size": cell_size, "max_tris": int(rconfd.get("max_triangles", 0))}
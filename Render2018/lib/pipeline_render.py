@@ -0,0 +1,103 @@
+import threading
+import queue
+import multiprocessing
+import blender_launcher
+from stage_timer import timed
+from artifact_cache import get_cache
+# Pipelined conversion and rendering: conversion of upcoming timesteps runs in worker processes while a single Blender
+# process renders the timesteps that are already converted, so that the total time approaches the larger of the
+# conversion and render times instead of their sum.
+
+# Line printed by the Blender render scripts after each frame in pipeline mode
+FRAME_DONE_MARKER = "PIPELINE_FRAME_DONE"
+
+# Output directory -> artifact_cache, created once by each worker process (see init_worker)
+worker_caches = {}
+
+def render_pipelined(convert_tstep, convert_kwargs, tres, blend_name, python_name, blender_config_filedir, num_workers=1, queue_size=2,
+                     cache_dirs=()):
+    """
+    Converts and renders a series of timesteps in a pipeline. Timesteps are converted by a pool of worker processes and
+    handed to a running Blender process in order. At most queue_size converted timesteps wait to be rendered, which
+    bounds how far conversion can run ahead of rendering.
+    :param convert_tstep: Function that converts one timestep, called as convert_tstep(tstep, caches=caches,
+    **convert_kwargs) with the artifact caches of the worker. Must be a module-level function so that it can be run in
+    worker processes.
+    :param convert_kwargs: Dictionary of keyword arguments to pass to convert_tstep
+    :param tres: Number of timesteps
+    :param blend_name: Blender file to load
+    :param python_name: Python file to run in Blender's Python API to perform rendering (must support pipeline mode)
+    :param blender_config_filedir: Path to the Blender config file, which must have pipeline_enabled set
+    :param num_workers: Number of conversion worker processes
+    :param queue_size: Maximum number of converted timesteps waiting to be rendered
+    :param cache_dirs: (optional) Output directories of the conversion, whose artifact caches are created once by each
+    worker rather than on every timestep
+    """
+
+    pool = multiprocessing.Pool(num_workers, initializer=init_worker, initargs=(cache_dirs,))
+    ready = queue.Queue(maxsize=queue_size)
+
+    # Submit conversions in timestep order. Blocks while the queue is full, so conversion does not run far ahead.
+    def submit_conversions():
+        for tstep in range(tres):
+            ready.put(pool.apply_async(convert_in_worker, (convert_tstep, tstep, convert_kwargs)))
+        ready.put(None)
+    producer = threading.Thread(target=submit_conversions)
+    producer.daemon = True
+    producer.start()
+
+    blender = blender_launcher.launch_blender_pipe(blend_name=blend_name, python_name=python_name, blender_config_filedir=blender_config_filedir)
+    try:
+        while True:
+            conversion = ready.get()
+            if conversion is None:
+                break
+
+            # Wait for this timestep to finish converting (re-raises any conversion error), then render it
+            tstep = conversion.get()
+            blender.stdin.write(str(tstep) + "\n")
+            blender.stdin.flush()
+            wait_for_frame(blender, tstep)
+
+        # Tell Blender that there are no more frames
+        blender.stdin.close()
+        blender.wait()
+    except BaseException:
+        blender.kill()
+        pool.terminate()
+        raise
+
+    pool.close()
+    pool.join()
+
+def init_worker(cache_dirs):
+    """
+    Initializes a conversion worker process: creates the artifact caches of the output directories, which then serve
+    all the timesteps the worker converts.
+    :param cache_dirs: Output directories of the conversion
+    """
+    for cache_dir in cache_dirs:
+        worker_caches[cache_dir] = get_cache(cache_dir)
+
+def convert_in_worker(convert_tstep, tstep, convert_kwargs):
+    """
+    Converts one timestep in a worker process, with the artifact caches of the worker.
+    :param convert_tstep: Function that converts one timestep (see render_pipelined)
+    :param tstep: Timestep to convert
+    :param convert_kwargs: Dictionary of keyword arguments to pass to convert_tstep
+    :return: Return value of convert_tstep
+    """
+    return convert_tstep(tstep, caches=worker_caches, **convert_kwargs)
+
+@timed("blender_frame_wait")
+def wait_for_frame(blender, tstep):
+    """
+    Passes on Blender's output until it reports that a frame has been rendered.
+    :param blender: Blender process (see blender_launcher.launch_blender_pipe)
+    :param tstep: Frame that Blender is rendering
+    """
+    for line in blender.stdout:
+        print(line, end="")
+        if line.strip() == FRAME_DONE_MARKER + " " + str(tstep):
+            return
+    raise RuntimeError("Blender exited before rendering frame " + str(tstep))
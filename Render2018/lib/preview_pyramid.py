@@ -0,0 +1,160 @@
+import numpy as np
+import h5py as h5
+import field_store
+import h5dns_load_data
+from dircheck import check_make
+from create_all_dirs import create_all
+# Multi-resolution preview pyramid of an .h5dns file, for quick-look renders when tuning camera angles and droplet scale
+# for a new case. Each level is a downsampled copy of the data (block means over 2x2x2, 4x4x4, ... cells) saved as an
+# .h5dns file, so the converters and Blender scripts run on it unchanged. Levels are built once, each from the previous
+# (finer) level, and preview renders write to their own output tree so the full-resolution outputs are untouched.
+
+# Downsampling factors of the pyramid levels
+PREVIEW_FACTORS = (2, 4, 8)
+
+# Fields included in the pyramid by default
+PREVIEW_FIELDS = ("VOF", "YV", "Temperature")
+
+def get_preview_dir(case_output):
+    """
+    :param case_output: Main output directory of a case
+    :return: Directory containing the pyramid levels and the preview output trees of the case
+    """
+    return case_output + "preview/"
+
+def get_level_path(case_output, factor):
+    """
+    :param case_output: Main output directory of a case
+    :param factor: Downsampling factor of the pyramid level
+    :return: Path to the .h5dns file of the pyramid level
+    """
+    return get_preview_dir(case_output) + "pyramid_" + str(factor) + "x.h5dns"
+
+def downsample_block_mean(field, factor):
+    """
+    Downsamples a 3D field by averaging blocks of factor^3 cells. Layers that do not fill a whole block are dropped.
+    :param field: 3D array
+    :param factor: Downsampling factor
+    :return: Downsampled 3D array
+    """
+    nk, nj, ni = (dim//factor for dim in field.shape)
+    blocks = field[:nk*factor, :nj*factor, :ni*factor].reshape(nk, factor, nj, factor, ni, factor)
+    return blocks.mean(axis=(1, 3, 5), dtype=np.float64).astype(np.float32)
+
+def build_level(source_path, level_path, factor, fields, source_identity):
+    """
+    Builds one pyramid level by downsampling a finer level (or the original .h5dns file). Fields that are already in the
+    level are kept, so a level can be extended with more fields later, and an interrupted build resumes where it stopped.
+    :param source_path: Path to the file to downsample
+    :param level_path: Path to the level .h5dns file to write
+    :param factor: Downsampling factor relative to the source
+    :param fields: Fields to include
+    :param source_identity: (size, modification time) of the original .h5dns file, used to detect changes to it
+    """
+
+    # Rebuild the level from scratch if the original data changed
+    try:
+        with h5.File(level_path, "r") as level:
+            up_to_date = (level.attrs.get("SOURCE_SIZE"), level.attrs.get("SOURCE_MTIME_NS")) == source_identity
+    except OSError:
+        up_to_date = False
+    source = h5.File(source_path, "r")
+    level = h5.File(level_path, "a" if up_to_date else "w")
+    level.attrs["SOURCE_SIZE"], level.attrs["SOURCE_MTIME_NS"] = source_identity
+
+    # Runtime parameters, with the resolution of the level
+    if "RUNTIME_PARAMETERS" not in level:
+        source.copy("RUNTIME_PARAMETERS", level)
+        for res_name in ("NNI", "NNJ", "NNK"):
+            level["RUNTIME_PARAMETERS"].attrs[res_name] = source["RUNTIME_PARAMETERS"].attrs[res_name]//factor
+    source_sequence = source["FIELD_SEQUENCE_field3d"]
+    level_sequence = level.require_group("FIELD_SEQUENCE_field3d")
+    if "times" not in level_sequence:
+        source_sequence.copy("times", level_sequence)
+
+    # Downsample each field of each timestep, in slabs of k-layers so that entire fields are never loaded
+    slab_size = factor*16
+    for tstep_name in sorted(name for name in source_sequence if name.startswith("FIELD_DATA_")):
+        level_tstep = level_sequence.require_group(tstep_name)
+        for field_name in fields:
+            if field_name in level_tstep:
+                if level_tstep[field_name].attrs.get("COMPLETE", False):
+                    continue
+                del level_tstep[field_name]
+            source_field = source_sequence[tstep_name][field_name]
+            shape = tuple(dim//factor for dim in source_field.shape)
+            level_field = level_tstep.create_dataset(field_name, shape=shape, dtype="<f4",
+                                                     chunks=tuple(min(32, dim) for dim in shape),
+                                                     **field_store.get_compression())
+            for k_start in range(0, shape[0]*factor, slab_size):
+                k_end = min(k_start + slab_size, shape[0]*factor)
+                level_field[k_start//factor:k_end//factor] = downsample_block_mean(source_field[k_start:k_end], factor)
+            level_field.attrs["COMPLETE"] = True
+        level.flush()
+
+    level.close()
+    source.close()
+    print("Built preview level: " + level_path)
+
+def build_pyramid(h5dns_path, case_output, max_factor=PREVIEW_FACTORS[-1], fields=PREVIEW_FIELDS):
+    """
+    Builds the pyramid levels of an .h5dns file up to a downsampling factor, skipping the levels and fields that have
+    already been built.
+    :param h5dns_path: Path to the original .h5dns file
+    :param case_output: Main output directory of the case
+    :param max_factor: Largest downsampling factor to build
+    :param fields: Fields to include
+    :return: Path to the level with the largest downsampling factor
+    """
+    source_identity = field_store.get_source_identity(h5dns_path)
+    check_make(get_preview_dir(case_output))
+
+    # Each level is downsampled from the previous one, or from the original (or its render-optimized store) for the first
+    source_path = field_store.get_read_path(h5dns_path)
+    source_factor = 1
+    for factor in PREVIEW_FACTORS:
+        if factor > max_factor:
+            break
+        level_path = get_level_path(case_output, factor)
+        build_level(source_path, level_path, factor//source_factor, fields, source_identity)
+        source_path = level_path
+        source_factor = factor
+
+    return source_path
+
+def setup_preview(cconfd, rconfd, case_output, factor, fields=PREVIEW_FIELDS, resolution_percentage=None):
+    """
+    Sets up a preview render: builds the pyramid up to the given level if necessary, and points the case and render
+    settings to the level data, a reduced render resolution, and a separate output tree.
+    :param cconfd: Case config dictionary
+    :param rconfd: Render config dictionary
+    :param case_output: Main output directory of the case
+    :param factor: Downsampling factor of the level to render (one of PREVIEW_FACTORS)
+    :param fields: Fields needed by the render
+    :param resolution_percentage: (optional) Render resolution percentage, defaults to the full resolution percentage
+    divided by the downsampling factor
+    :return: cconfd, rconfd, case_output: Case config, render config and main output directory to use for the preview
+    """
+    if factor not in PREVIEW_FACTORS:
+        raise ValueError("Preview downsampling factor must be one of " + str(PREVIEW_FACTORS))
+
+    level_path = build_pyramid(cconfd["h5dns_path"], case_output, max_factor=factor, fields=fields)
+    level_params = h5dns_load_data.get_important_data(level_path)
+
+    # Point case settings to the level data
+    cconfd = dict(cconfd)
+    cconfd["h5dns_path"] = level_path
+    cconfd["xres"] = int(level_params["xres"])
+    cconfd["yres"] = int(level_params["yres"])
+    cconfd["zres"] = int(level_params["zres"])
+
+    # Reduce render resolution
+    rconfd = dict(rconfd)
+    rconfd["resolution_percentage"] = resolution_percentage or max(rconfd["resolution_percentage"]/factor, 1)
+
+    # Separate output tree for the preview, with the same directory structure as the main output directory
+    preview_output = get_preview_dir(case_output) + str(factor) + "x/"
+    create_all(None, case_output=preview_output)
+    print("Preview render at 1/" + str(factor) + " resolution, output: " + preview_output)
+
+    return cconfd, rconfd, preview_output
@@ -0,0 +1,247 @@
+import os
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+import load_config
+from converters import convply2geo
+from mesh_archive import mesh_archive
+from dircheck import get_output_filepath, check_make, get_view_dirs
+from render_space import grid_to_blender, get_camera_angle, get_camera_frame, project_to_image, parse_views
+# Headless quick-look renderer: renders the .ply frames of a render with a NumPy z-buffer rasterizer instead of
+# Blender, using the camera settings of the render's Blender config file. Meant for checking that a case converted
+# correctly and for thumbnail sequences, e.g. on login nodes: there is no fog, background image or material
+# appearance, only flat-lit or vertex-colored geometry over the background gradient.
+
+# Flat colors of the Blender materials, used when the geometry has no vertex colors
+MATERIAL_COLORS = {"WaterMaterial5": (0.55, 0.75, 0.95), "heatmapMaterial": (0.8, 0.8, 0.8),
+                   "Lambda2Contour": (0.85, 0.55, 0.3), "BodyMat": (0.7, 0.7, 0.7)}
+
+def rasterize(screen_verts, tris, vert_colors, width, height, bg_image, batch_size=2**22):
+    """
+    Rasterizes triangles with a z-buffer: each pixel shows the nearest triangle covering its center. Colors are
+    interpolated from the triangle corners. All triangles are drawn regardless of their orientation, since cut and open
+    surfaces are viewed from both sides.
+    :param screen_verts: Array of (x, y, depth) of each vertex (see render_space.project_to_image)
+    :param tris: Triangles array
+    :param vert_colors: RGB colors (floats from 0 to 1) of each corner of each triangle, shape (num tris, 3, 3)
+    :param width: Image width (pixels)
+    :param height: Image height (pixels)
+    :param bg_image: Background image, shape (height, width, 3)
+    :param batch_size: Maximum number of candidate pixels processed at once (bounds memory use)
+    :return: Rendered image, shape (height, width, 3)
+    """
+
+    depth_buffer = np.full(width*height, np.inf)
+    color_buffer = bg_image.reshape(-1, 3).copy()
+
+    # Corners of each triangle
+    p0 = screen_verts[tris[:,0]]
+    p1 = screen_verts[tris[:,1]]
+    p2 = screen_verts[tris[:,2]]
+    area = (p1[:,0] - p0[:,0])*(p2[:,1] - p0[:,1]) - (p1[:,1] - p0[:,1])*(p2[:,0] - p0[:,0])
+
+    # Range of pixels whose centers may be covered by each triangle, clipped to the image
+    x_min = np.maximum(np.ceil(np.minimum(np.minimum(p0[:,0], p1[:,0]), p2[:,0]) - 0.5), 0)
+    x_max = np.minimum(np.floor(np.maximum(np.maximum(p0[:,0], p1[:,0]), p2[:,0]) - 0.5), width - 1)
+    y_min = np.maximum(np.ceil(np.minimum(np.minimum(p0[:,1], p1[:,1]), p2[:,1]) - 0.5), 0)
+    y_max = np.minimum(np.floor(np.maximum(np.maximum(p0[:,1], p1[:,1]), p2[:,1]) - 0.5), height - 1)
+    box_width = np.maximum(x_max - x_min + 1, 0).astype(np.int64)
+    box_height = np.maximum(y_max - y_min + 1, 0).astype(np.int64)
+    num_pixels = box_width*box_height
+
+    # Skip triangles that are degenerate, cover no pixel center, or are (partly) behind the camera
+    visible = (np.abs(area) > 1E-12) & (num_pixels > 0) & (p0[:,2] > 0) & (p1[:,2] > 0) & (p2[:,2] > 0)
+    tri_ids = np.nonzero(visible)[0]
+
+    # Process triangles in batches, each expanded into one fragment per candidate pixel
+    batch_ends = np.searchsorted(np.cumsum(num_pixels[tri_ids]), np.arange(batch_size, num_pixels.sum() + batch_size, batch_size))
+    batch_start = 0
+    for batch_end in np.unique(np.maximum(batch_ends, 1)):
+        batch = tri_ids[batch_start:batch_end + 1]
+        batch_start = batch_end + 1
+        if len(batch) == 0:
+            continue
+
+        # Fragments: candidate pixels of each triangle
+        frag_tri = np.repeat(batch, num_pixels[batch])
+        frag_offset = np.arange(len(frag_tri)) - np.repeat(np.cumsum(num_pixels[batch]) - num_pixels[batch], num_pixels[batch])
+        frag_x = x_min[frag_tri].astype(np.int64) + frag_offset % box_width[frag_tri]
+        frag_y = y_min[frag_tri].astype(np.int64) + frag_offset//box_width[frag_tri]
+
+        # Barycentric coordinates of pixel centers
+        cx = frag_x + 0.5
+        cy = frag_y + 0.5
+        a0, a1, a2 = p0[frag_tri], p1[frag_tri], p2[frag_tri]
+        b1 = ((cx - a0[:,0])*(a2[:,1] - a0[:,1]) - (cy - a0[:,1])*(a2[:,0] - a0[:,0]))/area[frag_tri]
+        b2 = ((a1[:,0] - a0[:,0])*(cy - a0[:,1]) - (a1[:,1] - a0[:,1])*(cx - a0[:,0]))/area[frag_tri]
+        b0 = 1 - b1 - b2
+        inside = (b0 >= 0) & (b1 >= 0) & (b2 >= 0)
+        frag_tri, frag_x, frag_y = frag_tri[inside], frag_x[inside], frag_y[inside]
+        b0, b1, b2 = b0[inside], b1[inside], b2[inside]
+        depth = b0*p0[frag_tri,2] + b1*p1[frag_tri,2] + b2*p2[frag_tri,2]
+
+        # Depth test: nearest fragment of each pixel in this batch, drawn if nearer than what the pixel already shows
+        pixel = frag_y*width + frag_x
+        order = np.lexsort((depth, pixel))
+        first = np.ones(len(order), dtype=bool)
+        first[1:] = pixel[order][1:] != pixel[order][:-1]
+        nearest = order[first]
+        nearer = depth[nearest] < depth_buffer[pixel[nearest]]
+        nearest = nearest[nearer]
+        depth_buffer[pixel[nearest]] = depth[nearest]
+        corner_colors = vert_colors[frag_tri[nearest]]
+        color_buffer[pixel[nearest]] = b0[nearest,None]*corner_colors[:,0] + b1[nearest,None]*corner_colors[:,1] + \
+                                       b2[nearest,None]*corner_colors[:,2]
+
+    return color_buffer.reshape(height, width, 3)
+
+def get_background(width, height, bg_color_1, bg_color_2):
+    """
+    Background gradient like the world background in Blender: bg_color_1 at the bottom of the image and bg_color_2 at
+    the top.
+    :param width: Image width (pixels)
+    :param height: Image height (pixels)
+    :param bg_color_1: Lower color (R,G,B from 0 to 1)
+    :param bg_color_2: Upper color
+    :return: Background image, shape (height, width, 3)
+    """
+    fraction = np.linspace(1, 0, height)[:,None,None]
+    column = fraction*np.array(bg_color_2)[None,None,:] + (1 - fraction)*np.array(bg_color_1)[None,None,:]
+    return np.repeat(column, width, axis=1)
+
+def shade(verts, tris, vcolors, light_dir, base_color, shading="auto", ambient=0.35):
+    """
+    Determines the color of each corner of each triangle: flat shading lights each triangle by the angle between its
+    normal and the light, vertex-color shading uses the vertex colors of the geometry, lit the same way but more softly.
+    :param verts: Vertices array (Blender coordinates)
+    :param tris: Triangles array
+    :param vcolors: Vertex colors (ints from 0 to 255), or None
+    :param light_dir: Unit vector pointing toward the light
+    :param base_color: Color used for flat shading (R,G,B from 0 to 1)
+    :param shading: "flat", "vertex", or "auto" (vertex-color shading if the geometry has vertex colors)
+    :param ambient: Fraction of light that reaches surfaces facing away from the light
+    :return: Colors of each corner of each triangle, shape (num tris, 3, 3)
+    """
+    normals = np.cross(verts[tris[:,1]] - verts[tris[:,0]], verts[tris[:,2]] - verts[tris[:,0]])
+    normals /= np.maximum(np.linalg.norm(normals, axis=1), 1E-12)[:,None]
+    lambert = np.abs(normals @ light_dir) # Both sides of surfaces are lit
+
+    if shading == "vertex" or (shading == "auto" and vcolors is not None):
+        intensity = (0.6 + 0.4*lambert)[:,None,None]
+        return intensity*vcolors[tris]/255
+
+    intensity = (ambient + (1 - ambient)*lambert)[:,None,None]
+    return intensity*np.array(base_color)[None,None,:]*np.ones((1, 3, 1))
+
+def render_frame(frame_n, settings):
+    """
+    Renders one frame to a .png image from each camera view. The geometry is loaded once for all views.
+    :param frame_n: Timestep to render
+    :param settings: Dictionary of render settings (see render_blender_config)
+    :return: Paths to the rendered images, or None if the frame's geometry does not exist
+    """
+    # Load geometry from the mesh archive or .ply file of the frame
+    if settings["mesh_archive_path"]:
+        with mesh_archive(settings["mesh_archive_path"]) as archive:
+            if frame_n not in archive.tsteps():
+                print("Missing geometry, skipped: frame " + str(frame_n) + " of " + settings["mesh_archive_path"])
+                return None
+            verts, tris, vcolors = archive.read(frame_n, load_colors=True)
+    else:
+        ply_path = get_output_filepath(settings["ply_input_dir"], frame_n, ".ply")
+        if not os.path.isfile(ply_path):
+            print("Missing geometry, skipped: " + ply_path)
+            return None
+        verts, tris, vcolors = convply2geo(ply_path, load_colors=True)
+
+    # Move geometry to where it is in the Blender scene
+    verts = grid_to_blender(verts, settings["dim"], settings["render_scale"])
+
+    # Render the frame from each view
+    image_paths = []
+    for camera_frame, camera_angle, image_output_dir in settings["views"]:
+
+        # Light from slightly above and to the right of the camera
+        position, forward, right, up = camera_frame
+        light_dir = -forward + 0.5*up + 0.3*right
+        light_dir /= np.linalg.norm(light_dir)
+
+        # Project, shade and rasterize
+        screen_verts = project_to_image(verts, camera_frame, camera_angle, settings["width"], settings["height"])
+        corner_colors = shade(verts, tris, vcolors, light_dir, settings["base_color"], settings["shading"])
+        image = rasterize(screen_verts, tris, corner_colors, settings["width"], settings["height"], settings["background"])
+
+        # Save image
+        image_path = get_output_filepath(image_output_dir, frame_n, ".png")
+        plt.imsave(image_path, np.clip(image, 0, 1))
+        image_paths.append(image_path)
+    return image_paths
+
+def render_blender_config(blender_config_filedir, output_dir=None, width=480, shading="auto", num_workers=None, frames=None):
+    """
+    Renders all frames of a render with the quick-look renderer, using the settings of its Blender config file (as
+    written by main_render). Multi-view renders are rendered from each of their views, into the same subdirectories of
+    the output directory as the Blender images (see dircheck.get_view_dirs).
+    :param blender_config_filedir: Path to the Blender config file of the render
+    :param output_dir: (optional) Directory to save images to, defaults to "<render>_quicklook/" next to the config file
+    :param width: Image width (pixels). The height follows from the 16:9 aspect ratio of the Blender renders.
+    :param shading: "flat", "vertex", or "auto" (see shade)
+    :param num_workers: Number of frames rendered in parallel, defaults to the number of CPUs
+    :param frames: (optional) List of timesteps to render, defaults to all
+    :return: Directory the images were saved to
+    """
+    blender_config = load_config.get_config_params(blender_config_filedir)
+    if output_dir is None:
+        output_dir = blender_config_filedir[:-len("_blender.cfg")] + "_quicklook/"
+
+    # Same cameras as droplet_render.py: the views of a multi-view render, or the single view of the render
+    camera_distance = 15
+    views = parse_views(blender_config.get("views", "")) or [(blender_config["camera_azimuth_angle"],
+                                                              blender_config["camera_elevation_angle"],
+                                                              blender_config["view_fraction"])]
+    view_dirs = get_view_dirs(output_dir, len(views))
+    check_make([output_dir] + view_dirs)
+    height = int(round(width*9/16))
+    if blender_config["bg_color_1"] and blender_config["bg_color_2"]:
+        bg_color_1 = tuple(map(float, blender_config["bg_color_1"].split(",")))
+        bg_color_2 = tuple(map(float, blender_config["bg_color_2"].split(",")))
+    else:
+        # Background image renders: plain dark gradient instead
+        bg_color_1, bg_color_2 = (0.05, 0.05, 0.05), (0.25, 0.25, 0.25)
+    settings = {"ply_input_dir": blender_config["ply_input_dir"],
+                "mesh_archive_path": blender_config.get("mesh_archive_path", ""),
+                "dim": (blender_config["xres"], blender_config["yres"], blender_config["zres"]),
+                "render_scale": blender_config["render_scale"],
+                "views": [(get_camera_frame(camera_azimuth_angle, camera_elevation_angle, camera_distance),
+                           get_camera_angle(blender_config["render_scale"], view_fraction, camera_distance), view_dir)
+                          for (camera_azimuth_angle, camera_elevation_angle, view_fraction), view_dir in zip(views, view_dirs)],
+                "width": width, "height": height, "shading": shading,
+                "base_color": MATERIAL_COLORS.get(blender_config["interface_material_name"], (0.7, 0.7, 0.7)),
+                "background": get_background(width, height, bg_color_1, bg_color_2)}
+
+    # Render frames in parallel
+    if frames is None:
+        frames = range(int(blender_config["tres"]))
+    with multiprocessing.Pool(num_workers) as pool:
+        for image_paths in pool.imap_unordered(functools.partial(render_frame, settings=settings), frames):
+            for image_path in image_paths or []:
+                print("Saved quick-look image: " + image_path)
+
+    return output_dir
+
+if __name__ == "__main__":
+    # Parse input arguments
+    parser = argparse.ArgumentParser(description="Renders the frames of a render without Blender, for quick checks. ")
+    parser.add_argument("blender_config", type=str, help="Path to the Blender config file of the render (<case output>/<render name>_blender.cfg). ")
+    parser.add_argument("--output-dir", type=str, default=None, help="Directory to save images to. ")
+    parser.add_argument("--width", type=int, default=480, help="Image width in pixels. ")
+    parser.add_argument("--shading", type=str, default="auto", choices=["auto", "flat", "vertex"], help="Shading mode. ")
+    parser.add_argument("--workers", type=int, default=None, help="Number of frames rendered in parallel. ")
+    args = parser.parse_args()
+
+    render_blender_config(args.blender_config, output_dir=args.output_dir, width=args.width, shading=args.shading,
+                          num_workers=args.workers)
@@ -0,0 +1,110 @@
+import sys
+import argparse
+import numpy as np
+import mcubes
+import converters
+import mesh_clip
+import create_jobscripts
+# Regression checks: runs geometry and job functions on synthetic inputs and checks properties their output must always
+# have, so that changes made for speed (see benchmark) can also be checked for correctness. Exits with an error if any
+# check fails.
+# Example:
+#   python regression_checks.py
+#   python regression_checks.py --only mesh_clip
+
+def check(condition, message):
+    """
+    Fails the current check if a condition does not hold.
+    :param condition: Condition that must hold
+    :param message: Description of the failure
+    """
+    if not condition:
+        raise AssertionError(message)
+
+def get_synthetic_geo(field, level=0):
+    """
+    Extracts the welded contour geometry of a 3D field, like the interface geometry of the converters.
+    :param field: 3D scalar field
+    :param level: Contour level
+    :return: verts, tris: Welded vertices and triangles
+    """
+    verts, tris = mcubes.marching_cubes(field, level)
+    return converters.weld_geo(verts, tris)
+
+def get_open_edges(tris):
+    """
+    :param tris: Triangles array
+    :return: Number of edges not shared by exactly two triangles (0 for a closed mesh)
+    """
+    edges = np.sort(np.concatenate((tris[:,[0,1]], tris[:,[1,2]], tris[:,[2,0]])), axis=1)
+    _, counts = np.unique(edges, axis=0, return_counts=True)
+    return int(np.sum(counts != 2))
+
+# Each check runs on synthetic inputs and fails (see check) if the output does not have the required properties.
+
+def check_mesh_clip():
+    # A sphere and a hollow shell (a sphere with a spherical cavity, whose cut has a hole in the cap) of radius 14
+    grid = np.mgrid[0:40,0:40,0:40].astype(float) - 19.5
+    radius = np.sqrt(np.sum(grid**2, axis=0))
+    meshes = {"sphere": get_synthetic_geo(14 - radius),
+              "hollow shell": get_synthetic_geo(np.minimum(14 - radius, radius - 8))}
+
+    for mesh_name, (verts, tris) in meshes.items():
+        center = verts.mean(axis=0)
+
+        # Marching cubes places vertices on grid lines, so a plane at a whole x coordinate goes exactly through vertices
+        plane_x = np.round(center[0])
+        check(np.any(verts[:,0] == plane_x), mesh_name + ": no vertices on the plane through vertices")
+
+        cuts = {"through center": (center, (1,0,0)), "oblique": (center, (1,0.3,0.2)),
+                "through vertices": ((plane_x,0,0), (1,0,0)), "through vertices, reversed": ((plane_x,0,0), (-1,0,0))}
+        for cut_name, (plane_point, plane_normal) in cuts.items():
+            clipped_verts, clipped_tris = mesh_clip.clip_geo(verts, tris, plane_point=plane_point,
+                                                             plane_normal=plane_normal)
+            name = mesh_name + " cut " + cut_name
+            check(len(clipped_tris) > 0, name + ": no geometry left")
+            check(get_open_edges(clipped_tris) == 0, name + ": mesh is not closed (%d edges not shared by exactly two "
+                                                           "triangles)" % get_open_edges(clipped_tris))
+            check(np.all(mesh_clip.get_tri_areas(clipped_verts, clipped_tris) > 0), name + ": zero-area triangles")
+
+def check_shard_frames():
+    # Frame counts that do and do not divide evenly into the shards, and more shards than frames
+    for shard_mode in ("interleaved", "contiguous"):
+        for tres in (1, 7, 10, 64, 101):
+            for num_shards in (1, 2, 3, 4, 8, 16):
+                frames = [create_jobscripts.get_shard_frames(tres, shard, num_shards, shard_mode)
+                          for shard in range(num_shards)]
+                name = "%s shards of %d frames over %d jobs" % (shard_mode, tres, num_shards)
+                check(sorted(sum(frames, [])) == list(range(tres)), name + ": frames not covered exactly once")
+                if shard_mode == "contiguous":
+                    check(all(shard_frames == list(range(shard_frames[0], shard_frames[0] + len(shard_frames)))
+                              for shard_frames in frames if shard_frames), name + ": shard frames not consecutive")
+
+CHECKS = {"mesh_clip": check_mesh_clip, "shard_frames": check_shard_frames}
+
+def run_checks(names=None):
+    """
+    Runs regression checks.
+    :param names: (optional) Names of the checks to run, defaults to all
+    :return: List of (check name, failure message) of the checks that failed
+    """
+    names = names or list(CHECKS.keys())
+    failures = []
+    for name in names:
+        try:
+            CHECKS[name]()
+            print("Check %s: passed" % name)
+        except AssertionError as error:
+            print("Check %s: FAILED: %s" % (name, error))
+            failures.append((name, str(error)))
+    return failures
+
+if __name__ == "__main__":
+    # Parse input arguments
+    parser = argparse.ArgumentParser(description="Checks geometry and job functions on synthetic inputs. ")
+    parser.add_argument("--only", type=str, default=None, help="Comma-separated list of checks to run (default: all). Available: " + ", ".join(CHECKS.keys()))
+    args = parser.parse_args()
+
+    # Exit with an error if any check failed, so that the checks can be used in scripts
+    if run_checks(args.only.split(",") if args.only else None):
+        sys.exit(1)
@@ -1,5 +1,12 @@
+import time
 import argparse
+import configparser
+import dircheck
 import load_config
+import stage_timer
+import field_store
+import preview_pyramid
+import quicklook_render
 import main_render
 import bodyflow_render
 # Script that launches a rendering job in Python. Launches rendering jobs for droplet data (Michael/Pablo) or axisymmetric body flow data (Abhiram)
@@ -7,25 +14,67 @@ import bodyflow_render
 # Parse input arguments that point to case config and render config files
 parser = argparse.ArgumentParser()
 parser.add_argument("-c", metavar="case config file", type=str, required=True, help="Path to case config file specific to data file. ")
-parser.add_argument("-r", metavar="render config file", type=str, required=True, help="Path to config file that specifies rendering settings. ")
+parser.add_argument("-r", metavar="render config file", type=str, nargs="+", required=True, help="Path to config file that specifies rendering settings. Several render config files of droplet data are converted in one sweep over the timesteps. ")
+parser.add_argument("--stage", type=str, default="all", choices=["all", "convert", "render", "composite"], help="Stage of the render to perform, when it is split into several jobs. ")
+parser.add_argument("--shard", type=int, default=0, help="Index of the subset of frames to render in the render stage. ")
+parser.add_argument("--num-shards", type=int, default=1, help="Number of subsets the frames are split into. ")
+parser.add_argument("--preview", type=int, default=0, choices=[0, 2, 4, 8], help="Render a quick-look preview from data downsampled by this factor, into a separate output tree (0: full render). ")
+parser.add_argument("--quicklook", action="store_true", help="Convert data, then render it with the headless quick-look renderer instead of Blender. ")
+parser.add_argument("--ingest", action="store_true", help="Ingest the .h5dns file into a render-optimized store first, if it does not have an up-to-date one. ")
+parser.add_argument("--shard-mode", type=str, default="interleaved", choices=["interleaved", "contiguous"], help="How frames are split into subsets. ")
 args = parser.parse_args()
 case_config_filepath = args.c
-render_config_filepath = args.r
+render_config_filepaths = args.r
+render_config_filepath = render_config_filepaths[0]
 
 # Load case config file
 cconfd = load_config.get_config_params(case_config_filepath)
 
+# Log time, memory and I/O of each stage of the render (conversion, Blender, ...) to a file in the case output directory.
+# Worker processes and Blender inherit the log path, so all stages of the render end up in the same file.
+dirname_config = configparser.ConfigParser()
+dirname_config.read("dirname.cfg")
+case_output = dirname_config["DIRECTORIES"]["RenderOutput"] + cconfd["case_name"] + "/"
+dircheck.check_make(case_output)
+stage_log_path = case_output + "_".join(load_config.get_config_params(filepath)["render_name"] for filepath in render_config_filepaths) + "_stages.jsonl"
+stage_timer.set_log_path(stage_log_path)
+render_start = time.time()
+
+# Transcode h5dns data into a render-optimized store, which field4Dlow then reads instead of the .h5dns file
+if args.ingest and cconfd["data_file_type"] == "turbdrops" and not field_store.is_store_valid(cconfd["h5dns_path"], all_fields=True):
+    with stage_timer.stage("ingest"):
+        field_store.ingest(cconfd["h5dns_path"])
+
 # Determine render type from case config file and render config filename, and launch the corresponding rendering function.
 rcfg_filename = render_config_filepath.split(".")[-2]
+stage_args = {"stage": "convert" if args.quicklook else args.stage, "shard": args.shard, "num_shards": args.num_shards, "shard_mode": args.shard_mode,
+              "preview": args.preview}
 if cconfd["data_file_type"] == "turbdrops":
-    if rcfg_filename.endswith("photorealistic"):
-        main_render.photorealistic(case_config_filepath, render_config_filepath)
-    elif rcfg_filename.endswith("surf_temp"):
-        main_render.surf_tempmap(case_config_filepath, render_config_filepath)
-    elif rcfg_filename.endswith("lambda2"):
-        main_render.lambda2(case_config_filepath, render_config_filepath)
+    if len(render_config_filepaths) > 1 and stage_args["stage"] in ("all", "convert"):
+        # Convert the data of all renders in one sweep over the timesteps, then render each of them
+        main_render.convert_sweep_renders(case_config_filepath, render_config_filepaths, stage=stage_args["stage"], preview=args.preview)
+    else:
+        for render_config_filepath in render_config_filepaths:
+            render_function = main_render.get_render_function(render_config_filepath)
+            if render_function is not None:
+                render_function(case_config_filepath, render_config_filepath, **stage_args)
 elif cconfd["data_file_type"] == "bodyflow":
     if rcfg_filename.endswith("streamline"):
         bodyflow_render.streamline(case_config_filepath, render_config_filepath)
     elif rcfg_filename.endswith("vortexline"):
-        bodyflow_render.vortexline(case_config_filepath, render_config_filepath)
\ No newline at end of file
+        bodyflow_render.vortexline(case_config_filepath, render_config_filepath)
+    elif rcfg_filename.endswith("isosurf"):
+        bodyflow_render.isosurface(case_config_filepath, render_config_filepath)
+
+# Quick-look render of the converted frames, from the Blender config file written by the convert stage
+if args.quicklook and cconfd["data_file_type"] == "turbdrops":
+    render_output = case_output
+    if args.preview:
+        render_output = preview_pyramid.get_preview_dir(case_output) + str(args.preview) + "x/"
+    for render_config_filepath in render_config_filepaths:
+        with stage_timer.stage("quicklook_render"):
+            quicklook_render.render_blender_config(render_output + load_config.get_config_params(render_config_filepath)["render_name"] + "_blender.cfg")
+
+# Report where the time was spent during this run
+print("Stage summary (full log: " + stage_log_path + "):")
+stage_timer.summarize(stage_log_path, since=render_start)
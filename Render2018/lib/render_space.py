@@ -0,0 +1,123 @@
+import numpy as np
+# Conversions between the grid coordinates of exported geometry (one unit per grid cell, as output by marching cubes)
+# and the coordinates of the same geometry in the Blender scene, after it has been centered and scaled by
+# Blender/transform_mesh.center_databox. Also imported by the Blender scripts (geometry_importer, droplet_render), whose
+# Python has numpy but none of the other packages the converters use, so numpy is its only dependency.
+
+def grid_to_blender(points, dim, scale):
+    """
+    Converts points from grid coordinates to Blender scene coordinates, the same way center_databox does on import.
+    :param points: Array of points (one row per point) in grid coordinates
+    :param dim: (x,y,z) resolution of the domain
+    :param scale: Length of bounding box the domain is scaled to in Blender (render_scale)
+    :return: Array of points in Blender coordinates
+    """
+    dim = np.array(dim, dtype=float)
+    correction = 1/(2*dim) # Same marching cubes correction as center_databox
+    return (np.asarray(points, dtype=float) - dim/2)*(scale/dim[1]) + correction*scale
+
+def blender_to_grid(points, dim, scale):
+    """
+    Converts points from Blender scene coordinates back to grid coordinates (inverse of grid_to_blender).
+    :param points: Array of points (one row per point) in Blender coordinates
+    :param dim: (x,y,z) resolution of the domain
+    :param scale: Length of bounding box the domain is scaled to in Blender (render_scale)
+    :return: Array of points in grid coordinates
+    """
+    dim = np.array(dim, dtype=float)
+    correction = 1/(2*dim)
+    return (np.asarray(points, dtype=float) - correction*scale)*(dim[1]/scale) + dim/2
+
+def get_camera_angle(render_scale, view_fraction, camera_distance=15):
+    """
+    Field of view of the camera, the same way configure_scene sets it: wide enough to show view_fraction times the
+    (scaled) domain length at the origin.
+    :param render_scale: Length of bounding box the domain is scaled to in Blender (render_scale)
+    :param view_fraction: Portion of the domain to show (1 is exactly the domain length, 2 is zoomed out x2, etc.)
+    :param camera_distance: Distance of the camera from the origin
+    :return: Horizontal field of view (radians)
+    """
+    return 2*np.arctan(render_scale*view_fraction/(2*camera_distance))
+
+def parse_views(views_string):
+    """
+    Parses the camera views of a multi-view render (the "views" render config setting).
+    :param views_string: Views separated by semicolons, each as "azimuth,elevation,view_fraction" (angles in degrees),
+    e.g. "0,0,2;90,30,1.5"
+    :return: List of (camera_azimuth_angle, camera_elevation_angle, view_fraction) tuples
+    """
+    views = []
+    for view in views_string.split(";"):
+        if not view.strip():
+            continue
+        values = tuple(float(value) for value in view.split(","))
+        if len(values) != 3:
+            raise ValueError("View must be given as azimuth,elevation,view_fraction: " + view)
+        views.append(values)
+    return views
+
+def format_views(views):
+    """
+    :param views: List of (camera_azimuth_angle, camera_elevation_angle, view_fraction)
+    :return: Views as a string (see parse_views)
+    """
+    return ";".join(",".join(str(float(value)) for value in view) for view in views)
+
+def get_camera_frame(camera_azimuth_angle=0, camera_elevation_angle=0, camera_distance=15):
+    """
+    Position and orientation of the camera in droplet_render.blend after configure_scene. The camera sits at
+    (camera_distance, 0, 0) looking at the origin, and is parented to an empty rotated by -elevation about y, then by
+    azimuth about z.
+    :param camera_azimuth_angle: Azimuth angle of the camera from the x-axis (deg, counterclockwise)
+    :param camera_elevation_angle: Elevation angle of the camera from the horizontal (deg, upward is positive)
+    :param camera_distance: Distance of the camera from the origin
+    :return: position, forward, right, up: Camera position, and unit vectors of its viewing direction, image right and
+    image up directions
+    """
+    az = camera_azimuth_angle*np.pi/180
+    el = camera_elevation_angle*np.pi/180
+    position = camera_distance*np.array([np.cos(el)*np.cos(az), np.cos(el)*np.sin(az), np.sin(el)])
+    forward = -position/camera_distance
+    up = np.array([-np.sin(el)*np.cos(az), -np.sin(el)*np.sin(az), np.cos(el)])
+    right = np.cross(forward, up)
+    return position, forward, right, up
+
+def project_to_image(points, camera_frame, camera_angle, width, height):
+    """
+    Perspective projection of points in Blender coordinates onto the image plane, with the horizontal field of view
+    spanning the image width (like Blender's automatic sensor fit for landscape images).
+    :param points: Array of points (one row per point) in Blender coordinates
+    :param camera_frame: Camera position and orientation (see get_camera_frame)
+    :param camera_angle: Horizontal field of view (see get_camera_angle)
+    :param width: Image width (pixels)
+    :param height: Image height (pixels)
+    :return: Array of (x, y, depth) per point: pixel coordinates (x to the right, y downward) and distance along the
+    viewing direction
+    """
+    position, forward, right, up = camera_frame
+    rel = np.asarray(points, dtype=float) - position
+    depth = rel @ forward
+    focal_length = (width/2)/np.tan(camera_angle/2)
+    safe_depth = np.where(depth > 0, depth, np.inf)
+    x = width/2 + focal_length*(rel @ right)/safe_depth
+    y = height/2 - focal_length*(rel @ up)/safe_depth
+    return np.stack((x, y, depth), axis=1)
+
+def get_frustum_planes(camera_frame, camera_angle, aspect=16/9, margin=0):
+    """
+    Side planes of the view frustum of the camera: the four planes through the camera position and the edges of the
+    image, optionally widened by a margin. There are no near or far planes, since the camera is outside the domain.
+    :param camera_frame: Camera position and orientation (see get_camera_frame)
+    :param camera_angle: Horizontal field of view (see get_camera_angle)
+    :param aspect: Image width/height ratio
+    :param margin: Fraction of the image width by which to widen the frustum on each side
+    :return: (4,4) array of planes (a, b, c, d), such that points p in Blender coordinates inside the frustum have
+    a*p[0] + b*p[1] + c*p[2] + d >= 0 for all planes
+    """
+    position, forward, right, up = camera_frame
+    half_width = np.tan(camera_angle/2)
+    tan_right = half_width*(1 + 2*margin)
+    tan_up = half_width*(1/aspect + 2*margin)
+    normals = np.array([tan_right*forward - right, tan_right*forward + right, tan_up*forward - up, tan_up*forward + up])
+    normals /= np.linalg.norm(normals, axis=1)[:,np.newaxis]
+    return np.hstack((normals, -(normals @ position)[:,np.newaxis]))
@@ -0,0 +1,33 @@
+import json
+import contextlib
+try:
+    # File locks. Unavailable on Windows, where shared files must only be updated by one process at a time.
+    import fcntl
+except ImportError:
+    fcntl = None
+# Access to files shared by several processes, such as conversion workers, the jobs of a job array and Blender. Only
+# uses the standard library so that it can also be imported inside Blender.
+
+@contextlib.contextmanager
+def file_lock(lock_path, exclusive=False):
+    """
+    Context manager that locks a file for the enclosed block, if locking is available. Shared locks can be held by
+    several processes at once, e.g. to read a file, while an exclusive lock waits for all other locks, e.g. to update it.
+    :param lock_path: Path to the file to lock, created if it does not exist
+    :param exclusive: Lock for writing, rather than for reading
+    """
+    with open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+        # The lock is released when the file is closed
+        yield
+
+def append_jsonl(path, record):
+    """
+    Appends a record as one line of a JSON-lines file. The line is appended with a single unbuffered write, and single
+    small appends are atomic, so several processes can append to the same file without locking it.
+    :param path: Path to JSON-lines file, created if it does not exist
+    :param record: JSON-serializable record, e.g. a dictionary
+    """
+    with open(path, "ab", buffering=0) as jsonl_file:
+        jsonl_file.write((json.dumps(record) + "\n").encode())
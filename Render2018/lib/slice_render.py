@@ -0,0 +1,173 @@
+import argparse
+import functools
+import multiprocessing
+import numpy as np
+import matplotlib as mpl
+mpl.use('Agg')
+import matplotlib.pyplot as plt
+from h5dns_load_data import field4Dlow
+from dircheck import get_output_filepath, check_make
+# Batch renderer of 2D slices of an .h5dns file: renders one .png image per timestep of a plane of a scalar field, or of
+# the in-plane velocity as arrows, for quick diagnostic movies alongside the Blender renders. Slices are read with
+# field4Dlow.obtain2Dslice and downsampled by array slicing, scalar values are colored through a lookup table rather
+# than drawn as matplotlib figures, and timesteps are rendered by a process pool in which each worker opens the data
+# file once. The color range is the same on all timesteps, so that the images can be played as a movie.
+
+# In-plane velocity components of slices normal to each axis (see field4Dlow.obtain2Dslice)
+VELOCITY_COMPONENTS = {0: ("YVelocity", "ZVelocity"), 1: ("XVelocity", "ZVelocity"), 2: ("XVelocity", "YVelocity")}
+
+# Data file opened by each worker process (see open_worker_data)
+worker_data = None
+
+def open_worker_data(h5dns_path):
+    """
+    Opens the data file in a worker process, once for all the timesteps it renders.
+    :param h5dns_path: Path to .h5dns file
+    """
+    global worker_data
+    worker_data = field4Dlow(h5dns_path)
+
+def get_lut(cmap_name, num_colors=256):
+    """
+    :param cmap_name: Name of a matplotlib colormap, e.g. "viridis"
+    :param num_colors: Number of entries of the lookup table
+    :return: (num_colors,3) array of RGB colors (ints from 0 to 255)
+    """
+    return np.round(plt.get_cmap(cmap_name, num_colors)(np.arange(num_colors))[:,:3]*255).astype(np.uint8)
+
+def apply_lut(values, lut, bounds):
+    """
+    Colors values through a lookup table.
+    :param values: Array of values
+    :param lut: Lookup table (see get_lut)
+    :param bounds: (min, max) values mapped to the first and last colors. Values outside are clipped.
+    :return: Array of RGB colors, shape values.shape + (3,)
+    """
+    scaled = (np.nan_to_num(values) - bounds[0])/max(bounds[1] - bounds[0], 1E-30)
+    return lut[np.clip((scaled*len(lut)).astype(np.int64), 0, len(lut) - 1)]
+
+def read_slice(data_field, tstep, field, axis, level, downsample):
+    """
+    :param data_field: Open field4Dlow of the data file
+    :param tstep: Timestep
+    :param field: Field to slice, e.g. "VOF"
+    :param axis: Axis normal to the slice (0, 1 or 2)
+    :param level: Level of the slice along the axis
+    :param downsample: Keep every downsample-th sample along each axis of the slice
+    :return: 2D slice, indexed like field4Dlow.obtain2Dslice
+    """
+    return data_field.obtain2Dslice(tstep, field, axis, level)[::downsample, ::downsample]
+
+def get_slice_bounds(h5dns_path, tsteps, settings):
+    """
+    Determines the color range of a slice sequence: the range of the scalar field, or 0 to the largest in-plane speed.
+    :param h5dns_path: Path to .h5dns file
+    :param tsteps: Timesteps of the sequence
+    :param settings: Dictionary of render settings (see render_slices)
+    :return: (min, max)
+    """
+    data_field = field4Dlow(h5dns_path)
+    bounds = [np.inf, -np.inf]
+    for tstep in tsteps:
+        if settings["vectors"]:
+            u, v = (read_slice(data_field, tstep, component, settings["axis"], settings["level"], settings["downsample"])
+                    for component in VELOCITY_COMPONENTS[settings["axis"]])
+            bounds = [0, max(bounds[1], np.nanmax(np.hypot(u, v)))]
+        else:
+            values = read_slice(data_field, tstep, settings["field"], settings["axis"], settings["level"], settings["downsample"])
+            bounds = [min(bounds[0], np.nanmin(values)), max(bounds[1], np.nanmax(values))]
+    data_field.close()
+    return bounds
+
+def render_slice(tstep, settings):
+    """
+    Renders the slice of one timestep to a .png image, in the data file opened by the worker.
+    :param tstep: Timestep to render
+    :param settings: Dictionary of render settings (see render_slices)
+    :return: Path to the rendered image
+    """
+    image_path = get_output_filepath(settings["output_dir"], tstep, ".png")
+    axis, level, downsample, upscale = settings["axis"], settings["level"], settings["downsample"], settings["upscale"]
+
+    if not settings["vectors"]:
+        # Color the slice, with the first slice axis to the right and the second one up
+        values = read_slice(worker_data, tstep, settings["field"], axis, level, downsample)
+        image = np.swapaxes(apply_lut(values, settings["lut"], settings["bounds"]), 0, 1)[::-1]
+        plt.imsave(image_path, np.repeat(np.repeat(image, upscale, axis=0), upscale, axis=1))
+        return image_path
+
+    # Draw in-plane velocity arrows colored by speed, the largest speed of the sequence one arrow spacing long
+    u, v = (read_slice(worker_data, tstep, component, axis, level, downsample) for component in VELOCITY_COMPONENTS[axis])
+    colors = apply_lut(np.hypot(u, v), settings["lut"], settings["bounds"]).reshape(-1, 3)/255
+    x, y = np.meshgrid(np.arange(u.shape[0])*downsample, np.arange(u.shape[1])*downsample, indexing="ij")
+    width, height = u.shape[0]*downsample*upscale, u.shape[1]*downsample*upscale
+    figure = plt.figure(figsize=(width/100, height/100), dpi=100)
+    axes = figure.add_axes([0, 0, 1, 1])
+    axes.set_axis_off()
+    axes.quiver(x.reshape(-1), y.reshape(-1), u.reshape(-1), v.reshape(-1), color=colors, angles="xy", scale_units="xy",
+                scale=max(settings["bounds"][1], 1E-30)/downsample, width=0.15*downsample, units="xy")
+    axes.set_xlim(-0.5*downsample, u.shape[0]*downsample - 0.5*downsample)
+    axes.set_ylim(-0.5*downsample, u.shape[1]*downsample - 0.5*downsample)
+    figure.savefig(image_path, facecolor=settings["bg_color"])
+    plt.close(figure)
+    return image_path
+
+def render_slices(h5dns_path, output_dir, field="VOF", axis=2, level=None, vectors=False, downsample=1, upscale=1,
+                  cmap="viridis", bounds=None, bg_color="white", num_workers=None, tsteps=None):
+    """
+    Renders a slice of every timestep of an .h5dns file to a .png image sequence.
+    :param h5dns_path: Path to .h5dns file
+    :param output_dir: Directory to save images to
+    :param field: Scalar field to render, e.g. "VOF", "Temperature", or a cached derived field (see vortex_fields)
+    :param axis: Axis normal to the slices (0, 1 or 2)
+    :param level: Level of the slices along the axis, defaults to the middle of the domain
+    :param vectors: Render the in-plane velocity as arrows instead of the scalar field
+    :param downsample: Keep every downsample-th sample along each axis of the slices (arrow spacing, with vectors)
+    :param upscale: Number of image pixels per sample (per downsampled cell, with vectors)
+    :param cmap: Name of the matplotlib colormap
+    :param bounds: (optional) (min, max) of the color range, defaults to the range over all the slices
+    :param bg_color: Background color of vector images
+    :param num_workers: Number of timesteps rendered in parallel, defaults to the number of CPUs
+    :param tsteps: (optional) List of timesteps to render, defaults to all
+    :return: Directory the images were saved to
+    """
+    check_make(output_dir)
+
+    data_field = field4Dlow(h5dns_path)
+    if level is None:
+        level = (data_field.xres, data_field.yres, data_field.zres)[axis]//2
+    if tsteps is None:
+        tsteps = range(data_field.tres)
+    data_field.close()
+
+    settings = {"output_dir": output_dir, "field": field, "axis": axis, "level": level, "vectors": vectors,
+                "downsample": downsample, "upscale": upscale, "lut": get_lut(cmap), "bg_color": bg_color}
+    settings["bounds"] = bounds if bounds is not None else get_slice_bounds(h5dns_path, tsteps, settings)
+    print("Slice color range: " + str(settings["bounds"][0]) + " to " + str(settings["bounds"][1]))
+
+    # Render timesteps in parallel, each worker reading from its own open data file
+    with multiprocessing.Pool(num_workers, initializer=open_worker_data, initargs=(h5dns_path,)) as pool:
+        for image_path in pool.imap_unordered(functools.partial(render_slice, settings=settings), tsteps):
+            print("Saved slice image: " + image_path)
+
+    return output_dir
+
+if __name__ == "__main__":
+    # Parse input arguments
+    parser = argparse.ArgumentParser(description="Renders 2D slices of an .h5dns file to a .png image sequence. ")
+    parser.add_argument("h5dns_path", type=str, help="Path to .h5dns file. ")
+    parser.add_argument("output_dir", type=str, help="Directory to save images to. ")
+    parser.add_argument("--field", type=str, default="VOF", help="Scalar field to render. ")
+    parser.add_argument("--axis", type=int, default=2, choices=[0, 1, 2], help="Axis normal to the slices. ")
+    parser.add_argument("--level", type=int, default=None, help="Level of the slices along the axis (default: middle). ")
+    parser.add_argument("--vectors", action="store_true", help="Render the in-plane velocity as arrows. ")
+    parser.add_argument("--downsample", type=int, default=1, help="Keep every n-th sample along each axis. ")
+    parser.add_argument("--upscale", type=int, default=1, help="Image pixels per sample. ")
+    parser.add_argument("--cmap", type=str, default="viridis", help="Matplotlib colormap. ")
+    parser.add_argument("--bounds", type=float, nargs=2, default=None, help="Min and max of the color range. ")
+    parser.add_argument("--workers", type=int, default=None, help="Number of timesteps rendered in parallel. ")
+    args = parser.parse_args()
+
+    render_slices(args.h5dns_path, args.output_dir, field=args.field, axis=args.axis, level=args.level,
+                  vectors=args.vectors, downsample=args.downsample, upscale=args.upscale, cmap=args.cmap,
+                  bounds=args.bounds, num_workers=args.workers)
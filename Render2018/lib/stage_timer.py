@@ -0,0 +1,180 @@
+import os
+import sys
+import json
+import time
+import resource
+import functools
+import contextlib
+from shared_files import append_jsonl
+# Lightweight instrumentation of the render pipeline. Each timed stage appends one JSON line to a log file with its wall
+# time, CPU time, resident memory at its start and end, the peak memory of the process so far and bytes read/written.
+# The log file is taken from an environment variable so that worker processes and Blender (which inherit the
+# environment) log to the same file. Only uses the standard library so that it can also be imported inside Blender.
+# Stages may be nested (e.g. the data reads of a converter): each stage logs the stages it runs in, and its self time
+# excludes the time of the stages nested in it.
+
+# Environment variable holding the path to the stage log file. If unset, nothing is logged.
+LOG_PATH_ENV = "RENDER_STAGE_LOG"
+
+# Stages open in this process, innermost last, as [stage name, wall time of the stages nested in it]
+open_stages = []
+
+def set_log_path(log_path):
+    """
+    Enables logging of timed stages to a file, for this process and all processes it launches afterwards.
+    :param log_path: Path to JSON-lines log file (appended to)
+    """
+    os.environ[LOG_PATH_ENV] = log_path
+
+def get_io_counters():
+    """
+    :return: (bytes read, bytes written) by this process so far, including cached reads and writes, or (None, None) if
+    not available on this system
+    """
+    try:
+        with open("/proc/self/io", "r") as io_file:
+            counters = dict(line.split(": ") for line in io_file.read().splitlines())
+        return int(counters["rchar"]), int(counters["wchar"])
+    except (OSError, KeyError, ValueError):
+        return None, None
+
+def get_process_peak_rss():
+    """
+    :return: Peak resident memory of this process so far, in bytes. This is the peak over the whole lifetime of the
+    process, so it is not the peak of a stage unless the stage raised it.
+    """
+    peak_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is in bytes on macOS but kilobytes on Linux
+    return peak_rss if sys.platform == "darwin" else peak_rss*1024
+
+def get_rss():
+    """
+    :return: Current resident memory of this process, in bytes, or None if not available on this system
+    """
+    try:
+        with open("/proc/self/statm", "r") as statm_file:
+            return int(statm_file.read().split()[1])*os.sysconf("SC_PAGE_SIZE")
+    except (OSError, IndexError, ValueError):
+        return None
+
+@contextlib.contextmanager
+def stage(name, tstep=None):
+    """
+    Context manager that times the enclosed block and logs it as a stage, if logging is enabled.
+    :param name: Stage name, e.g. "convvof2geo"
+    :param tstep: (optional) Timestep being processed
+    """
+    log_path = os.environ.get(LOG_PATH_ENV)
+    if not log_path:
+        yield
+        return
+
+    parents = [open_stage[0] for open_stage in open_stages]
+    open_stage = [name, 0.0]
+    open_stages.append(open_stage)
+    wall_start = time.time()
+    cpu_start = time.process_time()
+    rss_start = get_rss()
+    read_start, written_start = get_io_counters()
+    try:
+        yield
+    finally:
+        read_end, written_end = get_io_counters()
+        wall_time = time.time() - wall_start
+        open_stages.remove(open_stage)
+        if open_stages:
+            open_stages[-1][1] += wall_time
+        record = {"stage": name, "tstep": tstep, "pid": os.getpid(), "parents": parents, "start": wall_start,
+                  "wall_time": wall_time, "self_time": wall_time - open_stage[1],
+                  "cpu_time": time.process_time() - cpu_start,
+                  "rss_start": rss_start, "rss": get_rss(), "process_peak_rss": get_process_peak_rss(),
+                  "bytes_read": None if read_start is None else read_end - read_start,
+                  "bytes_written": None if written_start is None else written_end - written_start}
+
+        append_jsonl(log_path, record)
+
+def timed(name=None):
+    """
+    Decorator that logs every call of a function as a stage (see stage). The timestep is taken from the "tstep"
+    argument of the function, if it has one.
+    :param name: (optional) Stage name, defaults to the function name
+    """
+    def decorator(func):
+        stage_name = name or func.__name__
+        try:
+            tstep_position = func.__code__.co_varnames[:func.__code__.co_argcount].index("tstep")
+        except ValueError:
+            tstep_position = None
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            tstep = kwargs.get("tstep")
+            if tstep is None and tstep_position is not None and tstep_position < len(args):
+                tstep = args[tstep_position]
+            with stage(stage_name, tstep):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+def load_log(log_path):
+    """
+    Loads the records of a stage log file.
+    :param log_path: Path to JSON-lines log file
+    :return: List of records (dictionaries)
+    """
+    records = []
+    with open(log_path, "r") as log_file:
+        for line in log_file:
+            try:
+                records.append(json.loads(line))
+            except ValueError:
+                continue
+    return records
+
+def summarize(log_path, since=0):
+    """
+    Prints a report of the time, memory and I/O of each stage in a log file, with stages sorted by total wall time and
+    nested stages listed under the stages they ran in. The wall time of a stage includes its nested stages, its self
+    time does not.
+    Memory is reported as the largest resident memory at the end of a call and the largest growth of resident memory
+    over a call, followed by the peak resident memory of the processes.
+    :param log_path: Path to JSON-lines log file
+    :param since: Only include stages that started at or after this time (seconds since the epoch)
+    :return: Dictionary of totals per stage, keyed by the names of the stages it ran in followed by its name
+    """
+    totals = {}
+    process_peak_rss = 0
+    if not os.path.isfile(log_path):
+        print("No stages were logged.")
+        return totals
+    for record in load_log(log_path):
+        if record["start"] < since:
+            continue
+        total = totals.setdefault(tuple(record["parents"]) + (record["stage"],),
+                                  {"calls": 0, "wall_time": 0.0, "self_time": 0.0, "cpu_time": 0.0, "rss": 0,
+                                   "rss_growth": 0, "bytes_read": 0, "bytes_written": 0})
+        total["calls"] += 1
+        total["wall_time"] += record["wall_time"]
+        total["self_time"] += record["self_time"]
+        total["cpu_time"] += record["cpu_time"]
+        if record["rss"] is not None:
+            total["rss"] = max(total["rss"], record["rss"])
+            total["rss_growth"] = max(total["rss_growth"], record["rss"] - record["rss_start"])
+        process_peak_rss = max(process_peak_rss, record["process_peak_rss"])
+        total["bytes_read"] += record["bytes_read"] or 0
+        total["bytes_written"] += record["bytes_written"] or 0
+
+    # Print each stage followed by the stages nested in it, indented. Stages whose enclosing stage was not logged (e.g.
+    # because it started before since) are listed at the top level.
+    def print_stages(stage_paths, depth):
+        for stage_path in sorted(stage_paths, key=lambda stage_path: -totals[stage_path]["wall_time"]):
+            total = totals[stage_path]
+            print("%-30s %7d %11.2f %11.2f %11.2f %10.1f %16.1f %11.1f %13.1f" % (
+                "  "*depth + stage_path[-1], total["calls"], total["wall_time"], total["self_time"], total["cpu_time"],
+                total["rss"]/2**20, total["rss_growth"]/2**20, total["bytes_read"]/2**20, total["bytes_written"]/2**20))
+            print_stages([nested_path for nested_path in totals if nested_path[:-1] == stage_path], depth + 1)
+
+    print("Stage                            Calls    Wall (s)    Self (s)     CPU (s)   RSS (MB)  RSS growth (MB)   Read (MB)  Written (MB)")
+    print_stages([stage_path for stage_path in totals if stage_path[:-1] not in totals], 0)
+    print("Peak resident memory of the processes: %.1f MB" % (process_peak_rss/2**20))
+    return totals
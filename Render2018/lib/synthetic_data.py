@@ -0,0 +1,197 @@
+import argparse
+import numpy as np
+import h5py as h5
+# Generates synthetic data files with the same layout as the simulation output, so that the converters and render
+# pipeline can be tested and benchmarked without the real (multi-GB) data: .h5dns files like Michael/Pablo's droplet
+# simulations (read by h5dns_load_data.field4Dlow) and structured .cgns files like Abhiram's body flow simulations (read
+# by cgns_load_data.cgns_data). Fields are analytic, and are written in slabs so that files larger than memory can be
+# generated.
+
+def get_droplet_radius(tstep, tres, radius):
+    """
+    Radius of the synthetic droplet at a timestep. The droplet shrinks slowly as it evaporates.
+    :param tstep: Timestep
+    :param tres: Number of timesteps
+    :param radius: Initial droplet radius
+    :return: Droplet radius at the timestep
+    """
+    return radius*(1 - 0.2*tstep/max(tres, 1))
+
+def droplet_fields(x, y, z, tstep, tres, res, radius):
+    """
+    Evaluates the analytic fields of the synthetic droplet case at grid points. The droplet is an oscillating, shrinking
+    sphere at the center of the domain, surrounded by a cold vapor cloud, in a decaying Taylor-Green vortex flow.
+    :param x, y, z: Arrays of grid indices (i, j, k) at which to evaluate the fields
+    :param tstep: Timestep
+    :param tres: Number of timesteps
+    :param res: (x,y,z) resolution of the domain
+    :param radius: Initial droplet radius, in grid cells
+    :return: Dictionary of fields (VOF, Temperature, YV, XVelocity, YVelocity, ZVelocity)
+    """
+
+    # Distance from droplet center, with a P2 shape oscillation
+    phase = 2*np.pi*tstep/max(tres, 1)
+    dx = x - res[0]/2
+    dy = y - res[1]/2
+    dz = z - res[2]/2
+    r = np.sqrt(dx**2 + dy**2 + dz**2)
+    cos_theta = np.divide(dz, r, out=np.zeros_like(r), where=r > 0)
+    surface_radius = get_droplet_radius(tstep, tres, radius)*(1 + 0.1*np.sin(phase)*(1.5*cos_theta**2 - 0.5))
+
+    # VOF: 1 inside the droplet and 0 outside, with an interface about one cell thick
+    dist = r - surface_radius
+    vof = np.clip(0.5 - dist, 0, 1)
+
+    # Temperature (normalized by gas temperature): cold droplet that heats up over time, in a thermal boundary layer
+    outside = np.maximum(dist, 0)
+    temp_drop = 0.6 + 0.2*tstep/max(tres, 1)
+    temperature = 1 - (1 - temp_drop)*np.exp(-outside/(0.5*radius)) + 0.02*np.sin(2*np.pi*x/res[0])*(vof > 0)
+
+    # Vapor mass fraction: decays away from the droplet surface, zero inside the droplet
+    yv = 0.3*np.exp(-outside/(0.8*radius))*(1 - vof)
+
+    # Taylor-Green vortex over one period of the domain, decaying in time
+    decay = np.exp(-0.5*tstep/max(tres, 1))
+    kx = 2*np.pi*x/res[0]
+    ky = 2*np.pi*y/res[1]
+    kz = 2*np.pi*z/res[2]
+    x_velocity = decay*np.sin(kx)*np.cos(ky)*np.cos(kz)
+    y_velocity = -decay*np.cos(kx)*np.sin(ky)*np.cos(kz)
+    z_velocity = np.zeros_like(x_velocity)
+
+    return {"VOF": vof, "Temperature": temperature, "YV": yv,
+            "XVelocity": x_velocity, "YVelocity": y_velocity, "ZVelocity": z_velocity}
+
+def write_synthetic_h5dns(h5dns_path, res=(64,64,64), tres=4, dropd=0.4, tgas=1000.0, slab_size=16, compression=None):
+    """
+    Writes a synthetic .h5dns file with the FIELD_SEQUENCE_field3d/RUNTIME_PARAMETERS layout that field4Dlow expects.
+    Fields are stored [k,j,i] like the simulation output.
+    :param h5dns_path: Path to .h5dns file to write
+    :param res: (x,y,z) resolution of the domain
+    :param tres: Number of timesteps
+    :param dropd: Droplet diameter as a fraction of the domain length in y
+    :param tgas: Gas temperature stored in the runtime parameters
+    :param slab_size: Number of k-layers computed at once (bounds memory use for large files)
+    :param compression: (optional) HDF5 compression filter of the datasets, e.g. "gzip"
+    """
+
+    xres, yres, zres = res
+    radius = dropd*yres/2
+
+    h5dns_file = h5.File(h5dns_path, "w")
+
+    # Runtime parameters: resolution, domain size, time step, droplet diameter and gas temperature
+    runtime_params = h5dns_file.create_group("RUNTIME_PARAMETERS")
+    runtime_params.attrs["NNI"] = xres
+    runtime_params.attrs["NNJ"] = yres
+    runtime_params.attrs["NNK"] = zres
+    runtime_params.attrs["LX"] = xres/yres
+    runtime_params.attrs["LY"] = 1.0
+    runtime_params.attrs["LZ"] = zres/yres
+    runtime_params.attrs["DT"] = 1E-3
+    runtime_params.attrs["DROPD"] = dropd
+    runtime_params.attrs["VOF_TGAS"] = tgas
+
+    # Field sequence: one group of fields per timestep
+    field_sequence = h5dns_file.create_group("FIELD_SEQUENCE_field3d")
+    field_sequence.create_dataset("times", data=np.arange(tres)*1E-3)
+    for tstep in range(tres):
+        field_data = field_sequence.create_group("FIELD_DATA_%06d" % tstep)
+        datasets = {}
+        for k_start in range(0, zres, slab_size):
+            k_end = min(k_start + slab_size, zres)
+            z, y, x = np.mgrid[k_start:k_end, 0:yres, 0:xres].astype(float)
+            fields = droplet_fields(x, y, z, tstep, tres, res, radius)
+            for field_name, field in fields.items():
+                if field_name not in datasets:
+                    datasets[field_name] = field_data.create_dataset(field_name, shape=(zres, yres, xres), dtype="<f8",
+                                                                     compression=compression)
+                datasets[field_name][k_start:k_end, :, :] = field
+        print("Wrote synthetic h5dns timestep " + str(tstep))
+
+    h5dns_file.close()
+
+def body_flow_fields(x, y, z, r, r_body, tstep, tres):
+    """
+    Evaluates the analytic flow around the synthetic axisymmetric body: a free stream along x with a boundary layer at
+    the body surface and a solid-body swirl that varies in time.
+    :param x, y, z: Arrays of cartesian point positions
+    :param r: Distance of the points from the body axis
+    :param r_body: Radius of the body at the x-position of each point
+    :param tstep: Timestep
+    :param tres: Number of timesteps
+    :return: Dictionary of fields (VelocityX/Y/Z, VorticityX/Y/Z, Pressure)
+    """
+    thickness = 0.5
+    swirl = 0.1*np.cos(2*np.pi*tstep/max(tres, 1))
+    profile = np.tanh((r - r_body)/thickness)
+    dprofile_dr = (1 - profile**2)/thickness
+    r_safe = np.maximum(r, 1E-12)
+
+    # Vorticity is the curl of the velocity: swirl contributes along x, the boundary layer shear around the axis
+    return {"VelocityX": profile, "VelocityY": -swirl*z, "VelocityZ": swirl*y,
+            "VorticityX": 2*swirl*np.ones_like(x), "VorticityY": dprofile_dr*z/r_safe,
+            "VorticityZ": -dprofile_dr*y/r_safe, "Pressure": 0.5*(1 - profile**2)}
+
+def write_synthetic_cgns(cgns_path, res=(64,24,32), tres=2, body_length=30.0, outer_radius=11.0, compression=None):
+    """
+    Writes a synthetic structured .cgns file with the Base/Zone1 layout that cgns_data expects: a curvilinear grid
+    around a quarter of an axisymmetric body, with i along the body axis, j around it, and k away from the surface
+    (k = 0 is the body surface). Arrays are stored [k,j,i].
+    :param cgns_path: Path to .cgns file to write
+    :param res: (i,j,k) resolution of the grid
+    :param tres: Number of timesteps
+    :param body_length: Length of the body along x
+    :param outer_radius: Radius of the outer boundary of the grid
+    :param compression: (optional) HDF5 compression filter of the datasets, e.g. "gzip"
+    """
+
+    ires, jres, kres = res
+
+    # Grid: body radius varies along the axis, grid lines are clustered toward the surface
+    x_axis = np.linspace(0, body_length, ires)
+    r_body_axis = 0.5 + 2*np.sqrt(np.sin(np.pi*x_axis/body_length))
+    theta_axis = np.linspace(0, np.pi/2, jres)
+    s_axis = np.linspace(0, 1, kres)**2
+    s, theta, x = np.meshgrid(s_axis, theta_axis, x_axis, indexing="ij")
+    r_body = 0.5 + 2*np.sqrt(np.sin(np.pi*x/body_length))
+    r = r_body + (outer_radius - r_body)*s
+    y = r*np.cos(theta)
+    z = r*np.sin(theta)
+
+    cgns_file = h5.File(cgns_path, "w")
+    base = cgns_file.create_group("Base")
+    base.create_group("TimeIterValues").create_group("TimeValues").create_dataset(" data", data=np.arange(tres, dtype=float))
+
+    # Zone size: vertex, cell and boundary vertex counts
+    zone = base.create_group("Zone1")
+    zone.create_dataset(" data", data=np.array([[kres, jres, ires], [kres - 1, jres - 1, ires - 1], [0, 0, 0]]))
+
+    # Grid coordinates
+    grid_coordinates = zone.create_group("GridCoordinates")
+    for coordinate_name, coordinate in (("CoordinateX", x), ("CoordinateY", y), ("CoordinateZ", z)):
+        grid_coordinates.create_group(coordinate_name).create_dataset(" data", data=coordinate, compression=compression)
+
+    # Flow solution of each timestep
+    for tstep in range(tres):
+        flow_solution = zone.create_group("FlowSolution_%04d" % tstep)
+        for field_name, field in body_flow_fields(x, y, z, r, r_body, tstep, tres).items():
+            flow_solution.create_group(field_name).create_dataset(" data", data=field, compression=compression)
+        print("Wrote synthetic cgns timestep " + str(tstep))
+
+    cgns_file.close()
+
+if __name__ == "__main__":
+    # Parse input arguments
+    parser = argparse.ArgumentParser(description="Writes synthetic .h5dns or .cgns data files for testing and benchmarking. ")
+    parser.add_argument("output_path", type=str, help="Path to data file to write. ")
+    parser.add_argument("--type", type=str, default="h5dns", choices=["h5dns", "cgns"], help="Type of data file. ")
+    parser.add_argument("--res", type=str, default="64,64,64", help="Grid resolution, comma separated (x,y,z for h5dns, i,j,k for cgns). ")
+    parser.add_argument("--tres", type=int, default=4, help="Number of timesteps. ")
+    args = parser.parse_args()
+
+    res = tuple(int(val) for val in args.res.split(","))
+    if args.type == "h5dns":
+        write_synthetic_h5dns(args.output_path, res=res, tres=args.tres)
+    else:
+        write_synthetic_cgns(args.output_path, res=res, tres=args.tres)
@@ -0,0 +1,141 @@
+import numpy as np
+from h5dns_load_data import field4Dlow
+from field_store import write_derived_fields
+from stage_timer import timed
+# Vortex identification fields of the velocity field of an .h5dns file. All of them are functions of the velocity
+# gradient tensor J (J[a,b] = d(u_a)/d(x_b), in grid units), so the velocity is read and differentiated once per
+# timestep, and any subset of the fields is computed from the same gradients:
+#  Lambda2: second eigenvalue of S^2 + Omega^2, where S and Omega are the symmetric and antisymmetric parts of J
+#  Q: Q-criterion, (|Omega|^2 - |S|^2)/2
+#  VorticityMagnitude: magnitude of the vorticity vector
+#  SwirlingStrength: lambda_ci, imaginary part of the complex eigenvalues of J (0 where they are all real)
+# The domain is processed in tiles along the x-axis, with one layer of halo on each side so that the central differences
+# at tile edges are the same as on the whole domain, which bounds the memory taken by the gradients (nine fields) and
+# eigenvalue problems. Computed fields are stored in the derived field cache (see field_store), from which field4Dlow
+# reads them like any other field.
+
+# Fields that can be computed
+VORTEX_FIELDS = ("Lambda2", "Q", "VorticityMagnitude", "SwirlingStrength")
+
+# Velocity components the fields are computed from
+VELOCITY_FIELDS = ("XVelocity", "YVelocity", "ZVelocity")
+
+# Default number of x-layers per tile
+TILE_SIZE = 32
+
+def get_velocity_gradients(u, v, w):
+    """
+    :param u, v, w: 3D fields of the x, y and z velocity components
+    :return: Velocity gradient tensor J[a,b] = d(u_a)/d(x_b) at each point, shape (3,3) + field shape
+    """
+    return np.array([np.gradient(u), np.gradient(v), np.gradient(w)])
+
+def fields_from_gradients(gradients, field_names):
+    """
+    Computes vortex identification fields from the velocity gradient tensor.
+    :param gradients: Velocity gradient tensor (see get_velocity_gradients)
+    :param field_names: Names of the fields to compute, from VORTEX_FIELDS
+    :return: Dictionary of field name -> field
+    """
+    fields = {}
+
+    # Move the tensor indices last, so that each point holds a 3x3 matrix
+    J = np.moveaxis(gradients, (0, 1), (-2, -1))
+    Jt = np.swapaxes(J, -1, -2)
+    S = (J + Jt)/2
+    Omega = (J - Jt)/2
+
+    if "Lambda2" in field_names:
+        # S^2 + Omega^2 is symmetric, so its eigenvalues are real and returned in ascending order
+        fields["Lambda2"] = np.linalg.eigvalsh(np.matmul(S, S) + np.matmul(Omega, Omega))[...,1]
+
+    if "Q" in field_names:
+        fields["Q"] = (np.sum(Omega**2, axis=(-2, -1)) - np.sum(S**2, axis=(-2, -1)))/2
+
+    if "VorticityMagnitude" in field_names:
+        fields["VorticityMagnitude"] = np.sqrt((J[...,2,1] - J[...,1,2])**2 + (J[...,0,2] - J[...,2,0])**2 +
+                                               (J[...,1,0] - J[...,0,1])**2)
+
+    if "SwirlingStrength" in field_names:
+        # Characteristic polynomial of J: l^3 + a*l^2 + b*l + c, with l = t - a/3 giving the depressed cubic t^3 + p*t + q
+        a = -np.trace(J, axis1=-2, axis2=-1)
+        b = (a**2 - np.trace(np.matmul(J, J), axis1=-2, axis2=-1))/2
+        c = -np.linalg.det(J)
+        p = b - a**2/3
+        q = 2*a**3/27 - a*b/3 + c
+
+        # With a positive discriminant, there is one real root and a complex pair (Cardano's formula), whose imaginary
+        # part is sqrt(3)/2*|A - B|
+        discriminant = np.maximum((q/2)**2 + (p/3)**3, 0)
+        A = np.cbrt(-q/2 + np.sqrt(discriminant))
+        B = np.cbrt(-q/2 - np.sqrt(discriminant))
+        fields["SwirlingStrength"] = np.sqrt(3)/2*np.abs(A - B)
+
+    return fields
+
+@timed()
+def compute_vortex_fields(u, v, w, field_names, tile_size=TILE_SIZE):
+    """
+    Computes vortex identification fields from one pass over the velocity gradients.
+    :param u, v, w: 3D fields of the x, y and z velocity components
+    :param field_names: Names of the fields to compute, from VORTEX_FIELDS
+    :param tile_size: Number of x-layers processed at once, or 0 to process the whole domain at once
+    :return: Dictionary of field name -> 3D float32 field
+    """
+    for field_name in field_names:
+        if field_name not in VORTEX_FIELDS:
+            raise ValueError("Unknown vortex identification field: " + str(field_name))
+
+    num_layers = u.shape[0]
+    tile_size = tile_size or num_layers
+    fields = {field_name: np.empty(u.shape, dtype=np.float32) for field_name in field_names}
+    for start in range(0, num_layers, tile_size):
+        end = min(start + tile_size, num_layers)
+
+        # Differentiate the tile with one layer of its neighbors on each side, then drop the halo
+        halo_start = max(start - 1, 0)
+        halo_end = min(end + 1, num_layers)
+        gradients = get_velocity_gradients(*(np.asarray(component[halo_start:halo_end], dtype=float) for component in (u, v, w)))
+        gradients = gradients[:, :, start - halo_start:end - halo_start]
+
+        for field_name, tile_field in fields_from_gradients(gradients, field_names).items():
+            fields[field_name][start:end] = tile_field
+
+    return fields
+
+@timed()
+def get_vortex_fields(h5dns_path, tstep, field_names, tile_size=TILE_SIZE, data_field=None):
+    """
+    Gets vortex identification fields of a timestep. Fields that are in the .h5dns file or have already been computed
+    are read; the others are all computed from one read of the velocity field, and added to the derived field cache.
+    :param h5dns_path: Path to .h5dns file with velocity data
+    :param tstep: Timestep
+    :param field_names: Names of the fields, from VORTEX_FIELDS
+    :param tile_size: Number of x-layers processed at once (see compute_vortex_fields)
+    :param data_field: (optional) Data file, if already open (see convert_sweep.timestep_fields)
+    :return: Dictionary of field name -> 3D field, indexed [i,j,k]
+    """
+    opened = data_field is None
+    if opened:
+        data_field = field4Dlow(h5dns_path)
+
+    # Read the fields that are available
+    fields = {}
+    for field_name in field_names:
+        try:
+            fields[field_name] = data_field.obtain3Dtimestep(tstep, field_name)
+        except KeyError:
+            pass
+
+    # Compute the others in one pass, and cache them in the [k,j,i] order of the .h5dns file
+    missing = [field_name for field_name in field_names if field_name not in fields]
+    if len(missing) > 0:
+        velocity = [data_field.obtain3Dtimestep(tstep, component) for component in VELOCITY_FIELDS]
+        computed = compute_vortex_fields(*velocity, missing, tile_size=tile_size)
+        write_derived_fields(h5dns_path, tstep, {field_name: np.swapaxes(field, 0, 2) for field_name, field in computed.items()})
+        fields.update(computed)
+
+    if opened:
+        data_field.close()
+
+    return fields